@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from app.routers import data, analysis
+from app.services.executor import compute
 
 app = FastAPI(title="ESRI Comparison API")
 
@@ -19,6 +21,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses (grids and points) for clients that accept gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Mount routers with API prefixes so frontend calls match:
 #   /api/data/columns
 #   /api/analysis/summary
@@ -27,6 +32,15 @@ app.add_middleware(
 app.include_router(data.router, prefix="/api/data")
 app.include_router(analysis.router, prefix="/api/analysis")
 
+# Start the compute worker processes up front so the first analyses are warm
+@app.on_event("startup")
+def start_compute():
+    compute.start()
+
+@app.on_event("shutdown")
+def stop_compute():
+    compute.shutdown()
+
 # Health check
 @app.get("/api/health", tags=["meta"])
 def health():
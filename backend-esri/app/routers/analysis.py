@@ -1,48 +1,67 @@
 # backend-esri/app/routers/analysis.py
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from typing import Dict, Literal
-import base64
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Response
+from typing import Dict, List, Literal, Optional, Union
+import asyncio
+import json
+import re
 import numpy as np
 import pandas as pd
-from app.services.io_service import dataframe_from_upload, dataframe_from_upload_cols
+from app.services.io_service import dataframe_from_upload_cols, iter_upload_tables
 from pydantic import BaseModel
 from app.services.comparisons import COMPARISON_METHODS
-from pyproj import Transformer 
+from app.services.comparison_service import BINARY_MEDIA_TYPE, run_comparison, run_streaming_comparison
+from app.services.executor import compute, compute_slot
+from app.services.pyramid import EXACT_LEVEL_METHODS, MAX_LEVELS, level_cells
+from app.services.result_cache import derive_key, fingerprint_uploads, result_cache
+from app.services.dataset_store import DatasetNotFound, dataset_store
+from app.services.streaming import summarize_stream
+from app.services.plot_render import plot_data, render_pngs
+from app.services.point_lod import decimate, load_points, point_store
 
 # No prefix here — it will be mounted in main.py at prefix="/api/analysis"
 router = APIRouter(tags=["analysis"])
 
-def _clean_and_stats(df: pd.DataFrame, assay_col: str) -> Dict[str, float]:
-    if assay_col not in df.columns:
-        raise ValueError(f"Column '{assay_col}' not found")
-    s = pd.to_numeric(df[assay_col], errors="coerce").dropna()
-    s = s[s > 0]
-    if s.empty:
-        return {"count": 0, "mean": None, "median": None, "max": None, "std": None}
-    return {
-        "count": int(s.shape[0]),
-        "mean": float(s.mean()),
-        "median": float(s.median()),
-        "max": float(s.max()),
-        "std": float(s.std(ddof=1)),
-    }
-
-@router.post("/summary")
+POINTS_ID_RE = re.compile(r"^[0-9a-f]{40}$")
+
+def _load_frame(upload: Optional[UploadFile], run_token: Optional[str], role: str,
+                usecols: List[str], numeric: bool = False) -> pd.DataFrame:
+    """
+    Columns of a dataset, from the run_token store or else the uploaded file.
+    numeric=True parses `usecols` straight to float64 (non-numbers -> NaN).
+    """
+    if run_token:
+        return dataset_store.frame(run_token, role, usecols, numeric)
+    if upload is None:
+        raise ValueError(f"Provide the '{role}' file or a run_token")
+    return dataframe_from_upload_cols(upload, usecols, numeric)
+
+def _summarize(upload: Optional[UploadFile], run_token: Optional[str], role: str, assay: str) -> Dict:
+    """Streaming summary of one dataset's assay column (the only column parsed)."""
+    if run_token:
+        tables = dataset_store.tables(run_token, role, [assay])
+    elif upload is None:
+        raise ValueError(f"Provide the '{role}' file or a run_token")
+    else:
+        tables = iter_upload_tables(upload, [assay])
+    return summarize_stream(tables, assay)
+
+@router.post("/summary", dependencies=[Depends(compute_slot)])
 async def summary(
-    original: UploadFile = File(..., description="Original ESRI .csv or .zip"),
-    dl: UploadFile       = File(..., description="DL ESRI .csv or .zip"),
+    original: Optional[UploadFile] = File(None, description="Original ESRI .csv or .zip"),
+    dl: Optional[UploadFile]       = File(None, description="DL ESRI .csv or .zip"),
     original_assay: str  = Form(...),
     dl_assay: str        = Form(...),
+    run_token: Optional[str] = Form(None, description="Token from /api/data/columns, instead of files"),
 ):
     try:
-        df_o = dataframe_from_upload(original)
-        df_d = dataframe_from_upload(dl)
-        stats_o = _clean_and_stats(df_o, original_assay)
-        stats_d = _clean_and_stats(df_d, dl_assay)
+        # Both files are read concurrently in the I/O pool (Arrow parsing releases the GIL)
+        stats_o, stats_d = await asyncio.gather(
+            compute.run_io(_summarize, original, run_token, "original", original_assay),
+            compute.run_io(_summarize, dl, run_token, "dl", dl_assay),
+        )
         return {"original": stats_o, "dl": stats_d}
+    except DatasetNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -51,83 +70,198 @@ class PlotsResponse(BaseModel):
     dl_png: str
     qq_png: str
 
+class Histogram(BaseModel):
+    edges: List[float]
+    counts: List[int]
+
+class QQPairs(BaseModel):
+    q: List[float]
+    original: List[float]
+    dl: List[float]
+
+class PlotDataResponse(BaseModel):
+    original: Histogram
+    dl: Histogram
+    qq: QQPairs
+
 def _clean_series(df: pd.DataFrame, assay_col: str) -> pd.Series:
     if assay_col not in df.columns:
         raise ValueError(f"Column '{assay_col}' not found")
     s = pd.to_numeric(df[assay_col], errors="coerce").dropna()
     return s[s > 0]
 
-def _fig_to_b64(fig) -> str:
-    import io
-    buf = io.BytesIO()
-    fig.tight_layout()
-    fig.savefig(buf, format="png", dpi=120)
-    plt.close(fig)
-    buf.seek(0)
-    return base64.b64encode(buf.read()).decode("ascii")
+def _assay_values(upload: Optional[UploadFile], run_token: Optional[str], role: str, assay: str) -> np.ndarray:
+    return _clean_series(_load_frame(upload, run_token, role, [assay], numeric=True), assay).to_numpy()
 
-@router.post("/plots", response_model=PlotsResponse)
+@router.post("/plots", response_model=Union[PlotsResponse, PlotDataResponse], dependencies=[Depends(compute_slot)])
 async def plots(
-    original: UploadFile = File(..., description="Original ESRI .csv or .zip"),
-    dl: UploadFile       = File(..., description="DL ESRI .csv or .zip"),
+    original: Optional[UploadFile] = File(None, description="Original ESRI .csv or .zip"),
+    dl: Optional[UploadFile]       = File(None, description="DL ESRI .csv or .zip"),
     original_assay: str  = Form(...),
     dl_assay: str        = Form(...),
+    run_token: Optional[str] = Form(None, description="Token from /api/data/columns, instead of files"),
+    format: Literal["png", "data"] = Form("png", description="'data' returns histogram counts and QQ pairs instead of images"),
+    bins: int            = Form(50, description="Log-spaced histogram bin edges"),
 ):
     try:
-        df_o = dataframe_from_upload_cols(original, [original_assay])
-        df_d = dataframe_from_upload_cols(dl, [dl_assay])
-
-        s_o = _clean_series(df_o, original_assay)
-        s_d = _clean_series(df_d, dl_assay)
-
-        # Histogram Original
-        fig1 = plt.figure(figsize=(7,4))
-        ax1 = fig1.add_subplot(111)
-        bins_o = np.logspace(np.log10(s_o.min()), np.log10(s_o.max()), 50)
-        ax1.hist(s_o, bins=bins_o, color="#7C3AED", edgecolor="black")
-        ax1.set_xscale("log")
-        original_png = _fig_to_b64(fig1)
-
-        # Histogram DL
-        fig2 = plt.figure(figsize=(7,4))
-        ax2 = fig2.add_subplot(111)
-        bins_d = np.logspace(np.log10(s_d.min()), np.log10(s_d.max()), 50)
-        ax2.hist(s_d, bins=bins_d, color="#7C3AED", edgecolor="black")
-        ax2.set_xscale("log")
-        dl_png = _fig_to_b64(fig2)
-
-        # QQ plot
-        q = np.linspace(0.01, 0.99, 50)
-        qo = np.quantile(s_o, q)
-        qd = np.quantile(s_d, q)
-        fig3 = plt.figure(figsize=(6,6))
-        ax3 = fig3.add_subplot(111)
-        ax3.scatter(qo, qd, s=20, color="#7C3AED")
-        line = np.linspace(min(qo.min(), qd.min()), max(qo.max(), qd.max()), 100)
-        ax3.plot(line, line, "--", linewidth=1)
-        ax3.set_xscale("log"); ax3.set_yscale("log")
-        qq_png = _fig_to_b64(fig3)
-
-        return {"original_png": original_png, "dl_png": dl_png, "qq_png": qq_png}
+        if not run_token and (original is None or dl is None):
+            raise ValueError("Provide both files or a run_token")
+
+        # Rendered PNGs are cached per dataset, assay columns and bin settings
+        cache_key = None
+        if format == "png":
+            cache_key = await compute.run_io(fingerprint_uploads, [] if run_token else [original, dl], {
+                "run_token": run_token, "assay": [original_assay, dl_assay], "bins": bins,
+            })
+            cached = result_cache.get(cache_key, kind="plots")
+            if cached is not None:
+                return Response(content=cached, media_type="application/json", headers={"X-Cache": "hit"})
+
+        s_o, s_d = await asyncio.gather(
+            compute.run_io(_assay_values, original, run_token, "original", original_assay),
+            compute.run_io(_assay_values, dl, run_token, "dl", dl_assay),
+        )
+        data = plot_data(s_o, s_d, bins)
+        if format == "data":
+            return data
+
+        body = json.dumps(await compute.run_cpu(render_pngs, data)).encode()
+        result_cache.put(cache_key, body, kind="plots")
+        return Response(content=body, media_type="application/json", headers={"X-Cache": "miss"})
+    except DatasetNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/comparison")
+@router.post("/comparison", dependencies=[Depends(compute_slot)])
 async def comparison(
-    original: UploadFile = File(...),
-    dl: UploadFile       = File(...),
+    original: Optional[UploadFile] = File(None),
+    dl: Optional[UploadFile]       = File(None),
     original_northing: str = Form(...),
     original_easting: str  = Form(...),
     original_assay: str    = Form(...),
     dl_northing: str       = Form(...),
     dl_easting: str        = Form(...),
     dl_assay: str          = Form(...),
-    method: Literal["mean","median","max"] = Form(...),
+    method: Literal["mean","median","max","p10","p90","iqr","ks"] = Form(...),
     grid_size: float       = Form(...),
     treat_as: Literal["auto","meters","degrees"] = Form("auto"),
+    methods: str           = Form("", description="Extra comma-separated methods computed in the same pass"),
+    include_points: bool   = Form(True),
+    run_token: Optional[str] = Form(None, description="Token from /api/data/columns, instead of files"),
+    streaming: bool        = Form(False, description="Bounded-memory chunked mode (no points; approximate quantiles)"),
+    point_budget: int      = Form(0, description="Max points returned per dataset (0 = all); > 0 also keeps them for /points zoomed LODs"),
+    pyramid_levels: int    = Form(0, description="Also cache this many coarser grids (grid_size x 2, x 4, ...) derived in the same pass"),
+    allow_derived: bool    = Form(False, description="Accept a cached pyramid level (approximate median/p10/p90/iqr)"),
+    accept: Optional[str]  = Header(None),
 ):
     try:
-        # (rest unchanged – your grid + comparison logic stays the same)
-        ...
+        # Content negotiation: compact float32 container when the client asks for it
+        fmt = "binary" if accept and BINARY_MEDIA_TYPE in accept else "json"
+        media_type = BINARY_MEDIA_TYPE if fmt == "binary" else "application/json"
+        extra = [m.strip() for m in methods.split(",") if m.strip()]
+        unknown = [m for m in extra if m not in COMPARISON_METHODS]
+        if unknown:
+            raise ValueError(f"Unknown method(s): {', '.join(unknown)}")
+        if not run_token and (original is None or dl is None):
+            raise ValueError("Provide both files or a run_token")
+        if not 0 <= pyramid_levels <= MAX_LEVELS:
+            raise ValueError(f"pyramid_levels must be between 0 and {MAX_LEVELS}")
+
+        # Identical uploads (or dataset token) + parameters -> answer from the result cache.
+        # Pyramid levels are cached under the key of the same request at their grid size
+        # marked "derived", so approximate levels never answer an exact request unasked.
+        data_key = await compute.run_io(fingerprint_uploads, [] if run_token else [original, dl],
+                                        {"run_token": run_token})
+        params = {
+            "original": [original_easting, original_northing, original_assay],
+            "dl": [dl_easting, dl_northing, dl_assay],
+            "method": method, "methods": extra, "grid_size": grid_size,
+            "treat_as": treat_as, "include_points": include_points, "streaming": streaming,
+            "format": fmt, "point_budget": point_budget,
+        }
+        cache_key = derive_key(data_key, params)
+        level_keys = [derive_key(data_key, {**params, "grid_size": cell, "derived": True})
+                      for cell in level_cells(grid_size, pyramid_levels)]
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return Response(content=cached, media_type=media_type, headers={"X-Cache": "hit", "Vary": "Accept"})
+        if allow_derived or EXACT_LEVEL_METHODS.issuperset([method, *extra]):
+            cached = result_cache.get(derive_key(data_key, {**params, "derived": True}))
+            if cached is not None:
+                return Response(content=cached, media_type=media_type,
+                                headers={"X-Cache": "hit-derived", "Vary": "Accept"})
+
+        cols_o = [original_easting, original_northing, original_assay]
+        cols_d = [dl_easting, dl_northing, dl_assay]
+        if streaming:
+            # Chunks are folded into per-cell accumulators; memory follows the grid size
+            if run_token:
+                tables_o = dataset_store.tables(run_token, "original", cols_o)
+                tables_d = dataset_store.tables(run_token, "dl", cols_d)
+            else:
+                tables_o = iter_upload_tables(original, cols_o)
+                tables_d = iter_upload_tables(dl, cols_d)
+            body, levels = await compute.run_io(run_streaming_comparison, tables_o, tables_d, cols_o, cols_d,
+                                                method, extra, grid_size, treat_as, fmt, level_keys)
+        else:
+            # Both files are parsed concurrently, then gridded in a worker process
+            df_o, df_d = await asyncio.gather(
+                compute.run_io(_load_frame, original, run_token, "original", cols_o, True),
+                compute.run_io(_load_frame, dl, run_token, "dl", cols_d, True),
+            )
+            body, levels = await compute.run_cpu(run_comparison, df_o, df_d, cols_o, cols_d,
+                                                 method, extra, grid_size, treat_as, include_points, fmt,
+                                                 point_budget, cache_key, level_keys)
+
+        # Only this process writes the response cache; workers return the level bodies
+        result_cache.put(cache_key, body)
+        for key, level_body in levels:
+            result_cache.put(key, level_body)
+        return Response(content=body, media_type=media_type, headers={"X-Cache": "miss", "Vary": "Accept"})
+    except DatasetNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/points", dependencies=[Depends(compute_slot)])
+async def points(
+    points_id: str,
+    budget: int = 20000,
+    bbox: Optional[str] = None,
+):
+    """
+    Points of an earlier comparison (its `points_id`), decimated to `budget`
+    per dataset inside the viewport `bbox` = "xmin,ymin,xmax,ymax" (metres).
+    """
+    try:
+        if not POINTS_ID_RE.match(points_id):
+            raise ValueError("Invalid points_id")
+        box = None
+        if bbox:
+            box = [float(v) for v in bbox.split(",")]
+            if len(box) != 4 or box[0] > box[2] or box[1] > box[3]:
+                raise ValueError("bbox must be 'xmin,ymin,xmax,ymax'")
+        stored = await compute.run_io(load_points, points_id)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Points not stored or expired; re-run the comparison with point_budget > 0")
+        lod = {role: await compute.run_io(decimate, pts, budget, box) for role, pts in stored.items()}
+        return {
+            "points_id": points_id,
+            "bbox": box,
+            "budget": budget,
+            "points_total": {role: len(pts) for role, pts in stored.items()},
+            "original_points": lod["original"].tolist(),
+            "dl_points": lod["dl"].tolist(),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return {**result_cache.stats(), "points": point_store.stats(), "datasets": dataset_store.stats(),
+            "compute": compute.stats()}
@@ -1,23 +1,32 @@
 # backend-esri/app/routers/data.py
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import asyncio
+
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from app.models.schemas import ColumnsResponse
 from app.services.io_service import extract_columns, make_run_token
+from app.services.dataset_store import dataset_store
+from app.services.executor import compute, compute_slot
 
 # No prefix here — main.py will mount this router at prefix="/api/data"
 router = APIRouter(tags=["data"])
 
-@router.post("/columns", response_model=ColumnsResponse)
+@router.post("/columns", response_model=ColumnsResponse, dependencies=[Depends(compute_slot)])
 async def get_columns(
     original: UploadFile = File(..., description="Original ESRI .csv or .zip"),
     dl: UploadFile       = File(..., description="DL ESRI .csv or .zip"),
 ):
     try:
-        original_cols = extract_columns(original)
-        dl_cols = extract_columns(dl)
+        original_cols, dl_cols = await asyncio.gather(
+            compute.run_io(extract_columns, original),
+            compute.run_io(extract_columns, dl),
+        )
+        # Parse both files in the background so later calls can pass the token
+        run_token = make_run_token()
+        await compute.run_io(dataset_store.register, run_token, {"original": original, "dl": dl})
         return ColumnsResponse(
             original_columns=original_cols,
             dl_columns=dl_cols,
-            run_token=make_run_token(),
+            run_token=run_token,
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,251 @@
+# app/services/comparison_service.py
+"""
+CPU stages of /api/analysis/comparison, kept free of request objects so
+they can run in a compute worker process (see executor.py):
+
+    points -> projection -> grid -> comparison methods -> JSON / binary body
+"""
+
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.comparisons import compare_many
+from app.services.grid import GridSpec, assign_grid_index, make_grid_spec
+from app.services.point_lod import decimate, save_points
+from app.services.projection import project_xy, transform_xy
+from app.services.pyramid import check_methods, derive_levels, frame_accumulators, level_cells
+from app.services.streaming import accumulator_results, stream_accumulate
+
+# Media type of the compact binary response (see encode_binary)
+BINARY_MEDIA_TYPE = "application/x-grid-f32"
+
+# Projected CRS used when coordinates arrive as lon/lat degrees
+PROJECTED_CRS = "EPSG:3577"  # GDA94 / Australian Albers
+
+
+def looks_like_degrees(x: np.ndarray, y: np.ndarray) -> bool:
+    return bool(len(x)) and np.abs(x).max() <= 180 and np.abs(y).max() <= 90
+
+
+def prepare_points(df: pd.DataFrame, easting: str, northing: str, assay: str) -> pd.DataFrame:
+    """Numeric x / y / Te_ppm frame (comparison methods read 'Te_ppm')."""
+    for col in (easting, northing, assay):
+        if col not in df.columns:
+            raise ValueError(f"Column '{col}' not found")
+    out = pd.DataFrame({
+        "x": pd.to_numeric(df[easting], errors="coerce"),
+        "y": pd.to_numeric(df[northing], errors="coerce"),
+        "Te_ppm": pd.to_numeric(df[assay], errors="coerce"),
+    }).dropna()
+    return out[out["Te_ppm"] > 0].reset_index(drop=True)
+
+
+def project_if_degrees(df: pd.DataFrame, treat_as: str, memo: bool = True) -> pd.DataFrame:
+    """
+    Project lon/lat to PROJECTED_CRS when the coordinates are degrees.
+    memo=True reuses coordinates projected by an earlier request (see projection.py).
+    """
+    x, y = df["x"].to_numpy(), df["y"].to_numpy()
+    degrees = treat_as == "degrees" or (treat_as == "auto" and looks_like_degrees(x, y))
+    if not degrees:
+        return df
+    project = project_xy if memo else transform_xy
+    px, py = project(x, y, "EPSG:4326", PROJECTED_CRS)
+    return df.assign(x=px, y=py)
+
+
+def point_chunks(tables, easting: str, northing: str, assay: str, treat_as: str):
+    """
+    Prepared, projected point frames from a stream of Arrow tables. The
+    degrees/meters decision of treat_as="auto" is taken on the first
+    non-empty chunk and kept for the rest of the stream.
+    """
+    for table in tables:
+        df = prepare_points(table.to_pandas(), easting, northing, assay)
+        if not len(df):
+            continue
+        if treat_as == "auto":
+            treat_as = "degrees" if looks_like_degrees(df["x"].to_numpy(), df["y"].to_numpy()) else "meters"
+        yield project_if_degrees(df, treat_as, memo=False)
+
+
+def grid_to_json(arr: np.ndarray) -> list:
+    """2D array -> nested lists with None for empty cells."""
+    return [[v if np.isfinite(v) else None for v in row] for row in arr.tolist()]
+
+
+def _payload(spec: GridSpec, results: Dict, method: str, extra: Sequence[str],
+             points: Optional[Dict[str, np.ndarray]], extra_meta: Optional[Dict]):
+    """(scalar metadata, named arrays) of a comparison response."""
+    arr_orig, arr_dl, arr_cmp = results[method]
+    x, y = spec.centers()
+    meta = {
+        "nx": spec.nx, "ny": spec.ny,
+        "xmin": spec.xmin, "ymin": spec.ymin,
+        "cell": spec.cell, "cell_x": spec.cell, "cell_y": spec.cell,
+        "coord_units": "meters",
+        "method": method,
+        **(extra_meta or {}),
+    }
+    arrays = {"orig": arr_orig, "dl": arr_dl, "cmp": arr_cmp, "x": x, "y": y}
+    if extra:
+        for m, (a, b, c) in results.items():
+            arrays[f"results.{m}.orig"] = a
+            arrays[f"results.{m}.dl"] = b
+            arrays[f"results.{m}.cmp"] = c
+    if points is not None:
+        arrays["original_points"] = points["original"]
+        arrays["dl_points"] = points["dl"]
+    return meta, arrays
+
+
+def _encode_json(meta: Dict, arrays: Dict[str, np.ndarray]) -> bytes:
+    out = dict(meta)
+    for key in ("orig", "dl", "cmp"):
+        out[key] = grid_to_json(arrays[key])
+    out["x"] = arrays["x"].tolist()
+    out["y"] = arrays["y"].tolist()
+    results = {}
+    for name, arr in arrays.items():
+        if name.startswith("results."):
+            _, m, key = name.split(".")
+            results.setdefault(m, {})[key] = grid_to_json(arr)
+    if results:
+        out["results"] = results
+    if "original_points" in arrays:
+        out["original_points"] = arrays["original_points"].tolist()
+        out["dl_points"] = arrays["dl_points"].tolist()
+    return json.dumps(out).encode()
+
+
+def encode_binary(meta: Dict, arrays: Dict[str, np.ndarray]) -> bytes:
+    """
+    BINARY_MEDIA_TYPE container: b"GRF1", uint32 LE header length, a JSON
+    header, then one block per array at the 8-byte aligned offsets the
+    header lists. Values are float32 little-endian. Arrays with gaps
+    ("mask": "bitmap") store a validity bitmap (numpy.packbits, little
+    bit order, 1 = value present) followed by only the present values, so
+    empty cells cost one bit.
+    """
+    blocks, entries, offset = [], [], 0
+    for name, arr in arrays.items():
+        arr = np.asarray(arr, dtype="<f4")
+        flat = arr.ravel()
+        valid = np.isfinite(flat)
+        entry = {"name": name, "shape": list(arr.shape), "dtype": "<f4", "offset": offset}
+        if valid.all():
+            block = flat.tobytes()
+            entry["mask"] = None
+        else:
+            bitmap = np.packbits(valid, bitorder="little").tobytes()
+            block = bitmap + b"\0" * (-len(bitmap) % 4) + flat[valid].tobytes()
+            entry.update(mask="bitmap", mask_bytes=len(bitmap), count=int(valid.sum()))
+        entry["nbytes"] = len(block)
+        block += b"\0" * (-len(block) % 8)
+        blocks.append(block)
+        entries.append(entry)
+        offset += len(block)
+
+    header = json.dumps({"meta": meta, "arrays": entries}).encode()
+    header += b" " * (-(len(header) + 8) % 8)   # payload starts 8-byte aligned
+    return b"GRF1" + len(header).to_bytes(4, "little") + header + b"".join(blocks)
+
+
+ENCODERS = {"json": _encode_json, "binary": encode_binary}
+
+
+def comparison_body(spec: GridSpec, results: Dict, method: str, extra: Sequence[str],
+                    points: Optional[Dict[str, np.ndarray]] = None, extra_meta: Optional[Dict] = None,
+                    fmt: str = "json") -> bytes:
+    """
+    Response body in `fmt` ("json" or "binary"). `points` maps role ->
+    (n, 3) x / y / Te_ppm rows; `extra_meta` adds fields (points LOD,
+    pyramid level) to the metadata.
+    """
+    return ENCODERS[fmt](*_payload(spec, results, method, extra, points, extra_meta))
+
+
+def level_bodies(spec: GridSpec, accs: Dict, method: str, extra: Sequence[str], level_keys: Sequence[str],
+                 points: Optional[Dict[str, np.ndarray]] = None, extra_meta: Optional[Dict] = None,
+                 fmt: str = "json") -> List[Tuple[str, bytes]]:
+    """
+    Derive len(level_keys) coarser power-of-two grids from the base
+    accumulators `accs` -> [(key, body)], for the API process to put in
+    the result cache so later requests at those grid sizes hit it.
+    """
+    methods = list(dict.fromkeys([method, *extra]))
+    return [
+        (level_keys[k - 1], comparison_body(level_spec, results, method, extra, points,
+                                            {**(extra_meta or {}), "pyramid": {"level": k, "base_cell": spec.cell}},
+                                            fmt))
+        for k, (level_spec, results) in enumerate(derive_levels(spec, accs, methods, len(level_keys)), start=1)
+    ]
+
+
+def run_comparison(df_o: pd.DataFrame, df_d: pd.DataFrame, cols_o: List[str], cols_d: List[str],
+                   method: str, extra: Sequence[str], grid_size: float, treat_as: str,
+                   include_points: bool, fmt: str = "json", point_budget: int = 0,
+                   points_id: Optional[str] = None, level_keys: Sequence[str] = ()
+                   ) -> Tuple[bytes, List[Tuple[str, bytes]]]:
+    """
+    In-memory comparison of two loaded frames -> (response body, level
+    bodies; see level_bodies) (runs in a worker process). With points and a `point_budget` > 0, they are
+    decimated to that budget per dataset and stored under `points_id` for
+    later LOD requests. Each of `level_keys` gets the body of a derived
+    pyramid level (grid_size * 2, * 4, ...).
+    """
+    if level_keys:
+        check_methods([method, *extra])
+    pts_o = project_if_degrees(prepare_points(df_o, *cols_o), treat_as)
+    pts_d = project_if_degrees(prepare_points(df_d, *cols_d), treat_as)
+
+    spec = make_grid_spec([pts_o, pts_d], grid_size)
+    idx_o = assign_grid_index(pts_o, spec)
+    idx_d = assign_grid_index(pts_d, spec)
+    methods = list(dict.fromkeys([method, *extra]))
+    results = compare_many(idx_d, idx_o, spec.nx, spec.ny, methods)
+    accs = frame_accumulators(idx_o, idx_d, spec, methods) if level_keys else None
+    level_meta = {"pyramid_cells": level_cells(spec.cell, len(level_keys))} if level_keys else {}
+    if not include_points:
+        levels = level_bodies(spec, accs, method, extra, level_keys, fmt=fmt) if level_keys else []
+        return comparison_body(spec, results, method, extra, extra_meta=level_meta, fmt=fmt), levels
+
+    points = {
+        "original": pts_o[["x", "y", "Te_ppm"]].to_numpy(dtype=np.float64),
+        "dl": pts_d[["x", "y", "Te_ppm"]].to_numpy(dtype=np.float64),
+    }
+    points_meta = {"points_total": {role: len(p) for role, p in points.items()}}
+    if point_budget > 0:
+        # Only LOD clients come back for finer detail, so only they get stored points
+        if points_id:
+            save_points(points_id, points)
+            points_meta["points_id"] = points_id
+        points = {role: decimate(p, point_budget, spec.bounds()) for role, p in points.items()}
+    levels = level_bodies(spec, accs, method, extra, level_keys, points, points_meta, fmt) if level_keys else []
+    return comparison_body(spec, results, method, extra, points, {**points_meta, **level_meta}, fmt), levels
+
+
+def run_streaming_comparison(tables_o, tables_d, cols_o: List[str], cols_d: List[str],
+                             method: str, extra: Sequence[str], grid_size: float, treat_as: str,
+                             fmt: str = "json", level_keys: Sequence[str] = ()
+                             ) -> Tuple[bytes, List[Tuple[str, bytes]]]:
+    """
+    Bounded-memory comparison over two streams of Arrow tables -> (response
+    body, level bodies) (no points). `level_keys` as for run_comparison.
+    """
+    methods = list(dict.fromkeys([method, *extra]))
+    spec, accs = stream_accumulate(
+        point_chunks(tables_o, *cols_o, treat_as),
+        point_chunks(tables_d, *cols_d, treat_as),
+        grid_size, methods,
+    )
+    results = accumulator_results(spec, accs, methods)
+    if not level_keys:
+        return comparison_body(spec, results, method, extra, fmt=fmt), []
+    levels = level_bodies(spec, accs, method, extra, level_keys, fmt=fmt)
+    body = comparison_body(spec, results, method, extra,
+                           extra_meta={"pyramid_cells": level_cells(spec.cell, len(level_keys))}, fmt=fmt)
+    return body, levels
@@ -14,63 +14,39 @@ Outputs:
 - arr_orig: 2D numpy array with summary statistic for original
 - arr_dl:   2D numpy array with summary statistic for DL
 - arr_cmp:  2D numpy array with (DL – Original)
+
+Available methods: mean, median, max, p10, p90, iqr, ks
 """
 
 import numpy as np
-import pandas as pd
-
-
-def _fill_stat_array(gdf: pd.DataFrame, nx: int, ny: int, stat: str) -> np.ndarray:
-    """Compute grid-wise stats and return a filled 2D array."""
-    arr = np.full((ny, nx), np.nan, dtype=float)
-    if gdf is None or len(gdf) == 0:
-        return arr
 
-    # linearize grid cell id
-    gid = gdf["grid_iy"].values * nx + gdf["grid_ix"].values
-    stat_series = (
-        gdf.assign(grid_id=gid)
-           .groupby("grid_id")["Te_ppm"]
-           .agg(stat)  # 'mean' | 'median' | 'max'
-    )
-    if stat_series.empty:
-        return arr
+from app.services.aggregate import aggregate_pair
+from app.services.order_stats import (
+    QUANTILE_METHODS, _safe_diff, iqr_diff, ks_from_segments, ks_test, p10_diff,
+    p90_diff, quantile_diff_from_segments, segments_from_gdf,
+)
 
-    iy = (stat_series.index.values // nx).astype(int)
-    ix = (stat_series.index.values % nx).astype(int)
-    arr[iy, ix] = stat_series.values.astype(float)
-    return arr
 
-
-def _safe_diff(a, b):
-    mask = np.isfinite(a) & np.isfinite(b)
-    out = np.full_like(a, np.nan, dtype=float)
-    out[mask] = b[mask] - a[mask]
-    return out
+def _diff_from_stats(stats, stat: str):
+    """(arr_orig, arr_dl, DL – Original) for one statistic of a fused pass."""
+    arr_orig = stats["orig"][stat]
+    arr_dl   = stats["dl"][stat]
+    return arr_orig, arr_dl, _safe_diff(arr_orig, arr_dl)
 
 
 def mean_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
     """Grid-wise mean (DL – Original)."""
-    arr_orig = _fill_stat_array(orig_gdf_idx, nx, ny, "mean")
-    arr_dl   = _fill_stat_array(dl_gdf_idx,   nx, ny, "mean")
-    arr_cmp  = _safe_diff(arr_orig, arr_dl)
-    return arr_orig, arr_dl, arr_cmp
+    return _diff_from_stats(aggregate_pair(dl_gdf_idx, orig_gdf_idx, nx, ny), "mean")
 
 
 def median_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
     """Grid-wise median (DL – Original)."""
-    arr_orig = _fill_stat_array(orig_gdf_idx, nx, ny, "median")
-    arr_dl   = _fill_stat_array(dl_gdf_idx,   nx, ny, "median")
-    arr_cmp  = _safe_diff(arr_orig, arr_dl)
-    return arr_orig, arr_dl, arr_cmp
+    return _diff_from_stats(aggregate_pair(dl_gdf_idx, orig_gdf_idx, nx, ny), "median")
 
 
 def max_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
     """Grid-wise maximum (DL – Original)."""
-    arr_orig = _fill_stat_array(orig_gdf_idx, nx, ny, "max")
-    arr_dl   = _fill_stat_array(dl_gdf_idx,   nx, ny, "max")
-    arr_cmp  = _safe_diff(arr_orig, arr_dl)
-    return arr_orig, arr_dl, arr_cmp
+    return _diff_from_stats(aggregate_pair(dl_gdf_idx, orig_gdf_idx, nx, ny), "max")
 
 
 # Registry
@@ -78,4 +54,36 @@ COMPARISON_METHODS = {
     "mean": mean_diff,
     "median": median_diff,
     "max": max_diff,
+    "p10": p10_diff,
+    "p90": p90_diff,
+    "iqr": iqr_diff,
+    "ks": ks_test,
 }
+
+# Methods that are a single statistic of the fused aggregation pass
+AGGREGATE_METHODS = {"mean", "median", "max"}
+
+
+def compare_many(dl_gdf_idx, orig_gdf_idx, nx, ny, methods):
+    """
+    Run several methods at once -> {method: (arr_orig, arr_dl, arr_cmp)}.
+    Every registered method shares one (cell, value) sort per dataset.
+    """
+    segs = {
+        "orig": segments_from_gdf(orig_gdf_idx, nx, ny),
+        "dl": segments_from_gdf(dl_gdf_idx, nx, ny),
+    }
+    stats = None
+    results = {}
+    for method in methods:
+        if method in AGGREGATE_METHODS:
+            if stats is None:
+                stats = aggregate_pair(dl_gdf_idx, orig_gdf_idx, nx, ny, segments=segs)
+            results[method] = _diff_from_stats(stats, method)
+        elif method in QUANTILE_METHODS:
+            results[method] = quantile_diff_from_segments(segs["orig"], segs["dl"], nx, ny, method)
+        elif method == "ks":
+            results[method] = ks_from_segments(segs["orig"], segs["dl"], nx, ny)
+        else:
+            results[method] = COMPARISON_METHODS[method](dl_gdf_idx, orig_gdf_idx, nx, ny)
+    return results
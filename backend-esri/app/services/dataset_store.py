@@ -0,0 +1,237 @@
+# app/services/dataset_store.py
+"""
+Upload-once dataset handles keyed by run_token.
+
+/columns hands both uploads to the store: the raw files are copied to disk
+and parsed in the background into Arrow IPC files
+`<root>/<run_token>/<role>.arrow` (role = "original" | "dl"). Later
+/summary, /plots and /comparison calls that pass the run_token read only
+the columns they need from a memory-mapped file instead of re-uploading
+and re-parsing the CSV.
+
+Datasets expire after DATASET_TTL_MIN minutes without use and the store
+evicts least-recently-used datasets (by folder mtime) beyond
+DATASET_STORE_MAX_MB. Because everything lives on disk, a token registered
+by one server process is usable from the others.
+
+Configuration (environment):
+- DATASET_STORE_DIR:    store folder (default: <tmp>/esri-datasets)
+- DATASET_STORE_MAX_MB: total size of stored datasets (default: 2048)
+- DATASET_TTL_MIN:      idle minutes before a dataset expires (default: 60)
+"""
+
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+from fastapi import UploadFile
+
+from app.services.io_service import coerce_numeric, table_from_path
+
+logger = logging.getLogger("dataset_store")
+
+ROLES = ("original", "dl")
+TOKEN_RE = re.compile(r"^[0-9a-f]{32}$")
+# How long a request waits for a dataset another process is still parsing
+_POLL_SECONDS = 0.05
+_WAIT_SECONDS = 600
+
+
+class DatasetNotFound(KeyError):
+    """Unknown or expired run_token."""
+
+    def __str__(self) -> str:
+        return f"Unknown or expired run_token: {self.args[0]}"
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.glob("*") if f.is_file())
+
+
+def _write_arrow(table: pa.Table, path: Path) -> None:
+    """Uncompressed Arrow IPC file (so reads can memory-map it), written atomically."""
+    tmp = path.with_name(f".{path.name}.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def _chain(source: Future, target: Future) -> None:
+    """Complete `target` with the outcome of the finished `source`."""
+    error = source.exception()
+    if error is None:
+        target.set_result(source.result())
+    else:
+        target.set_exception(error)
+
+
+class DatasetStore:
+    def __init__(self, root: Path, max_bytes: int, ttl_seconds: float, workers: int = 2):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._pending: Dict[str, Dict[str, Future]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dataset-parse")
+
+    def _dir(self, token: str) -> Path:
+        if not TOKEN_RE.match(token or ""):
+            raise DatasetNotFound(token)
+        return self.root / token
+
+    # ---- registration ----
+    def register(self, token: str, uploads: Dict[str, UploadFile]) -> None:
+        """
+        Copy each upload to disk and start parsing it in the background.
+        `uploads` maps role -> UploadFile; returns once the copies are on disk.
+        """
+        folder = self._dir(token)
+        # Pending before the first byte is copied, so a concurrent sweep()
+        # cannot evict a half-written .raw; each future completes with its parse
+        futures = {role: Future() for role in uploads}
+        with self._lock:
+            self._pending[token] = futures
+            folder.mkdir(parents=True, exist_ok=True)
+        started = set()
+        try:
+            for role, upload in uploads.items():
+                raw = folder / f"{role}.raw"
+                upload.file.seek(0)
+                with open(raw, "wb") as f:
+                    shutil.copyfileobj(upload.file, f, 1024 * 1024)
+                upload.file.seek(0)
+                parse = self._executor.submit(self._parse, folder, role, upload.filename or "")
+                parse.add_done_callback(lambda done, fut=futures[role]: _chain(done, fut))
+                started.add(role)
+        except BaseException as e:
+            for role, fut in futures.items():
+                if role not in started:
+                    fut.set_exception(e)
+            raise
+        self.sweep()
+
+    def _parse(self, folder: Path, role: str, filename: str) -> None:
+        raw = folder / f"{role}.raw"
+        try:
+            _write_arrow(table_from_path(str(raw), filename), folder / f"{role}.arrow")
+        except Exception as e:
+            # Record the failure for other processes waiting on this dataset
+            (folder / f"{role}.error").write_text(str(e))
+            raise
+        finally:
+            raw.unlink(missing_ok=True)
+
+    # ---- lookup ----
+    def _wait(self, token: str, role: str) -> Path:
+        folder = self._dir(token)
+        with self._lock:
+            future = self._pending.get(token, {}).get(role)
+        if future is not None:
+            future.result()  # re-raises a parse error
+
+        path = folder / f"{role}.arrow"
+        error = folder / f"{role}.error"
+        deadline = time.monotonic() + _WAIT_SECONDS
+        while not path.exists():
+            if error.exists():
+                raise ValueError(error.read_text())
+            # Parsing in another process leaves the raw copy until it finishes
+            if not (folder / f"{role}.raw").exists() or time.monotonic() > deadline:
+                raise DatasetNotFound(token)
+            time.sleep(_POLL_SECONDS)
+        return path
+
+    def frame(self, token: str, role: str, columns: Optional[List[str]] = None,
+              numeric: bool = False) -> pd.DataFrame:
+        """
+        Columns of a stored dataset (all when `columns` is None), waiting for
+        the background parse if it has not finished yet. With numeric=True the
+        columns are coerced to float64 like dataframe_from_upload_cols.
+        """
+        if role not in ROLES:
+            raise ValueError(f"Unknown dataset role '{role}'")
+        path = self._wait(token, role)
+        os.utime(path.parent)
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+            if columns is not None:
+                missing = [c for c in columns if c not in table.column_names]
+                if missing:
+                    raise ValueError(f"Column '{missing[0]}' not found")
+                table = table.select(list(dict.fromkeys(columns)))
+                if numeric:
+                    table = coerce_numeric(table, table.column_names)
+            return table.to_pandas()
+
+    def tables(self, token: str, role: str, columns: List[str]) -> Iterator[pa.Table]:
+        """
+        `columns` of a stored dataset as a stream of float64 tables, one per
+        record batch of the memory-mapped file (for streaming comparisons).
+        """
+        if role not in ROLES:
+            raise ValueError(f"Unknown dataset role '{role}'")
+        path = self._wait(token, role)
+        os.utime(path.parent)
+        columns = list(dict.fromkeys(columns))
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            missing = [c for c in columns if c not in reader.schema.names]
+            if missing:
+                raise ValueError(f"Column '{missing[0]}' not found")
+            for i in range(reader.num_record_batches):
+                table = pa.Table.from_batches([reader.get_batch(i)]).select(columns)
+                yield coerce_numeric(table, columns)
+
+    # ---- expiry / eviction ----
+    def sweep(self) -> None:
+        """Drop expired datasets, then the least recently used beyond max_bytes."""
+        now = time.time()
+        with self._lock:
+            busy = {t for t, fs in self._pending.items() if not all(f.done() for f in fs.values())}
+            self._pending = {t: fs for t, fs in self._pending.items() if t in busy}
+            folders = [p for p in self.root.iterdir() if p.is_dir() and p.name not in busy]
+            live = []
+            for p in folders:
+                if now - p.stat().st_mtime > self.ttl_seconds:
+                    shutil.rmtree(p, ignore_errors=True)
+                    self.evictions += 1
+                else:
+                    live.append(p)
+            sizes = {p: _dir_size(p) for p in live}
+            total = sum(sizes.values())
+            for p in sorted(live, key=lambda p: p.stat().st_mtime):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(p, ignore_errors=True)
+                total -= sizes[p]
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            folders = [p for p in self.root.iterdir() if p.is_dir()]
+            return {
+                "datasets": len(folders),
+                "parsing": sum(not all(f.done() for f in fs.values()) for fs in self._pending.values()),
+                "evictions": self.evictions,
+                "bytes": sum(_dir_size(p) for p in folders),
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+dataset_store = DatasetStore(
+    Path(os.environ.get("DATASET_STORE_DIR", Path(tempfile.gettempdir()) / "esri-datasets")),
+    int(os.environ.get("DATASET_STORE_MAX_MB", "2048")) * 1024 * 1024,
+    float(os.environ.get("DATASET_TTL_MIN", "60")) * 60,
+)
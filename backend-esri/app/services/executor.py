@@ -0,0 +1,152 @@
+# app/services/executor.py
+"""
+Compute executor for the analysis endpoints.
+
+Handlers are async, so blocking work must leave the event loop:
+- run_cpu(): CPU-heavy stages (gridding, comparisons, JSON building,
+  matplotlib) in a pool of warm worker processes;
+- run_io():  upload parsing, dataset reads and hashing in a thread pool
+  (Arrow releases the GIL, so both files of a pair are read concurrently).
+
+Admission control: at most COMPUTE_WORKERS + COMPUTE_MAX_QUEUED heavy
+requests are admitted at once (the `compute_slot` dependency); beyond that
+the API answers 503 with a Retry-After header instead of queueing without
+bound, so latency stays predictable and /api/health stays responsive.
+
+Configuration (environment):
+- COMPUTE_WORKERS:     worker processes (default: min(4, CPUs))
+- COMPUTE_IO_THREADS:  I/O threads (default: 8)
+- COMPUTE_MAX_QUEUED:  requests allowed to wait beyond the workers (default: 8)
+- COMPUTE_RETRY_AFTER: Retry-After seconds on 503 (default: 5)
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict
+
+from fastapi import HTTPException
+
+DEFAULT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+
+def _warm_up() -> None:
+    """Worker initializer: pay the heavy imports once per process."""
+    import app.services.comparison_service  # noqa: F401
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+
+
+def _noop() -> None:
+    pass
+
+
+class ComputeExecutor:
+    def __init__(self, workers: int, io_threads: int, max_queued: int, retry_after: int):
+        self.workers = workers
+        self.io_threads = io_threads
+        self.max_queued = max_queued
+        self.retry_after = retry_after
+        self.admitted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._cpu = None
+        self._io = None
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queued
+
+    # ---- pools ----
+    def _new_cpu_pool(self) -> ProcessPoolExecutor:
+        # spawn: never fork a server process that runs Arrow / uvicorn threads
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up,
+                                   mp_context=multiprocessing.get_context("spawn"))
+        # Processes start on demand; start them all now so the first requests are warm
+        for _ in range(self.workers):
+            pool.submit(_noop)
+        return pool
+
+    def start(self) -> None:
+        """Create both pools (also done lazily on first use)."""
+        with self._lock:
+            if self._cpu is None:
+                self._cpu = self._new_cpu_pool()
+            if self._io is None:
+                self._io = ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix="compute-io")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for pool in (self._cpu, self._io):
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            self._cpu = self._io = None
+
+    def _submit_cpu(self, fn, *args):
+        self.start()
+        with self._lock:
+            try:
+                return self._cpu.submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed by the OS); start a fresh pool
+                self._cpu.shutdown(wait=False, cancel_futures=True)
+                self._cpu = self._new_cpu_pool()
+                return self._cpu.submit(fn, *args)
+
+    async def run_cpu(self, fn, *args):
+        """fn(*args) in a worker process (fn and args must be picklable)."""
+        return await asyncio.wrap_future(self._submit_cpu(fn, *args))
+
+    async def run_io(self, fn, *args):
+        """fn(*args) in the I/O thread pool."""
+        self.start()
+        return await asyncio.wrap_future(self._io.submit(fn, *args))
+
+    # ---- admission ----
+    def try_admit(self) -> bool:
+        with self._lock:
+            if self.admitted >= self.capacity:
+                self.rejected += 1
+                return False
+            self.admitted += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.admitted -= 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "io_threads": self.io_threads,
+                "in_flight": self.admitted,
+                "capacity": self.capacity,
+                "rejected": self.rejected,
+            }
+
+
+compute = ComputeExecutor(
+    workers=int(os.environ.get("COMPUTE_WORKERS", DEFAULT_WORKERS)),
+    io_threads=int(os.environ.get("COMPUTE_IO_THREADS", "8")),
+    max_queued=int(os.environ.get("COMPUTE_MAX_QUEUED", "8")),
+    retry_after=int(os.environ.get("COMPUTE_RETRY_AFTER", "5")),
+)
+
+
+async def compute_slot():
+    """FastAPI dependency: admit a heavy request or answer 503 + Retry-After."""
+    if not compute.try_admit():
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy with other analyses; retry shortly",
+            headers={"Retry-After": str(compute.retry_after)},
+        )
+    try:
+        yield
+    finally:
+        compute.release()
@@ -0,0 +1,69 @@
+# app/services/grid.py
+"""
+Regular grid over projected easting/northing samples.
+
+The grid is row-major: cell (iy, ix) spans
+[xmin + ix*cell, xmin + (ix+1)*cell) x [ymin + iy*cell, ymin + (iy+1)*cell).
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class GridSpec:
+    xmin: float
+    ymin: float
+    cell: float   # cell size in axis units (metres)
+    nx: int
+    ny: int
+
+    def centers(self):
+        """(x, y) cell-center coordinates."""
+        x = self.xmin + (np.arange(self.nx) + 0.5) * self.cell
+        y = self.ymin + (np.arange(self.ny) + 0.5) * self.cell
+        return x, y
+
+    def bounds(self):
+        """(xmin, ymin, xmax, ymax) of the whole grid."""
+        return (self.xmin, self.ymin, self.xmin + self.nx * self.cell, self.ymin + self.ny * self.cell)
+
+
+def make_grid_spec(frames: Sequence[pd.DataFrame], cell: float) -> GridSpec:
+    """Combined bounds of all frames ('x'/'y' columns) -> grid dimensions."""
+    xs = [f["x"].to_numpy() for f in frames if len(f)]
+    ys = [f["y"].to_numpy() for f in frames if len(f)]
+    if not xs:
+        raise ValueError("No valid samples to grid")
+    return grid_spec_from_bounds(
+        min(x.min() for x in xs), min(y.min() for y in ys),
+        max(x.max() for x in xs), max(y.max() for y in ys), cell,
+    )
+
+
+def grid_spec_from_bounds(xmin: float, ymin: float, xmax: float, ymax: float, cell: float) -> GridSpec:
+    """Grid dimensions for a known extent (e.g. accumulated while streaming)."""
+    if cell <= 0:
+        raise ValueError("grid_size must be positive")
+    if not all(np.isfinite([xmin, ymin, xmax, ymax])):
+        raise ValueError("No valid samples to grid")
+    nx = max(1, int(math.ceil((xmax - xmin) / cell)))
+    ny = max(1, int(math.ceil((ymax - ymin) / cell)))
+    return GridSpec(xmin=float(xmin), ymin=float(ymin), cell=float(cell), nx=nx, ny=ny)
+
+
+def cell_index(x: np.ndarray, y: np.ndarray, spec: GridSpec):
+    """(grid_ix, grid_iy) per point; points on the max edge go to the last cell."""
+    gx = np.floor((x - spec.xmin) / spec.cell).astype(np.int64)
+    gy = np.floor((y - spec.ymin) / spec.cell).astype(np.int64)
+    return np.clip(gx, 0, spec.nx - 1), np.clip(gy, 0, spec.ny - 1)
+
+
+def assign_grid_index(df: pd.DataFrame, spec: GridSpec) -> pd.DataFrame:
+    """Add grid_ix / grid_iy columns (points on the max edge go to the last cell)."""
+    gx, gy = cell_index(df["x"].to_numpy(), df["y"].to_numpy(), spec)
+    return df.assign(grid_ix=gx, grid_iy=gy)
@@ -3,10 +3,14 @@ import io
 import zipfile
 import uuid
 import logging
-from typing import List, Tuple, Optional
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, ContextManager, Iterator, List, Optional
 
 import chardet  # pip install chardet
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 from fastapi import UploadFile
 
 logger = logging.getLogger("io_service")
@@ -19,6 +23,15 @@ if not logger.handlers:
 
 ALLOWED = (".csv", ".zip")
 
+# Bytes sampled for encoding detection / header parsing
+ENCODING_SAMPLE_BYTES = 4096
+HEADER_SAMPLE_BYTES = 65536
+# Block size for the multithreaded Arrow CSV reader
+CSV_BLOCK_BYTES = 4 * 1024 * 1024
+
+# Strings accepted as numbers when coercing assay / coordinate columns
+_NUMBER_RE = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+
 
 def _safe_name(name: str) -> bool:
     n = (name or "").lower().strip()
@@ -41,14 +54,8 @@ def _read_header_from_bytes(raw: bytes) -> List[str]:
     Read only the header row from raw CSV bytes, with robust encoding fallbacks.
     """
     # Try a few encodings if needed (utf-8-sig handles BOM)
-    candidates = []
-    candidates.append(_detect_encoding(raw[:4096]))
-    for c in ("utf-8-sig", "utf-8", "latin-1"):
-        if c not in candidates:
-            candidates.append(c)
-
     last_err: Optional[Exception] = None
-    for enc in candidates:
+    for enc in _encoding_candidates(raw[:ENCODING_SAMPLE_BYTES]):
         try:
             text = raw.decode(enc, errors="ignore")
             df = pd.read_csv(io.StringIO(text), nrows=0)
@@ -61,32 +68,149 @@ def _read_header_from_bytes(raw: bytes) -> List[str]:
     raise ValueError(f"Could not read header with candidate encodings; last error: {last_err}")
 
 
-def _read_csv_bytes_to_df(raw: bytes) -> pd.DataFrame:
-    """
-    Read full CSV to DataFrame with robust encodings.
-    """
-    candidates = []
-    candidates.append(_detect_encoding(raw[:4096]))
+def _encoding_candidates(sample: bytes) -> List[str]:
+    candidates = [_detect_encoding(sample)]
     for c in ("utf-8-sig", "utf-8", "latin-1"):
         if c not in candidates:
             candidates.append(c)
+    return candidates
+
+
+def _arrow_encoding(encoding: str) -> str:
+    """Arrow decodes UTF-8 (and skips a BOM) natively; other encodings are transcoded."""
+    enc = (encoding or "utf-8").lower().replace("_", "-")
+    return "utf8" if enc in ("ascii", "utf-8", "utf8", "utf-8-sig") else enc
+
+
+def coerce_numeric(table: pa.Table, columns: List[str]) -> pa.Table:
+    """
+    Cast `columns` to float64; values that are not numbers (e.g. '<0.01',
+    'n/a') become nulls, like ``pd.to_numeric(errors="coerce")``.
+    """
+    for name in columns:
+        i = table.column_names.index(name)
+        col = table.column(i)
+        if pa.types.is_floating(col.type):
+            continue
+        if pa.types.is_integer(col.type) or pa.types.is_null(col.type):
+            col = pc.cast(col, pa.float64())
+        else:
+            col = pc.utf8_trim_whitespace(pc.cast(col, pa.string()))
+            ok = pc.match_substring_regex(col, _NUMBER_RE)
+            col = pc.cast(pc.if_else(ok, col, None), pa.float64())
+        table = table.set_column(i, name, col)
+    return table
+
+
+def _read_csv_stream_to_table(open_stream: Callable[[], ContextManager[BinaryIO]],
+                              usecols: Optional[List[str]] = None,
+                              numeric: bool = False) -> pa.Table:
+    """
+    Parse a CSV into an Arrow table with the multithreaded Arrow reader.
+
+    The encoding is detected once from a bounded sample and the header is
+    parsed like /columns does, so column names match what the user mapped.
+    Only `usecols` are converted; with `numeric=True` they are read as text
+    and coerced to float64 (non-numeric values -> null).
+    """
+    with open_stream() as fh:
+        sample = fh.read(HEADER_SAMPLE_BYTES)
+    encoding = _encoding_candidates(sample[:ENCODING_SAMPLE_BYTES])[0]
+    header = _read_header_from_bytes(sample)
+    if usecols is not None:
+        missing = [c for c in usecols if c not in header]
+        if missing:
+            raise ValueError(f"Column '{missing[0]}' not found")
+        usecols = list(dict.fromkeys(usecols))
+
+    read_options = pacsv.ReadOptions(
+        use_threads=True, block_size=CSV_BLOCK_BYTES, encoding=_arrow_encoding(encoding),
+        column_names=header, skip_rows=1,
+    )
+    convert_options = pacsv.ConvertOptions(
+        include_columns=usecols,
+        column_types={c: pa.string() for c in usecols} if numeric and usecols else None,
+        strings_can_be_null=True,
+    )
+    with open_stream() as fh:
+        table = pacsv.read_csv(fh, read_options=read_options, convert_options=convert_options)
+    if numeric and usecols:
+        table = coerce_numeric(table, usecols)
+    logger.info("Table (cols=%s) read with encoding=%s; rows=%d", usecols, encoding, table.num_rows)
+    return table
+
+
+def _iter_csv_stream_tables(open_stream: Callable[[], ContextManager[BinaryIO]],
+                            usecols: List[str]) -> Iterator[pa.Table]:
+    """
+    Stream a CSV as consecutive Arrow tables of about CSV_BLOCK_BYTES each,
+    holding only `usecols` coerced to float64. Only one block is in memory.
+    """
+    with open_stream() as fh:
+        sample = fh.read(HEADER_SAMPLE_BYTES)
+    encoding = _encoding_candidates(sample[:ENCODING_SAMPLE_BYTES])[0]
+    header = _read_header_from_bytes(sample)
+    missing = [c for c in usecols if c not in header]
+    if missing:
+        raise ValueError(f"Column '{missing[0]}' not found")
+    usecols = list(dict.fromkeys(usecols))
+
+    read_options = pacsv.ReadOptions(
+        use_threads=True, block_size=CSV_BLOCK_BYTES, encoding=_arrow_encoding(encoding),
+        column_names=header, skip_rows=1,
+    )
+    convert_options = pacsv.ConvertOptions(
+        include_columns=usecols, column_types={c: pa.string() for c in usecols}, strings_can_be_null=True,
+    )
+    with open_stream() as fh:
+        reader = pacsv.open_csv(fh, read_options=read_options, convert_options=convert_options)
+        for batch in reader:
+            yield coerce_numeric(pa.Table.from_batches([batch]), usecols)
+
+
+def _read_csv_stream_pandas(open_stream: Callable[[], ContextManager[BinaryIO]],
+                            usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Parse a CSV from a stream factory with robust encodings.
+    Each attempt re-opens the stream, so the raw file is never held in memory.
+    """
+    with open_stream() as fh:
+        sample = fh.read(ENCODING_SAMPLE_BYTES)
 
     last_err: Optional[Exception] = None
-    for enc in candidates:
+    for enc in _encoding_candidates(sample):
         try:
-            df = pd.read_csv(io.BytesIO(raw), encoding=enc, low_memory=False)
-            logger.info("DataFrame read with encoding=%s; shape=%s", enc, df.shape)
+            with open_stream() as fh:
+                df = pd.read_csv(fh, encoding=enc, usecols=usecols, low_memory=False)
+            logger.info("DataFrame (cols=%s) read with encoding=%s; shape=%s", usecols, enc, df.shape)
             return df
         except Exception as e:
             last_err = e
-            logger.warning("DataFrame read failed with encoding=%s: %s", enc, e)
+            logger.warning("DataFrame (cols=%s) read failed with encoding=%s: %s", usecols, enc, e)
 
     raise ValueError(f"Could not read CSV with candidate encodings; last error: {last_err}")
 
 
-def _pick_first_csv_from_zip(zf: zipfile.ZipFile) -> Tuple[str, bytes]:
+def _read_csv_stream_to_df(open_stream: Callable[[], ContextManager[BinaryIO]],
+                           usecols: Optional[List[str]] = None,
+                           numeric: bool = False) -> pd.DataFrame:
+    """
+    Arrow-parsed DataFrame; files the Arrow reader rejects (quoted newlines,
+    ragged rows, a misdetected encoding) fall back to pandas.
+    """
+    try:
+        return _read_csv_stream_to_table(open_stream, usecols, numeric).to_pandas()
+    except (pa.ArrowInvalid, UnicodeDecodeError) as e:
+        logger.warning("Arrow CSV read failed (%s); falling back to pandas", e)
+    df = _read_csv_stream_pandas(open_stream, usecols)
+    if numeric and usecols:
+        df[usecols] = df[usecols].apply(pd.to_numeric, errors="coerce")
+    return df
+
+
+def _pick_csv_member(zf: zipfile.ZipFile) -> zipfile.ZipInfo:
     """
-    Pick the first .csv file in a ZIP (prefer top-level CSVs), return (name, bytes).
+    Pick the first .csv file in a ZIP (prefer top-level CSVs).
     """
     csv_infos = [info for info in zf.infolist() if info.filename.lower().endswith(".csv")]
     if not csv_infos:
@@ -95,10 +219,44 @@ def _pick_first_csv_from_zip(zf: zipfile.ZipFile) -> Tuple[str, bytes]:
     # Prefer top-level CSVs (no folders in name), else just first
     csv_infos.sort(key=lambda i: ("/" in i.filename or "\\" in i.filename, i.filename.lower()))
     target = csv_infos[0]
-    with zf.open(target) as fh:
-        data = fh.read()
-    logger.info("Picked CSV from zip: %s (%d bytes)", target.filename, len(data))
-    return target.filename, data
+    logger.info("Picked CSV from zip: %s (%d bytes)", target.filename, target.file_size)
+    return target
+
+
+def csv_stream_opener(upload: UploadFile) -> Callable[[], ContextManager[BinaryIO]]:
+    """
+    Factory of binary streams over the upload's CSV (the first CSV for a ZIP).
+    ZIP members are decompressed on the fly from the spooled upload file.
+    """
+    return file_stream_opener(upload.file, upload.filename or "")
+
+
+def file_stream_opener(fileobj: BinaryIO, filename: str) -> Callable[[], ContextManager[BinaryIO]]:
+    """
+    Same as csv_stream_opener for any seekable binary file (e.g. an upload
+    copied to disk); `filename` decides between plain CSV and ZIP.
+    """
+    if filename.lower().endswith(".csv"):
+        @contextmanager
+        def open_csv():
+            fileobj.seek(0)
+            try:
+                yield fileobj
+            finally:
+                fileobj.seek(0)
+        return open_csv
+
+    @contextmanager
+    def open_member():
+        fileobj.seek(0)
+        try:
+            with zipfile.ZipFile(fileobj) as zf, zf.open(_pick_csv_member(zf)) as fh:
+                yield fh
+        except zipfile.BadZipFile:
+            raise ValueError("Provided file is not a valid ZIP archive")
+        finally:
+            fileobj.seek(0)
+    return open_member
 
 
 def extract_columns(upload: UploadFile) -> List[str]:
@@ -112,32 +270,14 @@ def extract_columns(upload: UploadFile) -> List[str]:
     if not _safe_name(fname):
         raise ValueError("Only .csv or .zip files are accepted")
 
-    lower = fname.lower()
-
-    if lower.endswith(".csv"):
-        # Read a small chunk; header normally sits at the start
-        upload.file.seek(0)
-        raw = upload.file.read(65536)
-        upload.file.seek(0)
+    try:
+        with csv_stream_opener(upload)() as fh:
+            raw = fh.read(HEADER_SAMPLE_BYTES)
         cols = _read_header_from_bytes(raw)
-        logger.info("extract_columns: CSV columns=%s", cols)
+        logger.info("extract_columns: columns=%s", cols)
         return cols
-
-    # ZIP case
-    upload.file.seek(0)
-    raw_zip = upload.file.read()
-    upload.file.seek(0)
-    try:
-        with zipfile.ZipFile(io.BytesIO(raw_zip)) as zf:
-            name, csv_bytes = _pick_first_csv_from_zip(zf)
-            # For header: we can pass full csv_bytes (usually small header anyway)
-            cols = _read_header_from_bytes(csv_bytes[:65536])
-            logger.info("extract_columns: ZIP->CSV=%s; columns=%s", name, cols)
-            return cols
-    except zipfile.BadZipFile:
-        raise ValueError("Provided file is not a valid ZIP archive")
     except Exception as e:
-        logger.exception("extract_columns failed for ZIP: %s", e)
+        logger.exception("extract_columns failed: %s", e)
         raise
 
 
@@ -145,56 +285,40 @@ def dataframe_from_upload(upload: UploadFile) -> pd.DataFrame:
     """
     Load the entire CSV (or first CSV in ZIP) into a pandas DataFrame.
     """
-    fname = (upload.filename or "").lower()
     logger.info("dataframe_from_upload: filename=%s", upload.filename)
-
-    upload.file.seek(0)
-    raw = upload.file.read()
-    upload.file.seek(0)
-
-    if fname.endswith(".csv"):
-        return _read_csv_bytes_to_df(raw)
-
-    with zipfile.ZipFile(io.BytesIO(raw)) as zf:
-        _, csv_bytes = _pick_first_csv_from_zip(zf)
-        return _read_csv_bytes_to_df(csv_bytes)
+    return _read_csv_stream_to_df(csv_stream_opener(upload))
 
 
 # --- FAST column-only readers for plots ---
-def _read_csv_bytes_to_df_cols(raw: bytes, usecols: List[str]) -> pd.DataFrame:
-    candidates = []
-    candidates.append(_detect_encoding(raw[:4096]))
-    for c in ("utf-8-sig", "utf-8", "latin-1"):
-        if c not in candidates:
-            candidates.append(c)
-
-    last_err: Optional[Exception] = None
-    for enc in candidates:
-        try:
-            df = pd.read_csv(io.BytesIO(raw), encoding=enc, usecols=usecols, low_memory=False)
-            logger.info("DataFrame (cols=%s) read with encoding=%s; shape=%s", usecols, enc, df.shape)
-            return df
-        except Exception as e:
-            last_err = e
-            logger.warning("DataFrame (cols=%s) read failed with encoding=%s: %s", usecols, enc, e)
-
-    raise ValueError(f"Could not read CSV with candidate encodings; last error: {last_err}")
-
-
-def dataframe_from_upload_cols(upload: UploadFile, usecols: List[str]) -> pd.DataFrame:
-    fname = (upload.filename or "").lower()
+def dataframe_from_upload_cols(upload: UploadFile, usecols: List[str], numeric: bool = False) -> pd.DataFrame:
+    """Only `usecols`; with numeric=True they come back as float64 (non-numbers -> NaN)."""
     logger.info("dataframe_from_upload_cols: filename=%s usecols=%s", upload.filename, usecols)
+    return _read_csv_stream_to_df(csv_stream_opener(upload), usecols, numeric)
 
-    upload.file.seek(0)
-    raw = upload.file.read()
-    upload.file.seek(0)
 
-    if fname.endswith(".csv"):
-        return _read_csv_bytes_to_df_cols(raw, usecols)
+def iter_upload_tables(upload: UploadFile, usecols: List[str]) -> Iterator[pa.Table]:
+    """`usecols` of an upload as a stream of float64 Arrow tables (see streaming mode)."""
+    logger.info("iter_upload_tables: filename=%s usecols=%s", upload.filename, usecols)
+    return _iter_csv_stream_tables(csv_stream_opener(upload), usecols)
 
-    with zipfile.ZipFile(io.BytesIO(raw)) as zf:
-        _, csv_bytes = _pick_first_csv_from_zip(zf)
-        return _read_csv_bytes_to_df_cols(csv_bytes, usecols)
+
+def table_from_path(path: str, filename: str) -> pa.Table:
+    """
+    Arrow table of the entire CSV (or first CSV in ZIP) stored at `path`;
+    `filename` is the original upload name.
+    """
+    logger.info("table_from_path: filename=%s path=%s", filename, path)
+    with open(path, "rb") as f:
+        opener = file_stream_opener(f, filename)
+        try:
+            return _read_csv_stream_to_table(opener)
+        except (pa.ArrowInvalid, UnicodeDecodeError) as e:
+            logger.warning("Arrow CSV read failed (%s); falling back to pandas", e)
+        df = _read_csv_stream_pandas(opener)
+    # Mixed-type object columns become text so Arrow can store them
+    obj = df.select_dtypes(include="object").columns
+    df[obj] = df[obj].astype("string")
+    return pa.Table.from_pandas(df, preserve_index=False)
 
 
 def make_run_token() -> str:
@@ -0,0 +1,209 @@
+# app/services/order_stats.py
+"""
+Segmented order statistics per grid cell.
+
+Samples are sorted once by (cell, value) and described CSR-style: the
+values of occupied cell ``cells[k]`` are ``values[offsets[k]:offsets[k+1]]``
+in ascending order. From that layout any list of quantiles and a per-cell
+two-sample Kolmogorov–Smirnov statistic (Original vs DL) are array ops.
+
+Comparison methods registered from here:
+- p10, p90: grid-wise 10th / 90th percentile (DL – Original)
+- iqr:      grid-wise inter-quartile range (DL – Original)
+- ks:       arr_orig / arr_dl = sample counts, arr_cmp = KS statistic D
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+_LOW32 = np.int64(0xFFFFFFFF)
+
+
+@dataclass
+class Segments:
+    values: np.ndarray    # sorted by (cell, value)
+    cells: np.ndarray     # occupied cell ids, ascending
+    offsets: np.ndarray   # CSR offsets, len(cells) + 1
+    ncell: int
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+
+def sort_by_cell_value(cell_ids, values):
+    """
+    Permutation that orders samples by (cell, value).
+
+    Equivalent to ``np.lexsort((values, cell_ids))`` but several times faster:
+    one float argsort gives value ranks, then (cell << 32 | rank) is a
+    single int64 key that a plain ``np.sort`` orders.
+    """
+    cell_ids = np.asarray(cell_ids, dtype=np.int64)
+    n = len(values)
+    if n >= 2**32 or (n and cell_ids.max() >= 2**31):
+        return np.lexsort((values, cell_ids))
+    by_value = np.argsort(values)
+    key = (cell_ids[by_value] << 32) | np.arange(n, dtype=np.int64)
+    key.sort()
+    return by_value[key & _LOW32]
+
+
+def _csr(sorted_cells, ncell):
+    counts = np.bincount(sorted_cells, minlength=ncell)
+    cells = np.flatnonzero(counts)
+    offsets = np.concatenate(([0], np.cumsum(counts[cells])))
+    return cells, offsets
+
+
+def segment_sort(cell_ids, values, ncell) -> Segments:
+    """Build Segments from per-sample cell ids and values (non-finite values dropped)."""
+    cell_ids = np.asarray(cell_ids, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    ok = np.isfinite(values)
+    if not ok.all():
+        cell_ids, values = cell_ids[ok], values[ok]
+    perm = sort_by_cell_value(cell_ids, values)
+    cells, offsets = _csr(cell_ids[perm], ncell)
+    return Segments(values=values[perm], cells=cells, offsets=offsets, ncell=ncell)
+
+
+def segments_from_gdf(gdf, nx, ny, value_col="Te_ppm") -> Segments:
+    """Segments for a frame carrying grid_ix / grid_iy columns."""
+    if gdf is None or len(gdf) == 0:
+        return segment_sort(np.empty(0, np.int64), np.empty(0), nx * ny)
+    cid = gdf["grid_iy"].values.astype(np.int64) * nx + gdf["grid_ix"].values
+    return segment_sort(cid, gdf[value_col].to_numpy(dtype=float), nx * ny)
+
+
+def segment_quantiles(seg: Segments, qs) -> np.ndarray:
+    """
+    Quantiles per cell -> (len(qs), ncell) array, NaN for empty cells.
+    Uses linear interpolation (numpy's default ``method="linear"``).
+    """
+    qs = np.atleast_1d(np.asarray(qs, dtype=float))
+    out = np.full((len(qs), seg.ncell), np.nan)
+    if len(seg.cells) == 0:
+        return out
+    start = seg.offsets[:-1]
+    n = seg.counts
+    for i, q in enumerate(qs):
+        pos = q * (n - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, n - 1)
+        frac = pos - lo
+        v_lo = seg.values[start + lo]
+        v_hi = seg.values[start + hi]
+        out[i, seg.cells] = v_lo + frac * (v_hi - v_lo)
+    return out
+
+
+def segment_ks(seg_a: Segments, seg_b: Segments) -> np.ndarray:
+    """
+    Two-sample KS statistic D = sup |F_a - F_b| per cell (NaN unless both
+    datasets have samples in the cell). Both ECDFs are evaluated on the
+    pooled, (cell, value)-sorted samples; only the last of a run of tied
+    values counts, so ties are handled exactly.
+    """
+    ncell = seg_a.ncell
+    d = np.full(ncell, np.nan)
+    na = np.zeros(ncell, dtype=np.int64)
+    nb = np.zeros(ncell, dtype=np.int64)
+    na[seg_a.cells] = seg_a.counts
+    nb[seg_b.cells] = seg_b.counts
+    if not ((na > 0) & (nb > 0)).any():
+        return d
+
+    cid = np.concatenate((np.repeat(seg_a.cells, seg_a.counts), np.repeat(seg_b.cells, seg_b.counts)))
+    vals = np.concatenate((seg_a.values, seg_b.values))
+    is_a = np.concatenate((np.ones(len(seg_a.values)), np.zeros(len(seg_b.values))))
+    perm = sort_by_cell_value(cid, vals)
+    cid, vals, is_a = cid[perm], vals[perm], is_a[perm]
+
+    cells, offsets = _csr(cid, ncell)
+    start = offsets[:-1]
+    run = np.repeat(start, np.diff(offsets))
+    cum_a = np.cumsum(is_a)
+    cum_b = np.arange(1, len(is_a) + 1) - cum_a
+    # Counts up to and including each position, restarted at each cell
+    before_a = np.concatenate(([0.0], cum_a))[run]
+    before_b = np.concatenate(([0.0], cum_b))[run]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gap = np.abs((cum_a - before_a) / na[cid] - (cum_b - before_b) / nb[cid])
+
+    last_of_tie = np.ones(len(vals), dtype=bool)
+    last_of_tie[:-1] = (cid[1:] != cid[:-1]) | (vals[1:] != vals[:-1])
+    gap = np.where(last_of_tie & np.isfinite(gap), gap, 0.0)
+
+    both = (na[cells] > 0) & (nb[cells] > 0)
+    d[cells[both]] = np.maximum.reduceat(gap, start)[both]
+    return d
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Comparison methods
+# ─────────────────────────────────────────────────────────────────────────────
+
+QUANTILE_METHODS = {"p10": (0.10,), "p90": (0.90,), "iqr": (0.25, 0.75)}
+
+
+def _safe_diff(a, b):
+    mask = np.isfinite(a) & np.isfinite(b)
+    out = np.full_like(a, np.nan, dtype=float)
+    out[mask] = b[mask] - a[mask]
+    return out
+
+
+def quantile_diff_from_segments(seg_o: Segments, seg_d: Segments, nx, ny, method):
+    """(arr_orig, arr_dl, DL – Original) for a method in QUANTILE_METHODS; empty cells are NaN."""
+    qs = QUANTILE_METHODS[method]
+    q_o = segment_quantiles(seg_o, qs)
+    q_d = segment_quantiles(seg_d, qs)
+    if method == "iqr":
+        arr_orig, arr_dl = q_o[1] - q_o[0], q_d[1] - q_d[0]
+    else:
+        arr_orig, arr_dl = q_o[0], q_d[0]
+    arr_orig = arr_orig.reshape(ny, nx)
+    arr_dl   = arr_dl.reshape(ny, nx)
+    return arr_orig, arr_dl, _safe_diff(arr_orig, arr_dl)
+
+
+def ks_from_segments(seg_o: Segments, seg_d: Segments, nx, ny):
+    """(n_orig, n_dl, KS statistic) per cell; empty counts and untested cells are NaN."""
+    n_o = np.full(seg_o.ncell, np.nan)
+    n_d = np.full(seg_d.ncell, np.nan)
+    n_o[seg_o.cells] = seg_o.counts
+    n_d[seg_d.cells] = seg_d.counts
+    d = segment_ks(seg_o, seg_d)
+    return n_o.reshape(ny, nx), n_d.reshape(ny, nx), d.reshape(ny, nx)
+
+
+def p10_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
+    """Grid-wise 10th percentile (DL – Original)."""
+    return quantile_diff_from_segments(segments_from_gdf(orig_gdf_idx, nx, ny),
+                                       segments_from_gdf(dl_gdf_idx, nx, ny), nx, ny, "p10")
+
+
+def p90_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
+    """Grid-wise 90th percentile (DL – Original)."""
+    return quantile_diff_from_segments(segments_from_gdf(orig_gdf_idx, nx, ny),
+                                       segments_from_gdf(dl_gdf_idx, nx, ny), nx, ny, "p90")
+
+
+def iqr_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
+    """Grid-wise inter-quartile range (DL – Original)."""
+    return quantile_diff_from_segments(segments_from_gdf(orig_gdf_idx, nx, ny),
+                                       segments_from_gdf(dl_gdf_idx, nx, ny), nx, ny, "iqr")
+
+
+def ks_test(dl_gdf_idx, orig_gdf_idx, nx, ny):
+    """
+    Two-sample KS test between DL and Original distributions per cell.
+
+    arr_orig = counts of Original samples per cell
+    arr_dl   = counts of DL samples per cell
+    arr_cmp  = KS statistic D per cell (NaN where either side is empty)
+    """
+    return ks_from_segments(segments_from_gdf(orig_gdf_idx, nx, ny),
+                            segments_from_gdf(dl_gdf_idx, nx, ny), nx, ny)
@@ -0,0 +1,80 @@
+# app/services/plot_render.py
+"""
+Histogram / QQ plot data and PNG rendering for /api/analysis/plots.
+
+plot_data() reduces the two assay series to what the plots show: log-binned
+histogram counts and the QQ quantile pairs. That is the whole "data" reply,
+and it is also all a renderer needs, so PNGs are drawn from it in a
+compute worker process (matplotlib never runs on the event loop).
+"""
+
+import base64
+import io
+from typing import Dict
+
+import numpy as np
+
+QQ_QUANTILES = np.linspace(0.01, 0.99, 50)
+PLOT_COLOR = "#7C3AED"
+
+
+def _histogram(s: np.ndarray, bins: int) -> Dict[str, list]:
+    edges = np.logspace(np.log10(s.min()), np.log10(s.max()), bins)
+    counts, _ = np.histogram(s, bins=edges)
+    return {"edges": edges.tolist(), "counts": counts.tolist()}
+
+
+def plot_data(s_o: np.ndarray, s_d: np.ndarray, bins: int = 50) -> Dict:
+    """
+    Histogram of each series over `bins` log-spaced edges, plus the QQ pairs
+    at QQ_QUANTILES. Series must hold positive values only.
+    """
+    if bins < 2:
+        raise ValueError("bins must be at least 2")
+    for name, s in (("original", s_o), ("dl", s_d)):
+        if not len(s):
+            raise ValueError(f"No positive assay values in the {name} data")
+    return {
+        "original": _histogram(s_o, bins),
+        "dl": _histogram(s_d, bins),
+        "qq": {
+            "q": QQ_QUANTILES.tolist(),
+            "original": np.quantile(s_o, QQ_QUANTILES).tolist(),
+            "dl": np.quantile(s_d, QQ_QUANTILES).tolist(),
+        },
+    }
+
+
+def _fig_to_b64(fig, plt) -> str:
+    buf = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format="png", dpi=120)
+    plt.close(fig)
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def render_pngs(data: Dict) -> Dict[str, str]:
+    """Base64 PNGs {original_png, dl_png, qq_png} from plot_data() output (runs in a worker)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    out = {}
+    for key in ("original", "dl"):
+        edges = np.asarray(data[key]["edges"])
+        fig = plt.figure(figsize=(7, 4))
+        ax = fig.add_subplot(111)
+        ax.hist(edges[:-1], bins=edges, weights=data[key]["counts"], color=PLOT_COLOR, edgecolor="black")
+        ax.set_xscale("log")
+        out[f"{key}_png"] = _fig_to_b64(fig, plt)
+
+    qo = np.asarray(data["qq"]["original"])
+    qd = np.asarray(data["qq"]["dl"])
+    fig = plt.figure(figsize=(6, 6))
+    ax = fig.add_subplot(111)
+    ax.scatter(qo, qd, s=20, color=PLOT_COLOR)
+    line = np.linspace(min(qo.min(), qd.min()), max(qo.max(), qd.max()), 100)
+    ax.plot(line, line, "--", linewidth=1)
+    ax.set_xscale("log"); ax.set_yscale("log")
+    out["qq_png"] = _fig_to_b64(fig, plt)
+    return out
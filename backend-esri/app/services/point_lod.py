@@ -0,0 +1,89 @@
+# app/services/point_lod.py
+"""
+Level-of-detail decimation of sample points for the map view.
+
+A comparison that includes points with a `point_budget` > 0 also stores
+them (projected x / y / Te_ppm, compressed) in the point store under its
+key, the `points_id`. The response then carries at most `point_budget`
+points per dataset, and GET /api/analysis/points re-decimates the stored
+points for any viewport and budget, so zooming in fetches finer detail
+without re-running the comparison. Without a budget nothing is stored.
+
+The point store is separate from the response cache and has its own size
+bound, so large point sets never evict comparison results.
+
+Decimation lays a screen-scale bucket grid over the viewport (about
+`budget` buckets, shaped like the viewport) and keeps the highest-assay
+sample of each bucket, so anomalies survive at every zoom level.
+
+Configuration (environment):
+- POINT_CACHE_DIR:    point store folder (default: <tmp>/esri-point-cache)
+- POINT_CACHE_MAX_MB: total size of stored points (default: 1024)
+"""
+
+import io
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from app.services.result_cache import ResultCache
+
+POINTS_KIND = "points"
+ROLES = ("original", "dl")
+
+point_store = ResultCache(
+    Path(os.environ.get("POINT_CACHE_DIR", Path(tempfile.gettempdir()) / "esri-point-cache")),
+    int(os.environ.get("POINT_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+)
+
+
+def save_points(points_id: str, points: Dict[str, np.ndarray]) -> None:
+    """Store each role's (n, 3) x / y / Te_ppm rows under `points_id`."""
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **points)
+    point_store.put(points_id, buf.getvalue(), kind=POINTS_KIND)
+
+
+def load_points(points_id: str) -> Optional[Dict[str, np.ndarray]]:
+    """{role: (n, 3) array} stored by save_points, or None once evicted."""
+    data = point_store.get(points_id, kind=POINTS_KIND)
+    if data is None:
+        return None
+    with np.load(io.BytesIO(data)) as npz:
+        return {role: npz[role] for role in npz.files}
+
+
+def decimate(points: np.ndarray, budget: int, bbox: Optional[Sequence[float]] = None) -> np.ndarray:
+    """
+    At most ~`budget` rows of an (n, 3) x / y / value array inside `bbox`
+    (xmin, ymin, xmax, ymax; default: the points' extent): the max-value
+    point of each bucket of a budget-sized grid over the bbox.
+    """
+    if bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        inside = ((points[:, 0] >= xmin) & (points[:, 0] <= xmax)
+                  & (points[:, 1] >= ymin) & (points[:, 1] <= ymax))
+        points = points[inside]
+    if budget <= 0 or len(points) <= budget:
+        return points
+    if bbox is None:
+        xmin, ymin = points[:, 0].min(), points[:, 1].min()
+        xmax, ymax = points[:, 0].max(), points[:, 1].max()
+
+    # Bucket grid with ~budget cells and the viewport's aspect ratio
+    width, height = max(xmax - xmin, 1e-9), max(ymax - ymin, 1e-9)
+    nx = max(1, int(np.sqrt(budget * width / height)))
+    ny = max(1, budget // nx)
+    bx = np.clip(((points[:, 0] - xmin) / width * nx).astype(np.int64), 0, nx - 1)
+    by = np.clip(((points[:, 1] - ymin) / height * ny).astype(np.int64), 0, ny - 1)
+    bucket = by * nx + bx
+
+    # Highest value first within each bucket, then keep each bucket's first row
+    order = np.lexsort((-points[:, 2], bucket))
+    sorted_bucket = bucket[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_bucket[1:] != sorted_bucket[:-1]
+    return points[order[first]]
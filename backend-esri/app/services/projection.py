@@ -0,0 +1,109 @@
+# app/services/projection.py
+"""
+Coordinate projection service.
+
+- pyproj Transformers are built once per (source, target) CRS pair and
+  thread (a Transformer must not be shared between threads);
+- raw x / y float arrays are transformed in PROJECTION_CHUNK-sized chunks
+  across a thread pool (pyproj releases the GIL while transforming);
+- project_xy() memoizes projected coordinates in their own on-disk store
+  (written from compute workers, so kept apart from the response cache),
+  keyed by a fingerprint of the input coordinates and the CRS pair, so
+  repeated comparisons on the same upload or run_token skip reprojection.
+
+Configuration (environment):
+- PROJECTION_THREADS:      transform threads per process (default: min(4, CPUs))
+- PROJECTION_CACHE_DIR:    memo folder (default: <tmp>/esri-projection-cache)
+- PROJECTION_CACHE_MAX_MB: memo size in MB (default: 512)
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+from pyproj import Transformer
+
+from app.services.result_cache import ResultCache
+
+# Points per transform call; smaller inputs are transformed inline
+PROJECTION_CHUNK = 1 << 18
+PROJECTION_KIND = "xy"
+
+projection_store = ResultCache(
+    Path(os.environ.get("PROJECTION_CACHE_DIR", Path(tempfile.gettempdir()) / "esri-projection-cache")),
+    int(os.environ.get("PROJECTION_CACHE_MAX_MB", "512")) * 1024 * 1024,
+)
+
+_local = threading.local()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_transformer(src_crs: str, dst_crs: str) -> Transformer:
+    """This thread's cached always_xy Transformer for (src_crs, dst_crs)."""
+    cache = getattr(_local, "transformers", None)
+    if cache is None:
+        cache = _local.transformers = {}
+    tr = cache.get((src_crs, dst_crs))
+    if tr is None:
+        tr = cache[(src_crs, dst_crs)] = Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+    return tr
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.environ.get("PROJECTION_THREADS", max(1, min(4, os.cpu_count() or 1))))
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="projection")
+        return _pool
+
+
+def transform_xy(x: np.ndarray, y: np.ndarray, src_crs: str, dst_crs: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Project coordinate arrays, in parallel chunks for large inputs."""
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    if len(x) <= PROJECTION_CHUNK:
+        px, py = get_transformer(src_crs, dst_crs).transform(x, y)
+        return np.asarray(px, dtype=np.float64), np.asarray(py, dtype=np.float64)
+
+    px = np.empty_like(x)
+    py = np.empty_like(y)
+
+    def run(start: int) -> None:
+        stop = start + PROJECTION_CHUNK
+        px[start:stop], py[start:stop] = get_transformer(src_crs, dst_crs).transform(x[start:stop], y[start:stop])
+
+    for f in [_get_pool().submit(run, s) for s in range(0, len(x), PROJECTION_CHUNK)]:
+        f.result()
+    return px, py
+
+
+def coords_fingerprint(x: np.ndarray, y: np.ndarray, src_crs: str, dst_crs: str) -> str:
+    """blake2b of the raw coordinates plus the CRS pair."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(np.ascontiguousarray(x, dtype=np.float64).data)
+    h.update(np.ascontiguousarray(y, dtype=np.float64).data)
+    h.update(f"{src_crs}\0{dst_crs}".encode())
+    return h.hexdigest()
+
+
+def project_xy(x: np.ndarray, y: np.ndarray, src_crs: str, dst_crs: str) -> Tuple[np.ndarray, np.ndarray]:
+    """transform_xy, answered from the memo when these coordinates were projected before."""
+    key = coords_fingerprint(x, y, src_crs, dst_crs)
+    data = projection_store.get(key, kind=PROJECTION_KIND)
+    if data is not None:
+        xy = np.load(io.BytesIO(data))
+        if xy.shape == (2, len(x)):
+            return xy[0], xy[1]
+    px, py = transform_xy(x, y, src_crs, dst_crs)
+    buf = io.BytesIO()
+    np.save(buf, np.vstack((px, py)))
+    projection_store.put(key, buf.getvalue(), kind=PROJECTION_KIND)
+    return px, py
@@ -0,0 +1,90 @@
+# app/services/pyramid.py
+"""
+Multi-resolution grid pyramid.
+
+Level k over a base GridSpec has cell size ``base.cell * 2**k``, the same
+origin and ``ceil(nx / 2**k) x ceil(ny / 2**k)`` cells, which is exactly the
+grid make_grid_spec builds for that cell size. Each of its cells is the
+union of 2 x 2 cells of level k - 1, so the per-cell accumulators of the
+base grid (see streaming.py) are merged level by level without revisiting
+the points:
+
+- count / sum / min / max / mean: exact;
+- median / p10 / p90 / iqr: from the quantile sketch, within its relative
+  error bound (SKETCH_ALPHA);
+- ks: not mergeable, so not available for derived levels.
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.grid import GridSpec
+from app.services.streaming import (
+    STREAMING_METHODS, CellAccumulator, CellQuantileSketch, accumulator_results, needs_sketch,
+)
+
+# Most coarser levels derived from one comparison
+MAX_LEVELS = 6
+
+# Methods whose derived levels equal a direct run at that grid size
+EXACT_LEVEL_METHODS = {"max", "mean"}
+
+
+def check_methods(methods: Sequence[str]) -> None:
+    unsupported = [m for m in methods if m not in STREAMING_METHODS]
+    if unsupported:
+        raise ValueError(f"Method(s) not available for pyramid levels: {', '.join(unsupported)}")
+
+
+def level_cells(cell: float, levels: int) -> List[float]:
+    """Cell sizes of levels 1..levels above a base `cell`."""
+    return [cell * 2 ** k for k in range(1, levels + 1)]
+
+
+def coarsen(spec: GridSpec) -> Tuple[GridSpec, np.ndarray]:
+    """(next level's spec, base cell id -> next level cell id)."""
+    nx, ny = -(-spec.nx // 2), -(-spec.ny // 2)
+    coarse = GridSpec(xmin=spec.xmin, ymin=spec.ymin, cell=spec.cell * 2, nx=nx, ny=ny)
+    cid = np.arange(spec.nx * spec.ny)
+    mapping = (cid // spec.nx // 2) * nx + (cid % spec.nx) // 2
+    return coarse, mapping
+
+
+def accumulate_frame(df: pd.DataFrame, spec: GridSpec, with_sketch: bool):
+    """(CellAccumulator, sketch or None) of a frame carrying grid_ix / grid_iy / Te_ppm."""
+    ncell = spec.nx * spec.ny
+    acc = CellAccumulator(ncell)
+    sketch = CellQuantileSketch(ncell) if with_sketch else None
+    if len(df):
+        cid = df["grid_iy"].to_numpy(dtype=np.int64) * spec.nx + df["grid_ix"].to_numpy(dtype=np.int64)
+        v = df["Te_ppm"].to_numpy(dtype=float)
+        acc.add(cid, v)
+        if sketch is not None:
+            sketch.add(cid, v)
+    return acc, sketch
+
+
+def frame_accumulators(df_o: pd.DataFrame, df_d: pd.DataFrame, spec: GridSpec, methods: Sequence[str]) -> Dict:
+    """{"orig"/"dl": (accumulator, sketch)} of two indexed frames, as stream_accumulate returns."""
+    with_sketch = needs_sketch(methods)
+    return {"orig": accumulate_frame(df_o, spec, with_sketch), "dl": accumulate_frame(df_d, spec, with_sketch)}
+
+
+def derive_levels(spec: GridSpec, accs: Dict, methods: Sequence[str], levels: int) -> List[Tuple[GridSpec, Dict]]:
+    """
+    [(spec_k, {method: (arr_orig, arr_dl, arr_cmp)})] for k = 1..levels,
+    merged from the base accumulators `accs`.
+    """
+    check_methods(methods)
+    out = []
+    for _ in range(levels):
+        spec, mapping = coarsen(spec)
+        ncell = spec.nx * spec.ny
+        accs = {
+            key: (acc.regroup(mapping, ncell), sketch.regroup(mapping, ncell) if sketch is not None else None)
+            for key, (acc, sketch) in accs.items()
+        }
+        out.append((spec, accumulator_results(spec, accs, methods)))
+    return out
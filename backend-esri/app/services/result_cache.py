@@ -0,0 +1,127 @@
+# app/services/result_cache.py
+"""
+Content-addressed on-disk cache for analysis responses.
+
+Keys are fingerprints of the uploaded bytes plus the request parameters,
+so an identical /comparison request is answered from disk without
+re-parsing or re-gridding. The cache is size-bounded and evicts the
+least-recently-used entries (by file mtime).
+
+The response cache is only written by the API process; compute workers
+hand their bodies back to it. Stores that workers write themselves (LOD
+points, projection memo) are separate ResultCache folders: writes go
+through per-process temp names and eviction tolerates files removed by
+another process. Hit / miss counters are per process.
+
+Configuration (environment):
+- RESULT_CACHE_DIR:    cache folder (default: <tmp>/esri-result-cache)
+- RESULT_CACHE_MAX_MB: total size of cached responses (default: 512)
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from fastapi import UploadFile
+
+_CHUNK = 1024 * 1024
+
+
+def fingerprint_uploads(uploads: Iterable[UploadFile], params: Dict) -> str:
+    """blake2b over each upload's bytes (streamed) plus the sorted params."""
+    h = hashlib.blake2b(digest_size=20)
+    for up in uploads:
+        up.file.seek(0)
+        for chunk in iter(lambda: up.file.read(_CHUNK), b""):
+            h.update(chunk)
+        up.file.seek(0)
+        h.update(b"\0")
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def derive_key(base_key: str, params: Dict) -> str:
+    """Key for `params` applied to the data behind `base_key` (no re-hashing of uploads)."""
+    h = hashlib.blake2b(base_key.encode(), digest_size=20)
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str, kind: str) -> Path:
+        return self.root / f"{kind}-{key}.bin"
+
+    def get(self, key: str, kind: str = "comparison") -> Optional[bytes]:
+        path = self._path(key, kind)
+        with self._lock:
+            try:
+                data = path.read_bytes()
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            try:
+                os.utime(path)
+            except FileNotFoundError:   # evicted by another process meanwhile
+                pass
+            return data
+
+    def put(self, key: str, data: bytes, kind: str = "comparison") -> None:
+        path = self._path(key, kind)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        with self._lock:
+            os.replace(tmp, path)
+            self._evict()
+
+    def _entries(self):
+        """(path, size, mtime) of every entry; files removed meanwhile are skipped."""
+        out = []
+        for p in self.root.glob("*.bin"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            out.append((p, st.st_size, st.st_mtime))
+        return out
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for p, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total <= self.max_bytes:
+                break
+            total -= size
+            p.unlink(missing_ok=True)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._entries()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+            }
+
+
+result_cache = ResultCache(
+    Path(os.environ.get("RESULT_CACHE_DIR", Path(tempfile.gettempdir()) / "esri-result-cache")),
+    int(os.environ.get("RESULT_CACHE_MAX_MB", "512")) * 1024 * 1024,
+)
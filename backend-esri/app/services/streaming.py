@@ -0,0 +1,367 @@
+# app/services/streaming.py
+"""
+Streaming (bounded-memory) grid comparison and column summaries.
+
+Instead of loading both datasets, points arrive as chunks of projected
+x / y / Te_ppm. Each chunk is spilled to a temporary file while the extent
+is tracked; once the grid is known the spill is read back in chunks and
+folded into per-cell accumulators. Memory therefore grows with the number
+of grid cells, not with the number of rows.
+
+Per cell the accumulators keep count, sum, sum of squares, min and max
+(exact mean / max), plus a mergeable quantile sketch for median, p10, p90
+and iqr.
+
+Quantile sketch error bound
+---------------------------
+Values are counted in logarithmic buckets (bucket i covers
+(gamma^(i-1), gamma^i] with gamma = (1 + alpha) / (1 - alpha)) and a
+bucket is represented by 2 * gamma^i / (gamma + 1). Any quantile read from
+the sketch is within a relative error of ``alpha`` (default 1%) of the
+exact order statistic, for values in [SKETCH_MIN, SKETCH_MAX]; values
+outside are clamped to the end buckets. Sketches merge by adding counts.
+Interpolated quantiles (numpy's "linear" method) keep the same bound.
+Assays are strictly positive here (see _prepare_points), as the log
+buckets require.
+
+summarize_stream() gives count / mean / median / max / std of one column in
+a single pass: Welford-style merged moments per chunk, and an exact median
+for up to EXACT_MEDIAN_MAX values, beyond which the same sketch is used.
+"""
+
+import os
+import tempfile
+from typing import Dict, Iterable, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.grid import GridSpec, cell_index, grid_spec_from_bounds
+from app.services.order_stats import QUANTILE_METHODS, _safe_diff
+
+SKETCH_ALPHA = 0.01
+SKETCH_MIN = 1e-9
+SKETCH_MAX = 1e9
+# Rows folded per step when replaying the spilled points
+REPLAY_ROWS = 1 << 18
+
+# Up to this many values /summary keeps them all for an exact median
+EXACT_MEDIAN_MAX = 1_000_000
+
+STREAMING_METHODS = ("mean", "median", "max", "p10", "p90", "iqr")
+
+
+class CellAccumulator:
+    """Exact running count / sum / sum of squares / min / max per cell."""
+
+    def __init__(self, ncell: int):
+        self.ncell = ncell
+        self.count = np.zeros(ncell)
+        self.sum = np.zeros(ncell)
+        self.sumsq = np.zeros(ncell)
+        self.min = np.full(ncell, np.inf)
+        self.max = np.full(ncell, -np.inf)
+
+    def add(self, cell_ids: np.ndarray, values: np.ndarray) -> None:
+        self.count += np.bincount(cell_ids, minlength=self.ncell)
+        self.sum += np.bincount(cell_ids, weights=values, minlength=self.ncell)
+        self.sumsq += np.bincount(cell_ids, weights=values * values, minlength=self.ncell)
+        np.minimum.at(self.min, cell_ids, values)
+        np.maximum.at(self.max, cell_ids, values)
+
+    def merge(self, other: "CellAccumulator") -> None:
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+
+    def regroup(self, mapping: np.ndarray, ncell: int) -> "CellAccumulator":
+        """Accumulator over `ncell` cells that merges cell i into cell mapping[i]."""
+        out = CellAccumulator(ncell)
+        out.count = np.bincount(mapping, weights=self.count, minlength=ncell)
+        out.sum = np.bincount(mapping, weights=self.sum, minlength=ncell)
+        out.sumsq = np.bincount(mapping, weights=self.sumsq, minlength=ncell)
+        np.minimum.at(out.min, mapping, self.min)
+        np.maximum.at(out.max, mapping, self.max)
+        return out
+
+    def stats(self) -> Dict[str, np.ndarray]:
+        """count, min, max, sum, mean, std (ddof=1) per cell; empty cells NaN."""
+        n = self.count
+        empty = n == 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = self.sum / n
+            var = (self.sumsq - n * mean * mean) / (n - 1)
+        std = np.sqrt(np.maximum(var, 0.0))
+        std[n < 2] = np.nan
+        out = {
+            "count": n.copy(),
+            "min": np.where(empty, np.nan, self.min),
+            "max": np.where(empty, np.nan, self.max),
+            "sum": np.where(empty, np.nan, self.sum),
+            "mean": mean,
+            "std": std,
+        }
+        out["mean"][empty] = np.nan
+        return out
+
+
+class CellQuantileSketch:
+    """
+    Per-cell log-bucket quantile sketch (relative error ``alpha``, see the
+    module docstring). Stored sparsely as sorted (cell, bucket) keys with
+    counts, so its size is bounded by cells x buckets, not by rows.
+    """
+
+    def __init__(self, ncell: int, alpha: float = SKETCH_ALPHA):
+        self.ncell = ncell
+        self.alpha = alpha
+        self._log_gamma = np.log((1 + alpha) / (1 - alpha))
+        self._lo = int(np.ceil(np.log(SKETCH_MIN) / self._log_gamma))
+        self._nb = int(np.ceil(np.log(SKETCH_MAX) / self._log_gamma)) - self._lo + 1
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def add(self, cell_ids: np.ndarray, values: np.ndarray) -> None:
+        v = np.clip(values, SKETCH_MIN, SKETCH_MAX)
+        bucket = np.ceil(np.log(v) / self._log_gamma).astype(np.int64) - self._lo
+        bucket = np.clip(bucket, 0, self._nb - 1)
+        keys, counts = np.unique(cell_ids.astype(np.int64) * self._nb + bucket, return_counts=True)
+        self._fold(keys, counts)
+
+    def merge(self, other: "CellQuantileSketch") -> None:
+        self._fold(other.keys, other.counts)
+
+    def regroup(self, mapping: np.ndarray, ncell: int) -> "CellQuantileSketch":
+        """Sketch over `ncell` cells that merges cell i into cell mapping[i]."""
+        out = CellQuantileSketch(ncell, self.alpha)
+        cell, bucket = self.keys // self._nb, self.keys % self._nb
+        out._fold(mapping[cell].astype(np.int64) * self._nb + bucket, self.counts)
+        return out
+
+    def _fold(self, keys: np.ndarray, counts: np.ndarray) -> None:
+        keys = np.concatenate((self.keys, keys))
+        counts = np.concatenate((self.counts, counts))
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts).astype(np.int64)
+
+    def _value(self, bucket: np.ndarray) -> np.ndarray:
+        gamma = np.exp(self._log_gamma)
+        return 2.0 * np.exp((bucket + self._lo) * self._log_gamma) / (gamma + 1.0)
+
+    def quantiles(self, qs: Sequence[float]) -> np.ndarray:
+        """(len(qs), ncell) quantiles, linearly interpolated between ranks; NaN where empty."""
+        qs = np.atleast_1d(np.asarray(qs, dtype=float))
+        out = np.full((len(qs), self.ncell), np.nan)
+        if len(self.keys) == 0:
+            return out
+        cell = self.keys // self._nb
+        bucket = self.keys % self._nb
+        cum = np.cumsum(self.counts)
+        cells, first = np.unique(cell, return_index=True)
+        n = np.bincount(cell, weights=self.counts)[cells].astype(np.int64)
+        before = cum[first] - self.counts[first]   # samples in earlier cells
+
+        def at_rank(rank):
+            # Bucket holding the rank-th (0-based) sample of each cell
+            pos = np.searchsorted(cum, before + rank, side="right")
+            return self._value(bucket[pos])
+
+        for i, q in enumerate(qs):
+            p = q * (n - 1)
+            lo = np.floor(p).astype(np.int64)
+            hi = np.minimum(lo + 1, n - 1)
+            v_lo, v_hi = at_rank(lo), at_rank(hi)
+            out[i, cells] = v_lo + (p - lo) * (v_hi - v_lo)
+        return out
+
+
+class _PointSpill:
+    """Projected points of one dataset in a temp file, with their running extent."""
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(suffix=".xyv")
+        self._fh = os.fdopen(fd, "wb")
+        self.rows = 0
+        self.bounds = [np.inf, np.inf, -np.inf, -np.inf]
+
+    def write(self, df: pd.DataFrame) -> None:
+        if not len(df):
+            return
+        xyv = df[["x", "y", "Te_ppm"]].to_numpy(dtype=np.float64)
+        self._fh.write(np.ascontiguousarray(xyv).tobytes())
+        self.rows += len(xyv)
+        b = self.bounds
+        self.bounds = [min(b[0], xyv[:, 0].min()), min(b[1], xyv[:, 1].min()),
+                       max(b[2], xyv[:, 0].max()), max(b[3], xyv[:, 1].max())]
+
+    def replay(self):
+        """Chunks of (x, y, v) read back from disk."""
+        self._fh.close()
+        if not self.rows:
+            return
+        data = np.memmap(self.path, dtype=np.float64, mode="r", shape=(self.rows, 3))
+        for start in range(0, self.rows, REPLAY_ROWS):
+            chunk = np.asarray(data[start:start + REPLAY_ROWS])
+            yield chunk[:, 0], chunk[:, 1], chunk[:, 2]
+        del data
+
+    def close(self) -> None:
+        if not self._fh.closed:
+            self._fh.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _accumulate(spill: _PointSpill, spec: GridSpec, with_sketch: bool):
+    ncell = spec.nx * spec.ny
+    acc = CellAccumulator(ncell)
+    sketch = CellQuantileSketch(ncell) if with_sketch else None
+    for x, y, v in spill.replay():
+        gx, gy = cell_index(x, y, spec)
+        cid = gy * spec.nx + gx
+        acc.add(cid, v)
+        if sketch is not None:
+            sketch.add(cid, v)
+    return acc, sketch
+
+
+def _method_arrays(acc: CellAccumulator, sketch, method: str, ny: int, nx: int) -> np.ndarray:
+    if method in ("mean", "max"):
+        arr = acc.stats()[method]
+    elif method == "median":
+        arr = sketch.quantiles((0.5,))[0]
+    else:
+        q = sketch.quantiles(QUANTILE_METHODS[method])
+        arr = q[1] - q[0] if method == "iqr" else q[0]
+    return arr.reshape(ny, nx)
+
+
+def accumulator_results(spec: GridSpec, accs: Dict, methods: Sequence[str]
+                        ) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """{method: (arr_orig, arr_dl, arr_cmp)} from {"orig"/"dl": (accumulator, sketch)}."""
+    results = {}
+    for m in methods:
+        arr_orig = _method_arrays(*accs["orig"], m, spec.ny, spec.nx)
+        arr_dl = _method_arrays(*accs["dl"], m, spec.ny, spec.nx)
+        results[m] = (arr_orig, arr_dl, _safe_diff(arr_orig, arr_dl))
+    return results
+
+
+def needs_sketch(methods: Sequence[str]) -> bool:
+    return any(m not in ("mean", "max") for m in methods)
+
+
+def stream_accumulate(
+    orig_chunks: Iterable[pd.DataFrame],
+    dl_chunks: Iterable[pd.DataFrame],
+    cell: float,
+    methods: Sequence[str],
+) -> Tuple[GridSpec, Dict]:
+    """
+    Grid both chunk streams (frames with x / y / Te_ppm) at `cell` size
+    -> (spec, {"orig"/"dl": (CellAccumulator, CellQuantileSketch or None)}).
+    """
+    unsupported = [m for m in methods if m not in STREAMING_METHODS]
+    if unsupported:
+        raise ValueError(f"Method(s) not available in streaming mode: {', '.join(unsupported)}")
+
+    spills = {"orig": _PointSpill(), "dl": _PointSpill()}
+    try:
+        for key, chunks in (("orig", orig_chunks), ("dl", dl_chunks)):
+            for df in chunks:
+                spills[key].write(df)
+        bounds = np.array([s.bounds for s in spills.values()])
+        spec = grid_spec_from_bounds(bounds[:, 0].min(), bounds[:, 1].min(),
+                                     bounds[:, 2].max(), bounds[:, 3].max(), cell)
+
+        with_sketch = needs_sketch(methods)
+        accs = {key: _accumulate(spill, spec, with_sketch) for key, spill in spills.items()}
+    finally:
+        for spill in spills.values():
+            spill.close()
+    return spec, accs
+
+
+def stream_compare(
+    orig_chunks: Iterable[pd.DataFrame],
+    dl_chunks: Iterable[pd.DataFrame],
+    cell: float,
+    methods: Sequence[str],
+) -> Tuple[GridSpec, Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+    """
+    Grid both chunk streams (frames with x / y / Te_ppm) at `cell` size
+    -> (spec, {method: (arr_orig, arr_dl, arr_cmp)}), empty cells NaN.
+    """
+    spec, accs = stream_accumulate(orig_chunks, dl_chunks, cell, methods)
+    return spec, accumulator_results(spec, accs, methods)
+
+
+class RunningMoments:
+    """Count / mean / M2 / max merged chunk by chunk (Chan et al.'s parallel Welford update)."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.max = -np.inf
+
+    def add(self, values: np.ndarray) -> None:
+        n_b = len(values)
+        if not n_b:
+            return
+        mean_b = float(values.mean())
+        m2_b = float(((values - mean_b) ** 2).sum())
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * self.n * n_b / n
+        self.n = n
+        self.max = max(self.max, float(values.max()))
+
+    @property
+    def std(self) -> float:
+        """Sample standard deviation (ddof=1), NaN below two values."""
+        return float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else float("nan")
+
+
+def summarize_stream(tables, column: str) -> Dict[str, float]:
+    """
+    count / mean / median / max / std of the positive values of `column`
+    over a stream of Arrow tables, keeping at most EXACT_MEDIAN_MAX values.
+    """
+    moments = RunningMoments()
+    kept = []
+    sketch = None
+    for table in tables:
+        v = table.column(column).to_numpy(zero_copy_only=False)
+        v = v[np.isfinite(v) & (v > 0)]
+        moments.add(v)
+        if sketch is not None:
+            sketch.add(np.zeros(len(v), dtype=np.int64), v)
+            continue
+        kept.append(v)
+        if moments.n > EXACT_MEDIAN_MAX:
+            # Too many values to keep: continue with the quantile sketch
+            sketch = CellQuantileSketch(1)
+            v = np.concatenate(kept)
+            sketch.add(np.zeros(len(v), dtype=np.int64), v)
+            kept = []
+
+    if moments.n == 0:
+        return {"count": 0, "mean": None, "median": None, "max": None, "std": None}
+    if sketch is None:
+        median = float(np.median(np.concatenate(kept)))
+    else:
+        median = float(sketch.quantiles((0.5,))[0, 0])
+    std = moments.std
+    return {
+        "count": moments.n,
+        "mean": moments.mean,
+        "median": median,
+        "max": moments.max,
+        "std": std if np.isfinite(std) else None,
+    }
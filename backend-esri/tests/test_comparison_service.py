@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+
+from app.services.comparison_service import comparison_body, encode_binary
+from app.services.grid import GridSpec
+
+
+def _decode(body: bytes):
+    """Reference GRF1 reader, written from the encode_binary docstring."""
+    assert body[:4] == b"GRF1"
+    hlen = int.from_bytes(body[4:8], "little")
+    header = json.loads(body[8:8 + hlen])
+    base = 8 + hlen
+    assert base % 8 == 0
+    arrays = {}
+    for e in header["arrays"]:
+        assert e["offset"] % 8 == 0
+        block = body[base + e["offset"]:base + e["offset"] + e["nbytes"]]
+        size = int(np.prod(e["shape"]))
+        if e["mask"] is None:
+            flat = np.frombuffer(block, dtype=e["dtype"], count=size)
+        else:
+            valid = np.unpackbits(np.frombuffer(block, np.uint8, count=e["mask_bytes"]),
+                                  count=size, bitorder="little").astype(bool)
+            start = e["mask_bytes"] + (-e["mask_bytes"] % 4)
+            flat = np.full(size, np.nan, dtype=e["dtype"])
+            flat[valid] = np.frombuffer(block, dtype=e["dtype"], count=e["count"], offset=start)
+        arrays[e["name"]] = flat.reshape(e["shape"])
+    return header["meta"], arrays
+
+
+def test_binary_round_trip_with_gaps():
+    rng = np.random.default_rng(0)
+    full = rng.normal(size=(3, 5))
+    gappy = rng.normal(size=(7, 3))
+    gappy[rng.random(gappy.shape) < 0.4] = np.nan
+    points = rng.normal(size=(11, 3))
+
+    meta, arrays = _decode(encode_binary({"method": "max"}, {"full": full, "gappy": gappy, "points": points}))
+    assert meta == {"method": "max"}
+    for name, arr in (("full", full), ("gappy", gappy), ("points", points)):
+        assert arrays[name].shape == arr.shape
+        assert np.allclose(arrays[name], arr.astype(np.float32), equal_nan=True)
+
+
+def test_binary_body_matches_json_body():
+    spec = GridSpec(xmin=0.0, ymin=0.0, cell=10.0, nx=3, ny=2)
+    arr = np.array([[1.0, np.nan, 3.0], [4.0, 5.0, np.nan]])
+    results = {"max": (arr, arr * 2, arr), "mean": (arr, arr, arr * 0)}
+
+    as_json = json.loads(comparison_body(spec, results, "max", ["mean"]))
+    meta, arrays = _decode(comparison_body(spec, results, "max", ["mean"], fmt="binary"))
+    assert meta["nx"] == as_json["nx"] == 3 and meta["method"] == "max"
+    to_list = lambda a: [[None if np.isnan(v) else float(v) for v in row] for row in a]
+    assert to_list(arrays["dl"]) == as_json["dl"]
+    assert to_list(arrays["results.mean.cmp"]) == as_json["results"]["mean"]["cmp"]
+    assert np.allclose(arrays["x"], as_json["x"])
@@ -0,0 +1,39 @@
+import io
+import threading
+from types import SimpleNamespace
+
+from app.services.dataset_store import DatasetStore
+
+
+class _SlowUpload(io.BytesIO):
+    """Upload body that stalls after its first chunk until `release` is set."""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def read(self, size=-1):
+        if self.tell() > 0:
+            self.started.set()
+            self.release.wait(10)
+        return super().read(min(size, 8) if size and size > 0 else 8)
+
+
+def test_sweep_leaves_a_dataset_being_copied_alone(tmp_path):
+    store = DatasetStore(tmp_path, max_bytes=0, ttl_seconds=0)   # everything idle is evictable
+    token = "ab" * 16
+    slow = _SlowUpload(b"x,Te_ppm\n1,2.5\n2,3.5\n")
+    uploads = {"original": SimpleNamespace(file=slow, filename="o.csv"),
+               "dl": SimpleNamespace(file=io.BytesIO(b"x,Te_ppm\n1,4.0\n"), filename="d.csv")}
+
+    copying = threading.Thread(target=store.register, args=(token, uploads))
+    copying.start()
+    assert slow.started.wait(10)
+    store.sweep()                                   # mid-copy: must not remove the folder
+    assert (tmp_path / token / "original.raw").exists()
+    slow.release.set()
+    copying.join(10)
+
+    assert store.frame(token, "original", ["Te_ppm"], numeric=True)["Te_ppm"].tolist() == [2.5, 3.5]
+    assert store.frame(token, "dl")["Te_ppm"].tolist() == [4.0]
@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import executor
+from app.services.executor import ComputeExecutor, compute_slot
+
+
+def test_compute_slot_rejects_when_full(monkeypatch):
+    compute = ComputeExecutor(workers=1, io_threads=1, max_queued=1, retry_after=7)
+    monkeypatch.setattr(executor, "compute", compute)
+
+    async def scenario():
+        slots = [compute_slot() for _ in range(2)]
+        for slot in slots:
+            await slot.__anext__()                        # admitted
+        with pytest.raises(HTTPException) as rejected:
+            await compute_slot().__anext__()
+        assert rejected.value.status_code == 503
+        assert rejected.value.headers == {"Retry-After": "7"}
+
+        assert compute.stats()["in_flight"] == 2
+
+        await slots[0].aclose()                           # request done -> slot freed
+        last = compute_slot()
+        await last.__anext__()
+        await last.aclose()
+        await slots[1].aclose()
+
+    asyncio.run(scenario())
+    stats = compute.stats()
+    assert stats["rejected"] == 1 and stats["in_flight"] == 0 and stats["capacity"] == 2
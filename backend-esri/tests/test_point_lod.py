@@ -0,0 +1,65 @@
+import numpy as np
+
+from app.services.point_lod import decimate
+
+
+def _bucket_max(points, budget, bbox):
+    """Max value per non-empty bucket of the grid decimate() lays over bbox."""
+    xmin, ymin, xmax, ymax = bbox
+    width, height = xmax - xmin, ymax - ymin
+    nx = max(1, int(np.sqrt(budget * width / height)))
+    ny = max(1, budget // nx)
+    bx = np.clip(((points[:, 0] - xmin) / width * nx).astype(int), 0, nx - 1)
+    by = np.clip(((points[:, 1] - ymin) / height * ny).astype(int), 0, ny - 1)
+    out = {}
+    for b, v in zip(by * nx + bx, points[:, 2]):
+        out[b] = max(out.get(b, -np.inf), v)
+    return out
+
+
+def test_decimate_keeps_each_buckets_extreme_point():
+    rng = np.random.default_rng(0)
+    points = np.column_stack([rng.uniform(0, 4000, 20000), rng.uniform(0, 1000, 20000),
+                              rng.lognormal(0, 2, 20000)])
+    bbox = (0.0, 0.0, 4000.0, 1000.0)
+    kept = decimate(points, 400, bbox)
+
+    assert len(kept) <= 400
+    assert points[:, 2].max() in kept[:, 2]               # the strongest anomaly survives
+    assert sorted(kept[:, 2]) == sorted(_bucket_max(points, 400, bbox).values())
+
+
+def test_decimate_viewport_and_small_inputs():
+    rng = np.random.default_rng(1)
+    points = np.column_stack([rng.uniform(0, 100, 500), rng.uniform(0, 100, 500), rng.random(500)])
+
+    assert decimate(points, 1000) is points               # under budget: unchanged
+    view = decimate(points, 50, (10.0, 10.0, 30.0, 20.0))
+    assert len(view) <= 50
+    assert ((view[:, 0] >= 10) & (view[:, 0] <= 30) & (view[:, 1] >= 10) & (view[:, 1] <= 20)).all()
+
+
+def test_points_are_stored_only_for_lod_requests(tmp_path, monkeypatch):
+    import json
+    import pandas as pd
+    from app.services import point_lod
+    from app.services.comparison_service import run_comparison
+    from app.services.point_lod import load_points
+    from app.services.result_cache import ResultCache
+
+    monkeypatch.setattr(point_lod, "point_store", ResultCache(tmp_path, 1 << 30))
+    rng = np.random.default_rng(2)
+    frame = lambda n: pd.DataFrame({"e": rng.uniform(0, 5000, n), "n": rng.uniform(0, 5000, n),
+                                    "te": rng.lognormal(0, 1, n)})
+    df_o, df_d = frame(3000), frame(2000)
+    cols = ["e", "n", "te"]
+    run = lambda budget, key: json.loads(run_comparison(df_o, df_d, cols, cols, "max", [], 1000.0, "meters",
+                                                        True, point_budget=budget, points_id=key)[0])
+
+    assert "points_id" not in run(0, "a" * 40)
+    assert load_points("a" * 40) is None and not list(tmp_path.iterdir())
+
+    body = run(500, "b" * 40)
+    stored = load_points(body["points_id"])
+    assert len(body["original_points"]) <= 500 and len(stored["original"]) == 3000
+    assert np.array_equal(stored["dl"][:, 2], df_d["te"].to_numpy())
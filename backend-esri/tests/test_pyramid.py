@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from app.services.comparisons import compare_many
+from app.services.grid import assign_grid_index, make_grid_spec
+from app.services.pyramid import coarsen, derive_levels, frame_accumulators
+from app.services.streaming import accumulator_results
+
+
+def _points(rng, n):
+    return pd.DataFrame({
+        "x": rng.uniform(0, 9000, n),
+        "y": rng.uniform(0, 5000, n),
+        "Te_ppm": rng.lognormal(0, 1, n),
+    })
+
+
+def test_derived_levels_match_direct_runs():
+    rng = np.random.default_rng(0)
+    orig, dl = _points(rng, 3000), _points(rng, 2000)
+    methods = ["max", "mean", "median"]
+    base = make_grid_spec([orig, dl], 700.0)
+    accs = frame_accumulators(assign_grid_index(orig, base), assign_grid_index(dl, base), base, methods)
+
+    spec = base
+    for level_spec, results in derive_levels(base, accs, methods, 3):
+        spec, _ = coarsen(spec)
+        assert level_spec == spec == make_grid_spec([orig, dl], spec.cell)
+
+        idx_o, idx_d = assign_grid_index(orig, spec), assign_grid_index(dl, spec)
+        direct = frame_accumulators(idx_o, idx_d, spec, methods)
+        exact = compare_many(idx_d, idx_o, spec.nx, spec.ny, ["max", "mean"])
+        for method in ("max", "mean"):
+            for got, want in zip(results[method], exact[method]):
+                assert np.allclose(got, want, equal_nan=True)
+
+        # Merged sketches hold exactly the counts a direct pass would
+        sketched = accumulator_results(spec, direct, ["median"])["median"]
+        for got, want in zip(results["median"], sketched):
+            assert np.allclose(got, want, equal_nan=True)
+
+
+def test_regrouped_counts_match_direct_counts():
+    rng = np.random.default_rng(1)
+    orig, dl = _points(rng, 1000), _points(rng, 800)
+    base = make_grid_spec([orig, dl], 300.0)
+    accs = frame_accumulators(assign_grid_index(orig, base), assign_grid_index(dl, base), base, ["max"])
+
+    spec, mapping = coarsen(base)
+    merged = accs["orig"][0].regroup(mapping, spec.nx * spec.ny)
+    direct = frame_accumulators(assign_grid_index(orig, spec), assign_grid_index(dl, spec), spec, ["max"])
+    assert np.array_equal(merged.count, direct["orig"][0].count)
+    assert merged.count.sum() == len(orig)
+
+
+def test_comparison_returns_level_bodies():
+    import json
+    from app.services.comparison_service import run_comparison
+
+    rng = np.random.default_rng(3)
+    frame = lambda n: _points(rng, n).rename(columns={"x": "e", "y": "n", "Te_ppm": "te"})
+    cols = ["e", "n", "te"]
+    body, levels = run_comparison(frame(500), frame(400), cols, cols, "max", ["mean"], 1000.0, "meters",
+                                  False, level_keys=["k1", "k2"])
+    assert [key for key, _ in levels] == ["k1", "k2"]
+    assert json.loads(body)["pyramid_cells"] == [2000.0, 4000.0]
+    assert [json.loads(b)["cell"] for _, b in levels] == [2000.0, 4000.0]
@@ -0,0 +1,23 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from app.services.result_cache import ResultCache
+
+
+def _fill(root: str, worker: int) -> int:
+    cache = ResultCache(root, max_bytes=20 * 1024)
+    for i in range(200):
+        cache.put(f"{worker}-{i % 7}", bytes(1024))
+        cache.stats()
+    return cache.evictions
+
+
+def test_workers_share_one_cache_folder(tmp_path):
+    # Several processes writing and evicting in one folder, as compute workers do
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context("spawn")) as pool:
+        evictions = list(pool.map(_fill, [tmp_path.as_posix()] * 4, range(4)))
+
+    assert sum(evictions) > 0
+    assert not list(tmp_path.glob("*.tmp"))
+    stats = ResultCache(tmp_path, max_bytes=20 * 1024).stats()
+    assert stats["entries"] == len(list(tmp_path.glob("*.bin"))) and stats["bytes"] <= 20 * 1024 + 4 * 1024
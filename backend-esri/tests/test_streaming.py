@@ -0,0 +1,81 @@
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from app.services import streaming
+from app.services.comparisons import compare_many
+from app.services.grid import assign_grid_index, make_grid_spec
+from app.services.streaming import SKETCH_ALPHA, CellQuantileSketch, stream_compare
+
+
+def _points(rng, n):
+    return pd.DataFrame({
+        "x": rng.uniform(0, 5000, n),
+        "y": rng.uniform(0, 3000, n),
+        "Te_ppm": rng.lognormal(0, 1.5, n),
+    })
+
+
+def test_sketch_quantiles_within_relative_error():
+    rng = np.random.default_rng(0)
+    ncell = 5
+    cells = rng.integers(0, ncell - 1, 20000)            # last cell stays empty
+    values = rng.lognormal(0, 2, len(cells))
+    qs = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+    sketch = CellQuantileSketch(ncell)
+    half = len(cells) // 2
+    sketch.add(cells[:half], values[:half])
+    other = CellQuantileSketch(ncell)
+    other.add(cells[half:], values[half:])
+    sketch.merge(other)
+
+    got = sketch.quantiles(qs)
+    for c in range(ncell - 1):
+        exact = np.quantile(values[cells == c], qs)
+        assert np.all(np.abs(got[:, c] - exact) <= SKETCH_ALPHA * exact)
+    assert np.isnan(got[:, ncell - 1]).all()
+
+
+def test_stream_compare_matches_in_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(streaming, "REPLAY_ROWS", 97)    # replay the spill in many chunks
+    monkeypatch.setattr(tempfile, "tempdir", tmp_path.as_posix())
+    rng = np.random.default_rng(1)
+    orig, dl = _points(rng, 1500), _points(rng, 1000)
+    chunks = lambda df: (df.iloc[i:i + 200] for i in range(0, len(df), 200))
+
+    spec, results = stream_compare(chunks(orig), chunks(dl), 1000.0, ["mean", "max", "median"])
+    assert spec == make_grid_spec([orig, dl], 1000.0)
+    assert not list(tmp_path.iterdir())                   # spill files removed
+
+    exact = compare_many(assign_grid_index(dl, spec), assign_grid_index(orig, spec),
+                         spec.nx, spec.ny, ["mean", "max", "median"])
+    for method in ("mean", "max"):
+        for got, want in zip(results[method], exact[method]):
+            assert np.allclose(got, want, equal_nan=True)
+    for got, want in zip(results["median"][:2], exact["median"][:2]):
+        ok = np.isfinite(want)
+        assert np.array_equal(np.isfinite(got), ok)
+        assert np.all(np.abs(got[ok] - want[ok]) <= SKETCH_ALPHA * want[ok])
+
+
+def test_summarize_stream_exact_and_sketched(monkeypatch):
+    import pyarrow as pa
+    from app.services.streaming import summarize_stream
+
+    rng = np.random.default_rng(2)
+    values = rng.lognormal(0, 1, 5000)
+    values[::50] = -1.0                                   # non-positive assays are ignored
+    tables = lambda: (pa.table({"Te": values[i:i + 700]}) for i in range(0, len(values), 700))
+    kept = values[values > 0]
+
+    exact = summarize_stream(tables(), "Te")
+    assert exact["count"] == len(kept) and exact["median"] == np.median(kept)
+    assert np.isclose(exact["mean"], kept.mean()) and np.isclose(exact["std"], kept.std(ddof=1))
+    assert exact["max"] == kept.max()
+
+    monkeypatch.setattr(streaming, "EXACT_MEDIAN_MAX", 1000)   # switch to the sketch mid-stream
+    sketched = summarize_stream(tables(), "Te")
+    assert sketched["count"] == exact["count"] and np.isclose(sketched["mean"], exact["mean"])
+    assert abs(sketched["median"] - exact["median"]) <= SKETCH_ALPHA * exact["median"]
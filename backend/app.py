@@ -1,9 +1,10 @@
 import os
-import time
 import sys
-import io
+import itertools
+import json
+import re
+import shutil
 from pathlib import Path
-import subprocess
 from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from zipfile import ZipFile, BadZipFile
@@ -12,6 +13,16 @@ import traceback
 
 # ---- Paths ----
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
+# make backend.* importable when started as `python backend/app.py`
+if PROJECT_ROOT.as_posix() not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT.as_posix())
+
+from backend.comparisons import COMPARISON_METHODS
+from backend.export import EXPORT_FORMATS, find_grid_file, iter_grid_export
+from backend.jobs import JobScheduler, QueueFull, is_job_id, new_job_id
+from backend.result_cache import ResultCache, fingerprint
+from backend.workers import get_pool
+
 BACKEND_DIR  = PROJECT_ROOT / "backend"
 UPLOAD_DIR   = BACKEND_DIR / "uploads"
 RESULTS_DIR  = BACKEND_DIR / "results"
@@ -22,22 +33,35 @@ RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 app = Flask(__name__)
 CORS(app)
 
-def _session_dir(base: Path) -> Path:
-    d = base / f"session_{time.strftime('%Y%m%d-%H%M%S')}"
-    d.mkdir(parents=True, exist_ok=True)
-    return d
+_scheduler: JobScheduler | None = None
+
+def _get_scheduler() -> JobScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = JobScheduler(get_pool(), RESULTS_DIR, cache=ResultCache(RESULTS_DIR / "cache"))
+    return _scheduler
 
 def _latest_session_dir() -> Path | None:
-    sessions = [p for p in RESULTS_DIR.glob("session_*") if p.is_dir()]
+    sessions = [
+        p for pattern in ("session_*", "job_*")
+        for p in RESULTS_DIR.glob(pattern)
+        if p.is_dir() and (p / "done.flag").exists()
+    ]
     if not sessions:
         return None
     return max(sessions, key=lambda p: p.stat().st_mtime)
 
+# Results folder names accepted by the export endpoint
+RESULT_DIR_RE = re.compile(r"^(session|job)_[A-Za-z0-9_-]+$")
+
 ALLOWED_DATA_EXTS = {".parquet", ".csv", ".geojson", ".json", ".shp"}
 
+# Archive members are copied in chunks of this size (bounded memory)
+COPY_CHUNK_BYTES = 1024 * 1024
+
 def _extract_if_zip(path: Path, dest_dir: Path) -> list[Path]:
     """If `path` is a .zip, extract its files into `dest_dir` and return the new file paths.
-       Otherwise return [path]."""
+       Otherwise return [path]. Members are streamed in COPY_CHUNK_BYTES chunks."""
     if path.suffix.lower() != ".zip":
         return [path]
     extracted = []
@@ -49,7 +73,7 @@ def _extract_if_zip(path: Path, dest_dir: Path) -> list[Path]:
                 safe_name = secure_filename(Path(name).name)
                 target = dest_dir / safe_name
                 with zf.open(name) as src, open(target, "wb") as dst:
-                    dst.write(src.read())
+                    shutil.copyfileobj(src, dst, COPY_CHUNK_BYTES)
                 extracted.append(target)
     except BadZipFile:
         raise ValueError(f"Uploaded file {path.name} is not a valid zip")
@@ -81,16 +105,40 @@ def _pick_two_inputs(candidates: list[Path]) -> tuple[Path, Path]:
         return orig, dl
     return data[0], data[1]
 
-@app.post("/run-comparison")
-def run_comparison():
-    files = request.files.getlist("files")
-    if len(files) != 2:
-        return jsonify({"status": "error", "message": "Upload exactly 2 files"}), 400
-
-    upload_dir = _session_dir(UPLOAD_DIR)
-    out_dir    = _session_dir(RESULTS_DIR)
+def _job_params(form) -> dict:
+    """Optional pipeline parameters from the request form."""
+    methods = form.getlist("method") or ["max"]
+    unknown = [m for m in methods if m not in COMPARISON_METHODS]
+    if unknown:
+        raise ValueError(f"unknown method(s) {', '.join(unknown)}; choose from {', '.join(sorted(COMPARISON_METHODS))}")
+    params = {
+        "cell_km": int(form.get("cell_km", 100)),
+        "methods": methods,
+        "sparse": form.get("sparse", "").lower() in ("1", "true", "yes"),
+    }
+    if params["cell_km"] <= 0:
+        raise ValueError("cell_km must be positive")
+    # Output file: one grid table (default) or the legacy split GeoParquets
+    params["layout"] = form.get("layout", "table")
+    if params["layout"] not in ("table", "split"):
+        raise ValueError(f"layout must be 'table' or 'split', not {params['layout']!r}")
+    if params["sparse"] and params["layout"] == "split":
+        raise ValueError("sparse needs layout 'table'; the split layout always writes every cell")
+    params["geometry"] = form.get("geometry", "").lower() in ("1", "true", "yes")
+    if form.get("compression"):
+        params["compression"] = form["compression"]
+    if form.get("row_group_size"):
+        params["row_group_size"] = int(form["row_group_size"])
+    # Grid-size sweep: repeated or comma-separated sweep_km values
+    sweep = [int(v) for item in form.getlist("sweep_km") for v in item.split(",") if v.strip()]
+    if any(v <= 0 for v in sweep):
+        raise ValueError("sweep_km values must be positive")
+    if sweep:
+        params["sweep_km"] = sorted(set(sweep))
+    return params
 
-    # Save uploads (secure file names)
+def _stage_uploads(files, upload_dir: Path) -> tuple[Path, Path]:
+    """Save uploads (secure names), expand zips and pick orig & dl."""
     saved_paths = []
     for f in files:
         fname = secure_filename(f.filename)
@@ -98,115 +146,222 @@ def run_comparison():
         f.save(dest.as_posix())
         saved_paths.append(dest)
 
-    # Expand any zips into the same session upload dir
+    # Expand any zips into the same upload dir
     expanded = []
     for p in saved_paths:
         expanded.extend(_extract_if_zip(p, upload_dir))
 
-    # Pick orig & dl from the expanded list
+    return _pick_two_inputs(expanded)
+
+def _submit_job(files, form):
+    """Stage uploads and queue a job -> (job, None) or (None, error response)."""
+    if len(files) != 2:
+        return None, (jsonify({"status": "error", "message": "Upload exactly 2 files"}), 400)
     try:
-        orig, dl = _pick_two_inputs(expanded)
+        params = _job_params(form)
     except ValueError as e:
-        return jsonify({"status": "error", "message": str(e)}), 400
+        return None, (jsonify({"status": "error", "message": f"Bad parameter: {e}"}), 400)
 
-    env = os.environ.copy()
-    env["PYTHONPATH"] = (
-        f"{PROJECT_ROOT.as_posix()}:{env.get('PYTHONPATH', '')}"
-        if env.get("PYTHONPATH") else PROJECT_ROOT.as_posix()
-    )
-
-    cmd = [
-        sys.executable, "-m", "backend.pipeline.run_comparison",
-        "--orig", orig.as_posix(),
-        "--dl",   dl.as_posix(),
-        "--out",  out_dir.as_posix(),
-        "--cell-km", "100",
-        "--method", "max",
-    ]
+    job_id = new_job_id()
+    upload_dir = UPLOAD_DIR / f"job_{job_id}"
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        orig, dl = _stage_uploads(files, upload_dir)
+    except (ValueError, IndexError) as e:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        return None, (jsonify({"status": "error", "message": str(e)}), 400)
 
     try:
-        proc = subprocess.run(
-            cmd, cwd=PROJECT_ROOT.as_posix(),
-            env=env, capture_output=True, text=True
+        # The scheduler deletes upload_dir once the job no longer needs it
+        job = _get_scheduler().submit(
+            job_id,
+            {"orig_path": orig.as_posix(), "dl_path": dl.as_posix(), **params},
+            inputs={"orig": orig.name, "dl": dl.name},
+            cache_key=fingerprint([orig, dl], params),
+            staged=upload_dir,
         )
-    except Exception as e:
-        return jsonify({"status": "error", "message": f"Failed to start pipeline: {e}"}), 500
+    except QueueFull as e:
+        resp = jsonify({"status": "error", "message": f"Server busy: {e}"})
+        return None, (resp, 503, {"Retry-After": "30"})
+    return job, None
+
+@app.post("/run-comparison")
+def run_comparison():
+    """Synchronous variant: queue the job and wait for it to finish."""
+    job, error = _submit_job(request.files.getlist("files"), request.form)
+    if error:
+        return error
 
-    if proc.returncode != 0:
+    job = _get_scheduler().wait(job.job_id)
+    if job.state != "done":
         return jsonify({
             "status": "error",
-            "message": "Pipeline failed",
-            "stderr": proc.stderr,
-            "stdout": proc.stdout,
+            "job_id": job.job_id,
+            "message": job.message,
+            "traceback": job.error,
         }), 500
 
-    outputs = {
-        "orig_grid": (out_dir / "orig_grid.parquet").as_posix(),
-        "dl_grid":   (out_dir / "dl_grid.parquet").as_posix(),
-        "comp_grid": (out_dir / "comp_grid.parquet").as_posix(),
-        "flag":      (out_dir / "done.flag").as_posix(),
-    }
+    return jsonify({
+        "status": "ok",
+        "job_id": job.job_id,
+        "cached": job.cached,
+        "message": job.message,
+        "inputs": job.inputs,
+        "outputs": job.outputs,
+    })
+
+@app.post("/sweep")
+def run_sweep():
+    """
+    Synchronous grid-size sweep (sweep_km=5,10,25,...): per-size grids plus
+    a summary of delta statistics versus cell size.
+    """
+    if not request.form.get("sweep_km"):
+        return jsonify({"status": "error", "message": "Provide sweep_km (cell sizes in km)"}), 400
+    job, error = _submit_job(request.files.getlist("files"), request.form)
+    if error:
+        return error
+
+    job = _get_scheduler().wait(job.job_id)
+    if job.state != "done":
+        return jsonify({
+            "status": "error",
+            "job_id": job.job_id,
+            "message": job.message,
+            "traceback": job.error,
+        }), 500
 
+    import pandas as pd
+    summary = pd.read_parquet(job.outputs["sweep_summary"])
     return jsonify({
         "status": "ok",
-        "message": "Finished: wrote 3 grids + done.flag",
-        "inputs": {"orig": orig.name, "dl": dl.name},
-        "outputs": outputs,
-        "stdout": proc.stdout,
+        "job_id": job.job_id,
+        "cached": job.cached,
+        "message": job.message,
+        "inputs": job.inputs,
+        "outputs": job.outputs,
+        "summary": summary.astype(object).where(summary.notna(), None).to_dict("records"),
+    })
+
+@app.post("/jobs")
+def submit_job():
+    """Queue a comparison; poll GET /jobs/<id> and fetch GET /jobs/<id>/result."""
+    job, error = _submit_job(request.files.getlist("files"), request.form)
+    if error:
+        return error
+    return jsonify({
+        "status": "ok",
+        "job_id": job.job_id,
+        "state": job.state,
+        "status_url": f"/jobs/{job.job_id}",
+        "result_url": f"/jobs/{job.job_id}/result",
+    }), 202
+
+@app.get("/jobs/<job_id>")
+def job_status(job_id):
+    job = _get_scheduler().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify({
+        "status": "ok",
+        "job_id": job.job_id,
+        "state": job.state,
+        "stage": job.stage,
+        "message": job.message,
     })
 
+@app.get("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = _get_scheduler().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    if job.state == "error":
+        return jsonify({"status": "error", "job_id": job_id, "message": job.message, "traceback": job.error}), 500
+    if job.state != "done":
+        return jsonify({"status": "pending", "job_id": job_id, "state": job.state, "stage": job.stage}), 409
+    return jsonify({
+        "status": "ok",
+        "job_id": job_id,
+        "cached": job.cached,
+        "message": job.message,
+        "inputs": job.inputs,
+        "params": job.params,
+        "outputs": job.outputs,
+    })
+
+@app.get("/cache/stats")
+def cache_stats():
+    return jsonify({"status": "ok", **_get_scheduler().cache.stats()})
+
 @app.get("/results/latest")
 def latest_results():
     d = _latest_session_dir()
     if not d:
         return jsonify({"status": "error", "message": "No results yet"}), 404
+    record = d / "job.json"
+    if record.exists():
+        outputs = json.loads(record.read_text()).get("outputs") or {}
+    else:
+        outputs = {p.stem: p.as_posix() for p in sorted(d.glob("*.parquet"))}
+        outputs["flag"] = (d / "done.flag").as_posix()
     return jsonify({
         "status": "ok",
         "session_dir": d.as_posix(),
-        "outputs": {
-            "orig_grid": (d / "orig_grid.parquet").as_posix(),
-            "dl_grid":   (d / "dl_grid.parquet").as_posix(),
-            "comp_grid": (d / "comp_grid.parquet").as_posix(),
-            "flag":      (d / "done.flag").as_posix(),
-        }
+        "outputs": outputs,
     })
 
+def _result_dir(run_id: str) -> Path | None:
+    """Finished results folder of "latest", a job id or a session_*/job_* folder name."""
+    if run_id == "latest":
+        return _latest_session_dir()
+    if is_job_id(run_id):
+        d = _get_scheduler().job_dir(run_id)
+    elif RESULT_DIR_RE.match(run_id):
+        d = RESULTS_DIR / run_id
+    else:
+        return None
+    return d if (d / "done.flag").exists() else None
+
 @app.get("/export/comp-grid.csv")
 def export_comp_grid_csv():
-    d = _latest_session_dir()
+    """Latest result as CSV (kept for existing links)."""
+    return export_grid("latest", "csv")
+
+@app.get("/export/<run_id>/comp-grid.<fmt>")
+def export_grid(run_id, fmt):
+    """
+    Stream a result grid (run_id: "latest", a job id or a session folder)
+    as csv, arrow or parquet; ?cell_km= picks one size of a sweep.
+    """
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"status": "error", "message": f"Unknown format '{fmt}'"}), 400
+    d = _result_dir(run_id)
     if not d:
         return jsonify({"status": "error", "message": "No results"}), 404
-
-    comp_path = d / "comp_grid.parquet"
-    if not comp_path.exists():
-        return jsonify({"status": "error", "message": "comp_grid.parquet missing"}), 404
-
     try:
-        import geopandas as gpd
-    except ImportError:
-        return jsonify({"status": "error", "message": "Missing geopandas"}), 500
+        cell_km = request.args.get("cell_km", type=int)
+        path = find_grid_file(d, cell_km)
+        if path is None:
+            return jsonify({"status": "error", "message": "Result grid missing"}), 404
 
-    try:
-        gdf = gpd.read_parquet(comp_path.as_posix())
-        if "cell_id" not in gdf.columns:
-            gdf = gdf.reset_index().rename(columns={"index": "cell_id"})
-        centroids = gdf.geometry.centroid
-        out_df = gdf.drop(columns=["geometry"], errors="ignore").copy()
-        out_df["centroid_x"] = centroids.x
-        out_df["centroid_y"] = centroids.y
-
-        csv_buf = io.StringIO()
-        out_df.to_csv(csv_buf, index=False)
-        csv_buf.seek(0)
-        filename = f"comp_grid_{d.name}.csv"
-        return Response(
-            csv_buf.getvalue(),
-            mimetype="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        chunks = iter_grid_export(path, fmt)
+        first = next(chunks, b"")   # surface read errors before the response starts
     except Exception as e:
         return jsonify({"status": "error", "message": f"Export failed: {e}"}), 500
 
+    mimetype, ext = EXPORT_FORMATS[fmt]
+    filename = f"comp_grid_{d.name}{f'_{cell_km}km' if cell_km else ''}.{ext}"
+    return Response(
+        itertools.chain([first], chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
 if __name__ == "__main__":
+    debug = True
+    # The debug reloader re-runs this file in a child process (WERKZEUG_RUN_MAIN
+    # set) that does the serving; the watching parent must not start workers
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        _get_scheduler()  # start the warm workers before serving
     port = int(os.environ.get("PORT", "5000"))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    app.run(host="0.0.0.0", port=port, debug=debug)
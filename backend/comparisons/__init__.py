@@ -1,2 +1,5 @@
-# mark 'backend.comparisons' as a package
-# (we can also re-export helpers here later if we add more methods)
+# mark 'backend.comparisons' as a package and re-export the method registry
+from backend.comparisons.aggregate import STATS, aggregate_pair
+from backend.comparisons.max_per_cell import COMPARISON_METHODS, compare, compare_many
+
+__all__ = ["COMPARISON_METHODS", "STATS", "aggregate_pair", "compare", "compare_many"]
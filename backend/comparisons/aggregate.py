@@ -0,0 +1,74 @@
+# aggregate.py
+"""
+Fused per-cell aggregation: one sort of (cell id, value) per dataset (see
+order_stats.py) yields count, min, max, sum, mean, std and median for every
+grid cell at once.
+
+    aggregate_pair(dl_gdf_idx, orig_gdf_idx, nx, ny) -> {"orig": stats, "dl": stats}
+
+where ``stats`` maps each name in ``STATS`` to a dense (ny, nx) array.
+Empty cells are NaN (count is 0); std uses ddof=1 like pandas, so cells
+with a single sample have NaN std.
+"""
+
+import numpy as np
+
+from backend.comparisons.order_stats import Segments, segment_sort, segments_from_gdf
+
+STATS = ("count", "min", "max", "sum", "mean", "std", "median")
+
+
+def aggregate_segments(seg: Segments):
+    """All ``STATS`` as dense 1D arrays of length ``seg.ncell`` from sorted segments."""
+    ncell = seg.ncell
+    out = {name: np.full(ncell, np.nan, dtype=float) for name in STATS}
+    out["count"] = np.zeros(ncell, dtype=float)
+    if len(seg.cells) == 0:
+        return out
+
+    v = seg.values
+    n = seg.counts
+    start = seg.offsets[:-1]
+    end = seg.offsets[1:] - 1
+
+    total = np.add.reduceat(v, start)
+    mean = total / n
+    # Two-pass variance: squared deviations from each sample's cell mean
+    dev = v - np.repeat(mean, n)
+    ss = np.add.reduceat(dev * dev, start)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = np.sqrt(ss / (n - 1))
+    std[n < 2] = np.nan
+
+    out["count"][seg.cells] = n
+    out["min"][seg.cells] = v[start]
+    out["max"][seg.cells] = v[end]
+    out["sum"][seg.cells] = total
+    out["mean"][seg.cells] = mean
+    out["std"][seg.cells] = std
+    out["median"][seg.cells] = 0.5 * (v[start + (n - 1) // 2] + v[start + n // 2])
+    return out
+
+
+def aggregate_cells(cell_ids, values, ncell):
+    """
+    Aggregate ``values`` by ``cell_ids`` into dense 1D arrays of length ``ncell``.
+    Non-finite values are ignored (as pandas groupby skips NaN).
+    """
+    return aggregate_segments(segment_sort(cell_ids, values, ncell))
+
+
+def aggregate_pair(dl_gdf_idx, orig_gdf_idx, nx, ny, value_col="Te_ppm", segments=None):
+    """
+    All ``STATS`` for Original and DL in one call: {"orig": {...}, "dl": {...}}.
+    ``segments`` may pass pre-sorted {"orig": Segments, "dl": Segments}.
+    """
+    if segments is None:
+        segments = {
+            "orig": segments_from_gdf(orig_gdf_idx, nx, ny, value_col),
+            "dl": segments_from_gdf(dl_gdf_idx, nx, ny, value_col),
+        }
+    return {
+        key: {name: arr.reshape(ny, nx) for name, arr in aggregate_segments(seg).items()}
+        for key, seg in segments.items()
+    }
@@ -1,28 +1,36 @@
 # max_per_cell.py
 """
-Comparison methods (currently only MAX) for grid-based geochemical data.
+Per-cell comparison methods (max, mean, median) plus the method registry
+for every method in the package.
+
+Each function follows the same interface:
+
+    compare_fn(dl_gdf_idx, orig_gdf_idx, nx, ny) -> (arr_orig, arr_dl, arr_cmp)
+
+chi2 appends a fourth array, the per-cell p-values.
+
+Available methods: max, mean, median, p10, p90, iqr, ks, chi2
 """
 
 import numpy as np
 
+from backend.comparisons.aggregate import aggregate_pair
+from backend.comparisons.chi2 import chi_squared_test
+from backend.comparisons.order_stats import (
+    QUANTILE_METHODS, iqr_diff, ks_from_segments, ks_test, p10_diff, p90_diff,
+    quantile_diff_from_segments, segments_from_gdf,
+)
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Internal helper
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _fill_stat_array(gdf, nx, ny, stat_func):
-    """Helper: compute grid-wise stats and return a filled 2D array."""
-    arr = np.zeros((ny, nx), dtype=float)
-    if len(gdf) > 0:
-        gid = gdf['grid_iy'].values * nx + gdf['grid_ix'].values
-        stat = (
-            gdf.assign(grid_id=gid)
-               .groupby('grid_id')['Te_ppm']
-               .agg(stat_func)
-        )
-        iy = (stat.index.values // nx).astype(int)
-        ix = (stat.index.values % nx).astype(int)
-        arr[iy, ix] = stat.values
-    return arr
+def _diff_from_stats(stats, stat):
+    """(arr_orig, arr_dl, DL – Original) for one statistic; empty cells are 0."""
+    arr_orig = np.nan_to_num(stats["orig"][stat], nan=0.0)
+    arr_dl   = np.nan_to_num(stats["dl"][stat], nan=0.0)
+    arr_cmp  = arr_dl - arr_orig
+    return arr_orig, arr_dl, arr_cmp
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -31,19 +39,64 @@ def _fill_stat_array(gdf, nx, ny, stat_func):
 
 def max_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
     """Grid-wise maximum (DL – Original)."""
-    arr_orig = _fill_stat_array(orig_gdf_idx, nx, ny, "max")
-    arr_dl   = _fill_stat_array(dl_gdf_idx, nx, ny, "max")
-    arr_cmp  = arr_dl - arr_orig
-    return arr_orig, arr_dl, arr_cmp
+    return _diff_from_stats(aggregate_pair(dl_gdf_idx, orig_gdf_idx, nx, ny), "max")
+
+
+def mean_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
+    """Grid-wise mean (DL – Original)."""
+    return _diff_from_stats(aggregate_pair(dl_gdf_idx, orig_gdf_idx, nx, ny), "mean")
+
+
+def median_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
+    """Grid-wise median (DL – Original)."""
+    return _diff_from_stats(aggregate_pair(dl_gdf_idx, orig_gdf_idx, nx, ny), "median")
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Registry
 # ─────────────────────────────────────────────────────────────────────────────
 
 COMPARISON_METHODS = {
-    "max": max_diff
+    "max": max_diff,
+    "mean": mean_diff,
+    "median": median_diff,
+    "p10": p10_diff,
+    "p90": p90_diff,
+    "iqr": iqr_diff,
+    "ks": ks_test,
+    "chi2": chi_squared_test,
 }
 
+# Methods that are a single statistic of the fused aggregation pass
+AGGREGATE_METHODS = {"max", "mean", "median"}
+
 def compare(orig_gdf_idx, dl_gdf_idx, nx, ny, method="max"):
     fn = COMPARISON_METHODS[method]
     return fn(dl_gdf_idx, orig_gdf_idx, nx, ny)
+
+
+def compare_many(orig_gdf_idx, dl_gdf_idx, nx, ny, methods=("max",)):
+    """
+    Run several methods at once -> {method: (arr_orig, arr_dl, arr_cmp)}.
+    Aggregate, quantile and KS methods share one (cell, value) sort per dataset.
+    """
+    segs = None
+    stats = None
+    results = {}
+    for method in methods:
+        if method in AGGREGATE_METHODS or method in QUANTILE_METHODS or method == "ks":
+            if segs is None:
+                segs = {
+                    "orig": segments_from_gdf(orig_gdf_idx, nx, ny),
+                    "dl": segments_from_gdf(dl_gdf_idx, nx, ny),
+                }
+        if method in AGGREGATE_METHODS:
+            if stats is None:
+                stats = aggregate_pair(dl_gdf_idx, orig_gdf_idx, nx, ny, segments=segs)
+            results[method] = _diff_from_stats(stats, method)
+        elif method in QUANTILE_METHODS:
+            results[method] = quantile_diff_from_segments(segs["orig"], segs["dl"], nx, ny, method)
+        elif method == "ks":
+            results[method] = ks_from_segments(segs["orig"], segs["dl"], nx, ny)
+        else:
+            results[method] = compare(orig_gdf_idx, dl_gdf_idx, nx, ny, method=method)
+    return results
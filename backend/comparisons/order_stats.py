@@ -0,0 +1,227 @@
+# order_stats.py
+"""
+Segmented order statistics per grid cell.
+
+Samples are sorted once by (cell, value) and described CSR-style: the
+values of occupied cell ``cells[k]`` are ``values[offsets[k]:offsets[k+1]]``
+in ascending order. From that layout any list of quantiles and a per-cell
+two-sample Kolmogorov–Smirnov statistic (Original vs DL) are array ops.
+
+Comparison methods registered from here:
+- p10, p90: grid-wise 10th / 90th percentile (DL – Original)
+- iqr:      grid-wise inter-quartile range (DL – Original)
+- ks:       arr_orig / arr_dl = sample counts, arr_cmp = KS statistic D
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+_LOW32 = np.int64(0xFFFFFFFF)
+
+
+@dataclass
+class Segments:
+    values: np.ndarray    # sorted by (cell, value)
+    cells: np.ndarray     # occupied cell ids, ascending
+    offsets: np.ndarray   # CSR offsets, len(cells) + 1
+    ncell: int
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+
+def sort_by_cell_value(cell_ids, values):
+    """
+    Permutation that orders samples by (cell, value).
+
+    Equivalent to ``np.lexsort((values, cell_ids))`` but several times faster:
+    one float argsort gives value ranks, then (cell << 32 | rank) is a
+    single int64 key that a plain ``np.sort`` orders. Values that are
+    already ascending (e.g. points pre-sorted once for a grid-size sweep)
+    skip the argsort.
+    """
+    cell_ids = np.asarray(cell_ids, dtype=np.int64)
+    n = len(values)
+    if n >= 2**32 or (n and cell_ids.max() >= 2**31):
+        return np.lexsort((values, cell_ids))
+    if n and (values[1:] >= values[:-1]).all():
+        by_value = np.arange(n)
+    else:
+        by_value = np.argsort(values)
+    key = (cell_ids[by_value] << 32) | np.arange(n, dtype=np.int64)
+    key.sort()
+    return by_value[key & _LOW32]
+
+
+def _csr(sorted_cells, ncell):
+    counts = np.bincount(sorted_cells, minlength=ncell)
+    cells = np.flatnonzero(counts)
+    offsets = np.concatenate(([0], np.cumsum(counts[cells])))
+    return cells, offsets
+
+
+def segment_sort(cell_ids, values, ncell) -> Segments:
+    """Build Segments from per-sample cell ids and values (non-finite values dropped)."""
+    cell_ids = np.asarray(cell_ids, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    ok = np.isfinite(values)
+    if not ok.all():
+        cell_ids, values = cell_ids[ok], values[ok]
+    perm = sort_by_cell_value(cell_ids, values)
+    cells, offsets = _csr(cell_ids[perm], ncell)
+    return Segments(values=values[perm], cells=cells, offsets=offsets, ncell=ncell)
+
+
+def segments_from_gdf(gdf, nx, ny, value_col="Te_ppm") -> Segments:
+    """Segments for a frame carrying grid_ix / grid_iy columns."""
+    if gdf is None or len(gdf) == 0:
+        return segment_sort(np.empty(0, np.int64), np.empty(0), nx * ny)
+    cid = gdf["grid_iy"].values.astype(np.int64) * nx + gdf["grid_ix"].values
+    return segment_sort(cid, gdf[value_col].to_numpy(dtype=float), nx * ny)
+
+
+def segment_quantiles(seg: Segments, qs) -> np.ndarray:
+    """
+    Quantiles per cell -> (len(qs), ncell) array, NaN for empty cells.
+    Uses linear interpolation (numpy's default ``method="linear"``).
+    """
+    qs = np.atleast_1d(np.asarray(qs, dtype=float))
+    out = np.full((len(qs), seg.ncell), np.nan)
+    if len(seg.cells) == 0:
+        return out
+    start = seg.offsets[:-1]
+    n = seg.counts
+    for i, q in enumerate(qs):
+        pos = q * (n - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, n - 1)
+        frac = pos - lo
+        v_lo = seg.values[start + lo]
+        v_hi = seg.values[start + hi]
+        out[i, seg.cells] = v_lo + frac * (v_hi - v_lo)
+    return out
+
+
+def _merge_segments(seg_a: Segments, seg_b: Segments) -> np.ndarray:
+    """
+    Permutation merging two (cell, value)-sorted sample arrays (a first,
+    then b) into one (cell, value)-sorted order. Keys are ``cell + 1j *
+    value``, which numpy orders by real then imaginary part; a stable sort
+    of two presorted runs is a linear-time merge (timsort), not a re-sort.
+    """
+    n_a = len(seg_a.values)
+    keys = np.empty(n_a + len(seg_b.values), dtype=np.complex128)
+    keys.real[:n_a] = np.repeat(seg_a.cells, seg_a.counts)
+    keys.real[n_a:] = np.repeat(seg_b.cells, seg_b.counts)
+    keys.imag[:n_a] = seg_a.values
+    keys.imag[n_a:] = seg_b.values
+    return np.argsort(keys, kind="stable")
+
+
+def segment_ks(seg_a: Segments, seg_b: Segments) -> np.ndarray:
+    """
+    Two-sample KS statistic D = sup |F_a - F_b| per cell (NaN unless both
+    datasets have samples in the cell). Both ECDFs are evaluated on the
+    pooled samples, merged from the two sorted inputs; only the last of a
+    run of tied values counts, so ties are handled exactly.
+
+    The gap is kept as the integer |r_a * n_b - r_b * n_a| (r = within-cell
+    rank, n = cell count) and divided by n_a * n_b once per cell. With C the
+    pooled cumulative a-count, P the 1-based pooled position, S the cell
+    start and N = n_a + n_b it is |C * N - P * n_a - (C[S] * N - S * n_a)|.
+    """
+    ncell = seg_a.ncell
+    d = np.full(ncell, np.nan)
+    na = np.zeros(ncell, dtype=np.int64)
+    nb = np.zeros(ncell, dtype=np.int64)
+    na[seg_a.cells] = seg_a.counts
+    nb[seg_b.cells] = seg_b.counts
+    if not ((na > 0) & (nb > 0)).any():
+        return d
+    cells = np.flatnonzero(na + nb)
+    na, nb = na[cells], nb[cells]
+
+    perm = _merge_segments(seg_a, seg_b)
+    vals = np.concatenate((seg_a.values, seg_b.values))[perm]
+    cum_a = np.cumsum(perm < len(seg_a.values), dtype=np.int64)
+    del perm
+
+    counts = na + nb
+    start = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    offset = np.concatenate(([0], cum_a))[start] * counts - start * na
+    gap = cum_a * np.repeat(counts, counts)
+    gap -= np.arange(1, len(vals) + 1) * np.repeat(na, counts)
+    gap -= np.repeat(offset, counts)
+    np.abs(gap, out=gap)
+
+    tied = np.zeros(len(vals), dtype=bool)
+    tied[:-1] = vals[1:] == vals[:-1]
+    tied[start[1:] - 1] = False                           # cell boundaries
+    gap[tied] = 0
+
+    both = (na > 0) & (nb > 0)
+    d[cells[both]] = np.maximum.reduceat(gap, start)[both] / (na * nb)[both]
+    return d
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Comparison methods
+# ─────────────────────────────────────────────────────────────────────────────
+
+QUANTILE_METHODS = {"p10": (0.10,), "p90": (0.90,), "iqr": (0.25, 0.75)}
+
+
+def quantile_diff_from_segments(seg_o: Segments, seg_d: Segments, nx, ny, method):
+    """(arr_orig, arr_dl, DL – Original) for a method in QUANTILE_METHODS; empty cells are 0."""
+    qs = QUANTILE_METHODS[method]
+    q_o = segment_quantiles(seg_o, qs)
+    q_d = segment_quantiles(seg_d, qs)
+    if method == "iqr":
+        arr_orig, arr_dl = q_o[1] - q_o[0], q_d[1] - q_d[0]
+    else:
+        arr_orig, arr_dl = q_o[0], q_d[0]
+    arr_orig = np.nan_to_num(arr_orig, nan=0.0).reshape(ny, nx)
+    arr_dl   = np.nan_to_num(arr_dl, nan=0.0).reshape(ny, nx)
+    return arr_orig, arr_dl, arr_dl - arr_orig
+
+
+def ks_from_segments(seg_o: Segments, seg_d: Segments, nx, ny):
+    """(n_orig, n_dl, KS statistic) per cell; untested cells have D = 0."""
+    n_o = np.zeros(seg_o.ncell)
+    n_d = np.zeros(seg_d.ncell)
+    n_o[seg_o.cells] = seg_o.counts
+    n_d[seg_d.cells] = seg_d.counts
+    d = np.nan_to_num(segment_ks(seg_o, seg_d), nan=0.0)
+    return n_o.reshape(ny, nx), n_d.reshape(ny, nx), d.reshape(ny, nx)
+
+
+def p10_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
+    """Grid-wise 10th percentile (DL – Original)."""
+    return quantile_diff_from_segments(segments_from_gdf(orig_gdf_idx, nx, ny),
+                                       segments_from_gdf(dl_gdf_idx, nx, ny), nx, ny, "p10")
+
+
+def p90_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
+    """Grid-wise 90th percentile (DL – Original)."""
+    return quantile_diff_from_segments(segments_from_gdf(orig_gdf_idx, nx, ny),
+                                       segments_from_gdf(dl_gdf_idx, nx, ny), nx, ny, "p90")
+
+
+def iqr_diff(dl_gdf_idx, orig_gdf_idx, nx, ny):
+    """Grid-wise inter-quartile range (DL – Original)."""
+    return quantile_diff_from_segments(segments_from_gdf(orig_gdf_idx, nx, ny),
+                                       segments_from_gdf(dl_gdf_idx, nx, ny), nx, ny, "iqr")
+
+
+def ks_test(dl_gdf_idx, orig_gdf_idx, nx, ny):
+    """
+    Two-sample KS test between DL and Original Te_ppm distributions per cell.
+
+    arr_orig = counts of Original samples per cell
+    arr_dl   = counts of DL samples per cell
+    arr_cmp  = KS statistic D per cell (0 where either side is empty)
+    """
+    return ks_from_segments(segments_from_gdf(orig_gdf_idx, nx, ny),
+                            segments_from_gdf(dl_gdf_idx, nx, ny), nx, ny)
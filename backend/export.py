@@ -0,0 +1,161 @@
+# backend/export.py
+"""
+Streaming export of comparison grids.
+
+A result grid is read in record batches and re-encoded batch by batch, so
+a download starts immediately and memory stays flat whatever the grid
+size. Cell centres are arithmetic: Grid_ID and the GridSpec stored in the
+grid table give centroid_x / centroid_y without touching geometry. Legacy
+comp_grid.parquet files (no GridSpec) get them from the bounding corners of
+their WKB cell boxes.
+
+Formats: csv, arrow (Arrow IPC stream), parquet.
+
+Configuration (environment):
+- EXPORT_BATCH_ROWS: rows per streamed batch (default: 65536)
+"""
+
+import io
+import itertools
+import json
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from backend.pipeline.io_s3 import GRID_SPEC_KEY
+from backend.pipeline.config import env_int
+
+# format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Result files holding a comparison grid, most preferred first
+GRID_FILES = ("grid.parquet", "grid_sparse.parquet", "comp_grid.parquet")
+
+DEFAULT_BATCH_ROWS = 65536
+
+# Little-endian WKB polygon with one ring of 5 points (a cell box)
+_WKB_BOX_HEADER = np.array([1, 3, 0, 0, 0, 1, 0, 0, 0, 5, 0, 0, 0], dtype=np.uint8)
+_WKB_BOX_SIZE = 93
+
+
+class _DrainSink(io.RawIOBase):
+    """Write-only sink whose bytes are collected and handed out by drain()."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+
+def find_grid_file(result_dir: Path, cell_km: int | None = None) -> Path | None:
+    """The comparison grid of a results folder (a sweep's `cell_km` size if given)."""
+    result_dir = Path(result_dir)
+    names = GRID_FILES
+    if cell_km is not None:
+        names = [n.replace(".parquet", f"_{int(cell_km)}km.parquet") for n in GRID_FILES]
+    for name in names:
+        if (result_dir / name).exists():
+            return result_dir / name
+    return None
+
+
+def _box_centers(geometry: pa.Array) -> tuple[np.ndarray, np.ndarray]:
+    """Centres of WKB cell boxes: midpoint of two opposite ring corners."""
+    n = len(geometry)
+    if n and geometry.null_count == 0 and pa.types.is_binary(geometry.type):
+        offsets = np.frombuffer(geometry.buffers()[1], dtype=np.int32, count=n + 1, offset=geometry.offset * 4)
+        if (np.diff(offsets) == _WKB_BOX_SIZE).all():
+            data = np.frombuffer(geometry.buffers()[2], dtype=np.uint8, count=n * _WKB_BOX_SIZE,
+                                 offset=int(offsets[0])).reshape(n, _WKB_BOX_SIZE)
+            if (data[:, :13] == _WKB_BOX_HEADER).all():
+                corners = np.ascontiguousarray(data[:, 13:13 + 48]).view("<f8")   # 3 points
+                return 0.5 * (corners[:, 0] + corners[:, 4]), 0.5 * (corners[:, 1] + corners[:, 5])
+
+    import shapely
+    centroids = shapely.centroid(shapely.from_wkb(geometry.to_numpy(zero_copy_only=False)))
+    return shapely.get_x(centroids), shapely.get_y(centroids)
+
+
+def _export_batches(path: Path, batch_rows: int) -> Iterator[pa.RecordBatch]:
+    """Batches of the grid's columns plus centroid_x / centroid_y, without geometry."""
+    pf = pq.ParquetFile(path)
+    raw = (pf.schema_arrow.metadata or {}).get(GRID_SPEC_KEY)
+    spec = json.loads(raw) if raw else None
+    legacy = spec is None and "geometry" in pf.schema_arrow.names
+    columns = [c for c in pf.schema_arrow.names if c != "geometry" and not c.startswith("__")]
+    if legacy:
+        columns.append("geometry")
+    if spec is None and not legacy:
+        raise ValueError(f"{path.name} has neither a GridSpec nor cell geometry")
+
+    row = 0
+    for batch in pf.iter_batches(batch_size=batch_rows, columns=columns):
+        if legacy:
+            cx, cy = _box_centers(batch.column(batch.schema.get_field_index("geometry")))
+            batch = batch.drop_columns(["geometry"])
+        else:
+            iy, ix = np.divmod(batch.column(batch.schema.get_field_index("Grid_ID")).to_numpy(), spec["nx"])
+            cx = spec["minx"] + (ix + 0.5) * spec["cell"]
+            cy = spec["miny"] + (iy + 0.5) * spec["cell"]
+        arrays = [pa.array(np.arange(row, row + batch.num_rows)), *batch.columns,
+                  pa.array(cx, pa.float64()), pa.array(cy, pa.float64())]
+        names = ["cell_id", *batch.schema.names, "centroid_x", "centroid_y"]
+        row += batch.num_rows
+        yield pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def iter_grid_export(path: Path, fmt: str = "csv", batch_rows: int | None = None) -> Iterator[bytes]:
+    """Encoded chunks of the grid at `path` in `fmt`, one or more per batch."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'")
+    batch_rows = batch_rows or env_int("EXPORT_BATCH_ROWS", DEFAULT_BATCH_ROWS)
+    batches = _export_batches(Path(path), batch_rows)
+    first = next(batches, None)
+    if first is None:
+        return
+
+    sink = _DrainSink()
+    if fmt == "csv":
+        writer = pacsv.CSVWriter(sink, first.schema)
+    elif fmt == "arrow":
+        writer = pa.ipc.new_stream(sink, first.schema)
+    else:
+        writer = pq.ParquetWriter(sink, first.schema, compression="zstd")
+
+    for batch in itertools.chain([first], batches):
+        if fmt == "parquet":
+            writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            writer.write_batch(batch)
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
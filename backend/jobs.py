@@ -0,0 +1,242 @@
+# backend/jobs.py
+"""
+Asynchronous comparison jobs on top of the warm worker pool.
+
+Each job has an id, a results folder `RESULTS_DIR/job_<id>` and a
+`job.json` record there, so status and outputs can be looked up by id even
+after a restart. Concurrency is bounded by the worker pool size; at most
+`max_queued` further jobs wait in the queue, beyond that `submit` raises
+QueueFull and the API answers 503 instead of overcommitting CPU and RAM.
+
+States: queued -> running -> done | error
+Stages (while running): reading, projecting, gridding, comparing, writing
+
+With a ResultCache, jobs carry a content fingerprint: a cached result is
+returned as an already-finished job, and an identical job still running is
+shared rather than started twice.
+
+Only queued and running jobs are held in memory; a finished job is dropped
+once its job.json is written, and its staged inputs are deleted (at once
+when the submission is answered from the cache or an in-flight duplicate).
+
+Configuration (environment):
+- PIPELINE_MAX_QUEUED: jobs allowed to wait for a worker (default: 16)
+"""
+
+import json
+import re
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from backend.pipeline.config import env_int
+from backend.result_cache import ResultCache
+from backend.workers import WorkerPool
+
+DEFAULT_MAX_QUEUED = 16
+
+JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class QueueFull(Exception):
+    """Raised when the job queue is at capacity."""
+
+
+@dataclass
+class Job:
+    job_id: str
+    state: str = "queued"
+    stage: str | None = None
+    created: float = field(default_factory=time.time)
+    finished: float | None = None
+    inputs: dict = field(default_factory=dict)
+    params: dict = field(default_factory=dict)
+    outputs: dict = field(default_factory=dict)
+    message: str | None = None
+    error: str | None = None
+    cache_key: str | None = None
+    cached: bool = False
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def is_job_id(value: str) -> bool:
+    return bool(JOB_ID_RE.match(value or ""))
+
+
+def _remove_staged(path: Path | None) -> None:
+    if path is not None:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class JobScheduler:
+    def __init__(self, pool: WorkerPool, results_dir: Path, max_queued: int | None = None,
+                 cache: ResultCache | None = None):
+        self.pool = pool
+        self.cache = cache
+        self.results_dir = Path(results_dir)
+        self.max_queued = max_queued if max_queued is not None else env_int("PIPELINE_MAX_QUEUED", DEFAULT_MAX_QUEUED)
+        self._jobs: dict[str, Job] = {}
+        self._futures = {}
+        self._inflight: dict[str, str] = {}   # cache key -> running job id
+        self._staged: dict[str, Path] = {}    # job id -> staged inputs folder
+        self._done: dict[str, threading.Event] = {}   # job id -> set once finished
+        self._lock = threading.Lock()
+
+    # ---- paths ----
+    def job_dir(self, job_id: str) -> Path:
+        return self.results_dir / f"job_{job_id}"
+
+    def _stage_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id) / "stage"
+
+    def _persist(self, job: Job) -> None:
+        path = self.job_dir(job.job_id) / "job.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(job.to_dict()))
+
+    # ---- scheduling ----
+    def submit(self, job_id: str, job: dict, inputs: dict | None = None, cache_key: str | None = None,
+               staged: Path | None = None) -> Job:
+        """
+        Queue `run_pipeline(**job)`; `job["out"]` defaults to the job folder.
+        With `cache_key`, may instead return a finished cached job or the
+        identical job already in flight. `staged` (the folder holding the
+        job's inputs) is deleted as soon as the inputs are no longer needed.
+        """
+        params = {k: v for k, v in job.items() if k not in ("orig_path", "dl_path", "out")}
+        use_cache = bool(cache_key) and self.cache is not None
+        with self._lock:
+            # Dedup and registration in one critical section, so two identical
+            # submissions cannot both start a run
+            running = self._inflight.get(cache_key) if use_cache else None
+            shared = self._jobs[running] if running else None
+            cached = shared is None and use_cache and self.cache.get(cache_key) is not None
+            if shared is None and not cached:
+                busy = len(self._jobs)
+                if busy >= self.pool.size + self.max_queued:
+                    _remove_staged(staged)
+                    raise QueueFull(f"{busy} comparisons already queued or running")
+                record = Job(job_id=job_id, inputs=inputs or {}, params=params, cache_key=cache_key)
+                self._jobs[job_id] = record
+                self._done[job_id] = threading.Event()
+                if staged is not None:
+                    self._staged[job_id] = Path(staged)
+                if cache_key:
+                    self._inflight[cache_key] = job_id
+
+        if shared is not None:
+            _remove_staged(staged)
+            return shared
+        if cached:
+            _remove_staged(staged)
+            record = Job(job_id=job_id, state="done", finished=time.time(), inputs=inputs or {},
+                         params=params, outputs=self.cache.restore(cache_key, self.job_dir(job_id)),
+                         message="Finished: cached result", cache_key=cache_key, cached=True)
+            self._persist(record)
+            return record
+
+        job = {"out": self.job_dir(job_id).as_posix(), **job}
+        try:
+            self._persist(record)
+            future = self.pool.submit(job, stage_path=self._stage_path(job_id).as_posix())
+        except Exception:
+            self._discard(job_id)
+            raise
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f, jid=job_id: self._finish(jid, f))
+        return record
+
+    def _discard(self, job_id: str) -> None:
+        """Undo a registration whose job never reached the pool."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            staged = self._staged.pop(job_id, None)
+            done = self._done.pop(job_id, None)
+            if job is not None and job.cache_key and self._inflight.get(job.cache_key) == job_id:
+                del self._inflight[job.cache_key]
+        _remove_staged(staged)
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        if done is not None:
+            done.set()
+
+    def _finish(self, job_id: str, future) -> None:
+        try:
+            result = future.result()
+            error = None
+        except Exception as e:
+            result, error = None, e
+        job = self._jobs[job_id]
+        if result is not None and job.cache_key and self.cache is not None:
+            self.cache.put(job.cache_key, result["outputs"])
+
+        with self._lock:
+            staged = self._staged.pop(job_id, None)
+        _remove_staged(staged)
+
+        with self._lock:
+            self._futures.pop(job_id, None)
+            if job.cache_key:
+                self._inflight.pop(job.cache_key, None)
+            job.finished = time.time()
+            job.stage = None
+            if error is None:
+                job.state = "done"
+                job.message = result["message"]
+                job.outputs = result["outputs"]
+            else:
+                job.state = "error"
+                job.message = f"Pipeline failed: {error}"
+                job.error = "".join(traceback.format_exception(error))
+        self._persist(job)
+
+        # Finished jobs are served from job.json from now on
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            done = self._done.pop(job_id, None)
+        if done is not None:
+            done.set()
+
+    # ---- lookup ----
+    def get(self, job_id: str) -> Job | None:
+        """Live job, or one finished by an earlier process (read from job.json)."""
+        if not is_job_id(job_id):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                if job.state in ("queued", "running"):
+                    future = self._futures.get(job_id)
+                    stage_path = self._stage_path(job_id)
+                    if stage_path.exists():
+                        job.stage = stage_path.read_text().strip() or None
+                    if job.stage or (future is not None and future.running()):
+                        job.state = "running"
+                return job
+
+        path = self.job_dir(job_id) / "job.json"
+        if not path.exists():
+            return None
+        return Job(**json.loads(path.read_text()))
+
+    def wait(self, job_id: str, timeout: float | None = None) -> Job | None:
+        """
+        Block until the job finishes (used by the synchronous endpoint), or
+        until `timeout` seconds pass; the job is returned in its current state.
+        """
+        with self._lock:
+            done = self._done.get(job_id)
+        if done is not None:
+            # Set by _finish once job.json is written and the job is dropped
+            done.wait(timeout)
+        return self.get(job_id)
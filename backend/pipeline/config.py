@@ -0,0 +1,13 @@
+# backend/pipeline/config.py
+"""
+Environment settings shared by the pipeline and the Flask backend.
+"""
+
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
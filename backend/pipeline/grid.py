@@ -4,17 +4,29 @@ Grid construction and point assignment utilities (projected CRS + vectorised).
 """
 
 from dataclasses import dataclass
+from functools import lru_cache
 import math
 import numpy as np
 import geopandas as gpd
-from shapely.geometry import box
+import pandas as pd
+import shapely
+
+from backend.pipeline.io_s3 import PointArrays
+from backend.pipeline.projection import project_xy
 
 
 # Use an equal-area CRS for AU by default; change if your project needs others.
 DEFAULT_PROJECTED_CRS = "EPSG:3577"  # GDA94 / Australian Albers
 
 
-@dataclass
+# Number of distinct grids kept in memory by make_regular_grid
+GRID_CACHE_SIZE = 8
+
+# Largest relative change allowed when assay values are stored as float32
+VALUE_RTOL = 1e-6
+
+
+@dataclass(frozen=True)
 class GridSpec:
     minx: float
     miny: float
@@ -29,16 +41,34 @@ def _ceil_div(length: float, cell: float) -> int:
 
 
 def ensure_projected(gdf: gpd.GeoDataFrame, target_crs: str = DEFAULT_PROJECTED_CRS) -> gpd.GeoDataFrame:
-    """Reproject to target_crs if needed; require geometry present."""
+    """
+    Reproject to target_crs if needed; require geometry present.
+    Point coordinates go through the cached, parallel projection service
+    (see projection.py); other geometry types fall back to to_crs.
+    """
     if gdf.crs is None:
         # Assume EPSG:4326 if missing; change if your files carry CRS metadata.
         gdf = gdf.set_crs(4326, allow_override=True)
-    if str(gdf.crs).upper() != str(target_crs).upper():
-        gdf = gdf.to_crs(target_crs)
-    return gdf
-
-
-def make_grid_spec(orig: gpd.GeoDataFrame, dl: gpd.GeoDataFrame, cell_size_m: int, crs: str) -> GridSpec:
+    if str(gdf.crs).upper() == str(target_crs).upper():
+        return gdf
+    try:
+        x, y = gdf.geometry.x.to_numpy(), gdf.geometry.y.to_numpy()
+    except ValueError:  # not all geometries are points
+        return gdf.to_crs(target_crs)
+    px, py = project_xy(x, y, gdf.crs, target_crs)
+    return gdf.assign(**{gdf.geometry.name: gpd.points_from_xy(px, py, crs=target_crs)})
+
+
+def project_points(points: PointArrays, target_crs: str = DEFAULT_PROJECTED_CRS) -> PointArrays:
+    """ensure_projected for PointArrays (coordinates only, nothing else is copied)."""
+    if str(points.crs).upper() == str(target_crs).upper():
+        return points
+    px, py = project_xy(points.x, points.y, points.crs, target_crs)
+    return PointArrays(px, py, target_crs, points.columns)
+
+
+def make_grid_spec(orig: gpd.GeoDataFrame | PointArrays, dl: gpd.GeoDataFrame | PointArrays,
+                   cell_size_m: int, crs: str) -> GridSpec:
     """Compute combined bounds and grid dimensions in the projected CRS."""
     minx1, miny1, maxx1, maxy1 = orig.total_bounds
     minx2, miny2, maxx2, maxy2 = dl.total_bounds
@@ -55,23 +85,16 @@ def make_grid_spec(orig: gpd.GeoDataFrame, dl: gpd.GeoDataFrame, cell_size_m: in
     return GridSpec(minx=minx, miny=miny, cell=cell_size_m, nx=nx, ny=ny, crs=crs)
 
 
-def make_regular_grid(spec: GridSpec) -> gpd.GeoDataFrame:
-    """Build row-major grid polygons with ix, iy, Grid_ID."""
-    polys = []
-    ix_all = []
-    iy_all = []
-    for iy in range(spec.ny):
-        y0 = spec.miny + iy * spec.cell
-        y1 = y0 + spec.cell
-        for ix in range(spec.nx):
-            x0 = spec.minx + ix * spec.cell
-            x1 = x0 + spec.cell
-            polys.append(box(x0, y0, x1, y1))
-            ix_all.append(ix)
-            iy_all.append(iy)
+@lru_cache(maxsize=GRID_CACHE_SIZE)
+def _build_regular_grid(spec: GridSpec) -> gpd.GeoDataFrame:
+    ix = np.tile(np.arange(spec.nx), spec.ny)
+    iy = np.repeat(np.arange(spec.ny), spec.nx)
+    x0 = spec.minx + ix * spec.cell
+    y0 = spec.miny + iy * spec.cell
+    polys = shapely.box(x0, y0, x0 + spec.cell, y0 + spec.cell)
 
     grid = gpd.GeoDataFrame(
-        {"ix": ix_all, "iy": iy_all},
+        {"ix": ix, "iy": iy},
         geometry=polys,
         crs=spec.crs
     )
@@ -79,22 +102,64 @@ def make_regular_grid(spec: GridSpec) -> gpd.GeoDataFrame:
     return grid
 
 
-def assign_grid_index(points: gpd.GeoDataFrame, spec: GridSpec) -> gpd.GeoDataFrame:
+def make_regular_grid(spec: GridSpec) -> gpd.GeoDataFrame:
+    """
+    Build row-major grid polygons with ix, iy, Grid_ID.
+    Polygons are created in one vectorised shapely call and cached per GridSpec;
+    callers get a copy so the cached grid is never modified.
+    """
+    return _build_regular_grid(spec).copy()
+
+
+def grid_index_xy(x: np.ndarray, y: np.ndarray, spec: GridSpec) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (grid_ix, grid_iy, Grid_ID) for coordinate arrays, using floor division
+    and clipping to the grid extent. Indices are int32 (Grid_ID falls back
+    to int64 for grids of 2**31 cells or more); one float64 scratch array
+    is reused for both axes.
+    """
+    id_dtype = np.int32 if spec.nx * spec.ny < 2**31 else np.int64
+    scratch = np.empty(len(x), dtype=np.float64)
+
+    def axis(coord, origin, n):
+        np.subtract(coord, origin, out=scratch)
+        np.divide(scratch, spec.cell, out=scratch)
+        np.floor(scratch, out=scratch)
+        np.clip(scratch, 0, n - 1, out=scratch)   # avoid -1 or out-of-range
+        return scratch.astype(np.int32)
+
+    gx = axis(x, spec.minx, spec.nx)
+    gy = axis(y, spec.miny, spec.ny)
+    gid = gy.astype(id_dtype)
+    gid *= spec.nx
+    gid += gx
+    return gx, gy, gid
+
+
+def compact_values(values: np.ndarray, rtol: float = VALUE_RTOL) -> np.ndarray:
+    """`values` as float32 when that keeps every value within `rtol`, else float64."""
+    values = np.asarray(values, dtype=np.float64)
+    v32 = values.astype(np.float32)
+    with np.errstate(invalid="ignore", over="ignore"):
+        ok = np.allclose(v32, values, rtol=rtol, atol=0.0, equal_nan=True)
+    return v32 if ok else values
+
+
+def assign_grid_index(points: gpd.GeoDataFrame | PointArrays, spec: GridSpec,
+                      value_col: str = "Te_ppm") -> pd.DataFrame:
     """
-    Vectorised assignment of (grid_ix, grid_iy, Grid_ID) using floor division.
-    Assumes points are in the same projected CRS as the grid spec.
+    Index table of the points: int32 grid_ix / grid_iy / Grid_ID plus
+    `value_col` (float32 where precision allows, see compact_values).
+    Assumes points are in the same projected CRS as the grid spec. The
+    point table itself (geometry included) is not copied.
     """
-    # Extract coordinates
-    xy = np.vstack([points.geometry.x.values, points.geometry.y.values]).T
-    gx = np.floor((xy[:, 0] - spec.minx) / spec.cell).astype(int)
-    gy = np.floor((xy[:, 1] - spec.miny) / spec.cell).astype(int)
-
-    # Clip to grid extent to avoid -1 or out-of-range
-    gx = np.clip(gx, 0, spec.nx - 1)
-    gy = np.clip(gy, 0, spec.ny - 1)
-
-    pts = points.copy()
-    pts["grid_ix"] = gx
-    pts["grid_iy"] = gy
-    pts["Grid_ID"] = gy * spec.nx + gx
-    return pts
+    if isinstance(points, PointArrays):
+        x, y, values = points.x, points.y, points.columns.get(value_col)
+    else:
+        x, y = points.geometry.x.to_numpy(), points.geometry.y.to_numpy()
+        values = points[value_col].to_numpy(dtype=np.float64) if value_col in points.columns else None
+    gx, gy, gid = grid_index_xy(x, y, spec)
+    out = {"grid_ix": gx, "grid_iy": gy, "Grid_ID": gid}
+    if values is not None:
+        out[value_col] = compact_values(values)
+    return pd.DataFrame(out, copy=False)
@@ -1,15 +1,316 @@
 # backend/pipeline/io_s3.py
+"""
+Pipeline I/O over fsspec paths (local or s3://, or any fsspec URL).
+
+Reads of remote objects go through fsspec's block cache: only the byte
+ranges pyarrow asks for (the Parquet footer, then the selected row groups'
+column chunks) are fetched, in PIPELINE_IO_BLOCK_MB blocks, and kept in a
+sparse on-disk copy that is revalidated against the object's key (ETag for
+S3, size/mtime elsewhere) on every open. Row groups are decoded in parallel
+and output files are written concurrently.
+
+Configuration (environment):
+- PIPELINE_IO_CACHE_DIR:  remote block cache folder (default: <tmp>/pipeline-io-cache)
+- PIPELINE_IO_CACHE:      0 reads remote objects uncached (default: 1)
+- PIPELINE_IO_BLOCK_MB:   ranged-read block size in MB (default: 4)
+- PIPELINE_IO_THREADS:    row-group decode / upload threads (default: 8)
+- PIPELINE_IO_CACHE_DAYS: drop cached objects unused for this long (default: 7)
+"""
+
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 import geopandas as gpd
 import fsspec
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from pyproj import CRS
+
+from backend.pipeline.schema import GRID_GEOMETRY_COLUMN, GRID_ID_COLUMN, GRID_COUNT_COLUMNS, grid_arrow_schema
+from backend.pipeline.config import env_int
+
+# Parquet key-value metadata key holding the GridSpec as JSON
+GRID_SPEC_KEY = b"grid_spec"
+
+# GeoParquet file metadata key; a missing CRS means lon/lat
+GEO_KEY = b"geo"
+DEFAULT_POINT_CRS = "EPSG:4326"
+
+# Little-endian 2D WKB point: byte order 1, type 1, then x and y as float64
+_WKB_POINT_HEADER = np.array([1, 1, 0, 0, 0], dtype=np.uint8)
+_WKB_POINT_SIZE = 21
+
+
+@dataclass
+class PointArrays:
+    """Point samples as flat arrays: coordinates, selected columns and CRS."""
+    x: np.ndarray
+    y: np.ndarray
+    crs: str
+    columns: dict[str, np.ndarray] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    @property
+    def total_bounds(self) -> np.ndarray:
+        """(minx, miny, maxx, maxy), NaN when empty (like GeoDataFrame.total_bounds)."""
+        if not len(self.x):
+            return np.full(4, np.nan)
+        return np.array([self.x.min(), self.y.min(), self.x.max(), self.y.max()])
+
+    def take(self, index: np.ndarray) -> "PointArrays":
+        return PointArrays(self.x[index], self.y[index], self.crs,
+                           {name: col[index] for name, col in self.columns.items()})
+
+
+def _is_local(fs) -> bool:
+    """Local disk or in-process memory: nothing to fetch, so nothing to cache."""
+    protocols = fs.protocol if isinstance(fs.protocol, (tuple, list)) else (fs.protocol,)
+    return bool({"file", "local", "memory"} & set(protocols))
+
+
+def input_fs(path: str):
+    """
+    (filesystem, path, open kwargs) for reading `path`; remote filesystems
+    are wrapped in the on-disk block cache (see the module docstring).
+    """
+    fs, fs_path = fsspec.core.url_to_fs(path)
+    if _is_local(fs) or not env_int("PIPELINE_IO_CACHE", 1):
+        return fs, fs_path, {}
+    cache_dir = os.environ.get("PIPELINE_IO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pipeline-io-cache"))
+    cached = fsspec.filesystem(
+        "blockcache", fs=fs, cache_storage=cache_dir, check_files=True,
+        expiry_time=env_int("PIPELINE_IO_CACHE_DAYS", 7) * 86400,
+    )
+    return cached, fs_path, {"block_size": env_int("PIPELINE_IO_BLOCK_MB", 4) * 1024 * 1024}
+
+
+def _io_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=env_int("PIPELINE_IO_THREADS", 8), thread_name_prefix="pipeline-io")
+
+
+def read_row_groups(path: str, groups: list[int], columns: list[str], metadata=None) -> pa.Table:
+    """
+    `columns` of the given row groups, decoded in parallel (one file handle
+    per task; the footer is parsed once and shared via `metadata`).
+    """
+    fs, fs_path, kwargs = input_fs(path)
+    if metadata is None:
+        with fs.open(fs_path, "rb", **kwargs) as f:
+            metadata = pq.ParquetFile(f).metadata
+
+    def read(group_list):
+        with fs.open(fs_path, "rb", **kwargs) as f:
+            return pq.ParquetFile(f, metadata=metadata).read_row_groups(group_list, columns=columns)
+
+    if len(groups) <= 1:
+        return read(groups)
+    with _io_pool() as pool:
+        return pa.concat_tables(list(pool.map(read, [[g] for g in groups])))
+
 
 def read_points(path: str) -> gpd.GeoDataFrame:
-    with fsspec.open(path, "rb") as f:
+    fs, fs_path, kwargs = input_fs(path)
+    with fs.open(fs_path, "rb", **kwargs) as f:
         return gpd.read_parquet(f)
 
+
+def _geo_column(schema: pa.Schema) -> tuple[str, dict]:
+    """(primary geometry column, its GeoParquet column metadata)."""
+    raw = (schema.metadata or {}).get(GEO_KEY)
+    if raw is None:
+        if "geometry" not in schema.names:
+            raise ValueError("missing 'geometry' column")
+        return "geometry", {"encoding": "WKB"}
+    geo = json.loads(raw)
+    name = geo.get("primary_column", "geometry")
+    return name, geo.get("columns", {}).get(name, {})
+
+
+def _crs_string(meta: dict) -> str:
+    if "crs" not in meta:
+        return DEFAULT_POINT_CRS
+    crs = meta["crs"]
+    if crs is None:  # explicitly unknown: keep the pipeline's lon/lat assumption
+        return DEFAULT_POINT_CRS
+    crs = CRS.from_json_dict(crs) if isinstance(crs, dict) else CRS.from_user_input(crs)
+    return crs.to_string()
+
+
+def _bbox_stat_columns(geom: str, meta: dict) -> list[str] | None:
+    """Parquet column paths whose statistics bound (xmin, ymin, xmax, ymax), if any."""
+    if meta.get("encoding", "").lower() == "point":
+        return [f"{geom}.x", f"{geom}.y", f"{geom}.x", f"{geom}.y"]
+    covering = meta.get("covering", {}).get("bbox")
+    if covering:
+        return [".".join(covering[k]) for k in ("xmin", "ymin", "xmax", "ymax")]
+    return None
+
+
+def _row_groups_in_bbox(md: pq.FileMetaData, stat_cols: list[str] | None, bbox) -> list[int]:
+    """Row groups whose column statistics may intersect `bbox` (all, without statistics)."""
+    groups = list(range(md.num_row_groups))
+    if bbox is None or stat_cols is None:
+        return groups
+    xmin, ymin, xmax, ymax = bbox
+    keep = []
+    for i in groups:
+        rg = md.row_group(i)
+        stats = {}
+        for j in range(rg.num_columns):
+            col = rg.column(j)
+            if col.path_in_schema in stat_cols and col.statistics is not None and col.statistics.has_min_max:
+                stats[col.path_in_schema] = (col.statistics.min, col.statistics.max)
+        try:
+            lo_x, lo_y = stats[stat_cols[0]][0], stats[stat_cols[1]][0]
+            hi_x, hi_y = stats[stat_cols[2]][1], stats[stat_cols[3]][1]
+        except KeyError:
+            keep.append(i)
+            continue
+        if lo_x <= xmax and hi_x >= xmin and lo_y <= ymax and hi_y >= ymin:
+            keep.append(i)
+    return keep
+
+
+def wkb_points_xy(arr: pa.Array) -> tuple[np.ndarray, np.ndarray]:
+    """
+    x / y of a WKB point column. Little-endian 2D points (what GeoPandas and
+    GDAL write) are decoded straight from the Arrow buffers; anything else
+    goes through shapely.
+    """
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    n = len(arr)
+    if n and arr.null_count == 0:
+        off_type = np.int64 if pa.types.is_large_binary(arr.type) else np.int32
+        offsets = np.frombuffer(arr.buffers()[1], dtype=off_type, count=n + 1,
+                                offset=arr.offset * np.dtype(off_type).itemsize)
+        if (np.diff(offsets) == _WKB_POINT_SIZE).all():
+            data = np.frombuffer(arr.buffers()[2], dtype=np.uint8,
+                                 count=n * _WKB_POINT_SIZE, offset=int(offsets[0])).reshape(n, _WKB_POINT_SIZE)
+            if (data[:, :5] == _WKB_POINT_HEADER).all():
+                xy = np.ascontiguousarray(data[:, 5:]).view("<f8")
+                return xy[:, 0].astype(np.float64), xy[:, 1].astype(np.float64)
+
+    geoms = shapely.from_wkb(arr.to_numpy(zero_copy_only=False))
+    if not (shapely.get_type_id(geoms) == 0).all():
+        raise ValueError("geometry column must hold points")
+    return shapely.get_x(geoms), shapely.get_y(geoms)
+
+
+def _points_xy(col: pa.ChunkedArray, meta: dict) -> tuple[np.ndarray, np.ndarray]:
+    if meta.get("encoding", "WKB").lower() == "point":
+        col = col.combine_chunks()
+        return (col.field("x").to_numpy(zero_copy_only=False).astype(np.float64),
+                col.field("y").to_numpy(zero_copy_only=False).astype(np.float64))
+    return wkb_points_xy(col)
+
+
+def read_point_arrays(path: str, columns=("Te_ppm",), bbox=None) -> PointArrays:
+    """
+    Read a GeoParquet of points as arrays, without building shapely objects.
+    Only the geometry and `columns` are read; with `bbox` (xmin, ymin, xmax,
+    ymax in the file's CRS) row groups whose statistics fall outside it are
+    skipped, then points outside it are dropped. Numeric columns come back
+    as float64 (non-numbers -> NaN).
+    """
+    fs, fs_path, kwargs = input_fs(path)
+    with fs.open(fs_path, "rb", **kwargs) as f:
+        pf = pq.ParquetFile(f)
+        geom, meta = _geo_column(pf.schema_arrow)
+        missing = [c for c in (geom, *columns) if c not in pf.schema_arrow.names]
+        if missing:
+            raise ValueError(f"missing {', '.join(repr(c) for c in missing)} column")
+        groups = _row_groups_in_bbox(pf.metadata, _bbox_stat_columns(geom, meta), bbox)
+        metadata = pf.metadata
+    table = read_row_groups(path, groups, [geom, *columns], metadata)
+
+    x, y = _points_xy(table.column(geom), meta)
+    cols = {c: pd.to_numeric(table.column(c).to_pandas(), errors="coerce").to_numpy(dtype=np.float64)
+            for c in columns}
+    points = PointArrays(x, y, _crs_string(meta), cols)
+    if bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        points = points.take((x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax))
+    return points
+
 def write_grid(path: str, gdf: gpd.GeoDataFrame) -> None:
     with fsspec.open(path, "wb") as f:
         gdf.to_parquet(f, index=False)
 
+def write_grids(grids: dict[str, gpd.GeoDataFrame]) -> None:
+    """write_grid for every {path: grid}, concurrently (uploads overlap)."""
+    with _io_pool() as pool:
+        for future in [pool.submit(write_grid, path, gdf) for path, gdf in grids.items()]:
+            future.result()
+
 def write_text(path: str, text: str) -> None:
     with fsspec.open(path, "w") as f:
         f.write(text)
+
+def write_table(path: str, df: pd.DataFrame, grid_spec: dict | None = None) -> None:
+    """Write a plain (geometry-free) Parquet table, optionally tagging the GridSpec."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if grid_spec is not None:
+        meta = dict(table.schema.metadata or {})
+        meta[GRID_SPEC_KEY] = json.dumps(grid_spec).encode()
+        table = table.replace_schema_metadata(meta)
+    with fsspec.open(path, "wb") as f:
+        pq.write_table(table, f)
+
+def write_grid_table(path: str, cells: pd.DataFrame, grid_spec: dict, geometry: np.ndarray | None = None,
+                     compression: str = "zstd", row_group_size: int | None = None) -> None:
+    """
+    Write result cells as one table enforcing grid_arrow_schema (int32 ids,
+    int64 for grids of 2**31 cells or more, int32 counts, float64 stats), with the GridSpec in the key-value metadata.
+    `geometry` (WKB cell polygons, one per row) makes it a GeoParquet.
+    """
+    missing = [c for c in (GRID_ID_COLUMN, *GRID_COUNT_COLUMNS) if c not in cells.columns]
+    if missing:
+        raise ValueError(f"Grid table is missing {', '.join(missing)}")
+    schema = grid_arrow_schema(list(cells.columns), grid_spec["nx"] * grid_spec["ny"],
+                               geometry=geometry is not None)
+    arrays = [pa.array(cells[f.name].to_numpy(), type=f.type) for f in schema if f.name != GRID_GEOMETRY_COLUMN]
+    if geometry is not None:
+        arrays.append(pa.array(geometry, type=pa.binary()))
+    table = pa.Table.from_arrays(arrays, schema=schema)
+
+    meta = {GRID_SPEC_KEY: json.dumps(grid_spec).encode()}
+    if geometry is not None:
+        x0, y0 = grid_spec["minx"], grid_spec["miny"]
+        meta[GEO_KEY] = json.dumps({
+            "version": "1.0.0",
+            "primary_column": GRID_GEOMETRY_COLUMN,
+            "columns": {GRID_GEOMETRY_COLUMN: {
+                "encoding": "WKB",
+                "geometry_types": ["Polygon"],
+                "crs": CRS.from_user_input(grid_spec["crs"]).to_json_dict(),
+                "bbox": [x0, y0, x0 + grid_spec["nx"] * grid_spec["cell"], y0 + grid_spec["ny"] * grid_spec["cell"]],
+            }},
+        }).encode()
+    table = table.replace_schema_metadata(meta)
+    with fsspec.open(path, "wb") as f:
+        pq.write_table(table, f, compression=compression, row_group_size=row_group_size)
+
+def read_grid_table(path: str, columns: list[str] | None = None) -> tuple[pd.DataFrame, dict | None]:
+    """(selected columns of a grid table, its GridSpec fields); only those columns are read."""
+    fs, fs_path, kwargs = input_fs(path)
+    with fs.open(fs_path, "rb", **kwargs) as f:
+        pf = pq.ParquetFile(f)
+        raw = (pf.schema_arrow.metadata or {}).get(GRID_SPEC_KEY)
+        table = pf.read(columns=columns)
+    return table.to_pandas(), (json.loads(raw) if raw else None)
+
+def read_grid_spec(path: str) -> dict | None:
+    """GridSpec fields stored by write_table, or None if the file has none."""
+    fs, fs_path, kwargs = input_fs(path)
+    with fs.open(fs_path, "rb", **kwargs) as f:
+        meta = pq.read_schema(f).metadata or {}
+    raw = meta.get(GRID_SPEC_KEY)
+    return json.loads(raw) if raw else None
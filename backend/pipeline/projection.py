@@ -0,0 +1,136 @@
+# backend/pipeline/projection.py
+"""
+Coordinate projection service for the pipeline.
+
+- pyproj Transformers are built once per (source, target) CRS pair and
+  thread (a Transformer must not be shared between threads);
+- raw x / y float arrays are transformed in PROJECTION_CHUNK-sized chunks
+  across a thread pool (pyproj releases the GIL while transforming);
+- projected coordinates are memoized on disk, keyed by a fingerprint of
+  the input coordinates and the CRS pair, so repeated comparisons on the
+  same data (other cell sizes, methods, jobs) skip reprojection.
+
+Configuration (environment):
+- PROJECTION_THREADS:      transform threads (default: min(8, CPUs))
+- PROJECTION_CACHE_DIR:    memo folder (default: <tmp>/pipeline-projection-cache)
+- PROJECTION_CACHE_MAX_MB: memo size in MB (default: 1024; 0 disables the memo)
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from pyproj import Transformer
+
+from backend.pipeline.config import env_int
+
+# Points per transform call; smaller inputs are transformed inline
+PROJECTION_CHUNK = 1 << 18
+
+DEFAULT_THREADS = max(1, min(8, os.cpu_count() or 1))
+DEFAULT_CACHE_MAX_MB = 1024
+
+_local = threading.local()
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_memo_lock = threading.Lock()
+
+
+def get_transformer(src_crs, dst_crs) -> Transformer:
+    """This thread's cached always_xy Transformer for (src_crs, dst_crs)."""
+    cache = getattr(_local, "transformers", None)
+    if cache is None:
+        cache = _local.transformers = {}
+    key = (str(src_crs), str(dst_crs))
+    tr = cache.get(key)
+    if tr is None:
+        tr = cache[key] = Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+    return tr
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=env_int("PROJECTION_THREADS", DEFAULT_THREADS),
+                                       thread_name_prefix="projection")
+        return _pool
+
+
+def transform_xy(x: np.ndarray, y: np.ndarray, src_crs, dst_crs) -> tuple[np.ndarray, np.ndarray]:
+    """Project coordinate arrays, in parallel chunks for large inputs."""
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    if len(x) <= PROJECTION_CHUNK:
+        px, py = get_transformer(src_crs, dst_crs).transform(x, y)
+        return np.asarray(px, dtype=np.float64), np.asarray(py, dtype=np.float64)
+
+    px = np.empty_like(x)
+    py = np.empty_like(y)
+
+    def run(start: int) -> None:
+        stop = start + PROJECTION_CHUNK
+        px[start:stop], py[start:stop] = get_transformer(src_crs, dst_crs).transform(x[start:stop], y[start:stop])
+
+    for f in [_get_pool().submit(run, s) for s in range(0, len(x), PROJECTION_CHUNK)]:
+        f.result()
+    return px, py
+
+
+def coords_fingerprint(x: np.ndarray, y: np.ndarray, src_crs, dst_crs) -> str:
+    """blake2b of the raw coordinates plus the CRS pair."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(np.ascontiguousarray(x, dtype=np.float64).data)
+    h.update(np.ascontiguousarray(y, dtype=np.float64).data)
+    h.update(f"{src_crs}\0{dst_crs}".encode())
+    return h.hexdigest()
+
+
+def _memo_dir() -> Path:
+    return Path(os.environ.get("PROJECTION_CACHE_DIR", Path(tempfile.gettempdir()) / "pipeline-projection-cache"))
+
+
+def _memo_get(key: str, n: int):
+    path = _memo_dir() / f"{key}.npy"
+    try:
+        xy = np.load(path)
+    except (FileNotFoundError, ValueError, OSError):
+        return None
+    if xy.shape != (2, n):
+        return None
+    os.utime(path)
+    return xy[0], xy[1]
+
+
+def _memo_put(key: str, px: np.ndarray, py: np.ndarray, max_bytes: int) -> None:
+    root = _memo_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = root / f".{key}.{os.getpid()}.{threading.get_ident()}.npy"
+    np.save(tmp, np.vstack((px, py)))
+    with _memo_lock:
+        os.replace(tmp, root / f"{key}.npy")
+        files = sorted(root.glob("*.npy"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        for p in files:
+            if total <= max_bytes:
+                break
+            total -= p.stat().st_size
+            p.unlink(missing_ok=True)
+
+
+def project_xy(x: np.ndarray, y: np.ndarray, src_crs, dst_crs) -> tuple[np.ndarray, np.ndarray]:
+    """transform_xy, answered from the on-disk memo when these coordinates were projected before."""
+    max_bytes = env_int("PROJECTION_CACHE_MAX_MB", DEFAULT_CACHE_MAX_MB) * 1024 * 1024
+    if not max_bytes:
+        return transform_xy(x, y, src_crs, dst_crs)
+    key = coords_fingerprint(x, y, src_crs, dst_crs)
+    cached = _memo_get(key, len(x))
+    if cached is not None:
+        return cached
+    px, py = transform_xy(x, y, src_crs, dst_crs)
+    _memo_put(key, px, py, max_bytes)
+    return px, py
@@ -1,12 +1,18 @@
 # backend/pipeline/run_comparison.py
 """
 Run the comparison pipeline:
-- Read two GeoParquets (Orig, DL)
+- Read x / y / Te_ppm of two GeoParquets (Orig, DL) as arrays
 - Project to EPSG:3577 (AU Albers)
 - Build regular grid (cell size in km)
 - Assign grid_ix/grid_iy/Grid_ID to samples
-- Call comparison (max for v1)
-- Write 3 GeoParquet grids + done flag
+- Call comparison (max, mean, median, p10, p90, iqr, ks or chi2; several
+  methods share one pass)
+- Write one grid table (GRID_SCHEMA: Grid_ID, stats, n_orig, n_dl, GridSpec
+  in the metadata, polygons only with --geometry) + done flag
+  (--sparse: occupied cells only, with ix / iy; --layout split: the legacy
+  3 GeoParquets)
+- With --sweep-km, repeat the gridding/comparison for several cell sizes
+  from one read and write sweep_summary.parquet (delta stats per size)
 
 Usage:
   python -m backend.pipeline.run_comparison \
@@ -14,93 +20,292 @@ Usage:
       --dl   path/or/s3://.../dl.parquet \
       --out  path/or/s3://.../results/ \
       --cell-km 100 \
-      --method max
+      --method max mean \
+      [--sweep-km 5 10 25 50 100]
 """
 
 import argparse
 import os
+from dataclasses import asdict
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+import shapely
 
-from backend.comparisons.max_per_cell import compare
+from backend.comparisons import COMPARISON_METHODS, compare_many
 from backend.pipeline.grid import (
-    DEFAULT_PROJECTED_CRS, ensure_projected,
+    DEFAULT_PROJECTED_CRS, project_points,
     make_grid_spec, make_regular_grid, assign_grid_index
 )
-from backend.pipeline.io_s3 import read_points, write_grid, write_text
+from backend.pipeline.io_s3 import (
+    PointArrays, read_point_arrays, write_grid_table, write_grids, write_table, write_text
+)
+from backend.pipeline.schema import OUTPUT_COLUMNS
 
 
 def _is_s3(path: str) -> bool:
     return path.lower().startswith("s3://")
 
 
-def _join_arrays_to_grid(grid: gpd.GeoDataFrame, arr_orig, arr_dl, arr_cmp, nx: int, ny: int) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame]:
+def _output_columns(method: str, single: bool = True) -> tuple[str, ...]:
+    """Column names for one method; the delta column is suffixed when several methods run."""
+    default = (f"orig_{method}", f"dl_{method}", "delta" if single else f"delta_{method}")
+    return OUTPUT_COLUMNS.get(method, default)
+
+
+def _join_arrays_to_grid(grid: gpd.GeoDataFrame, results: dict, nx: int, ny: int) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame]:
     """
     For each cell (iy, ix), set columns from the corresponding array index.
+    ``results`` maps method -> (arr_orig, arr_dl, arr_cmp, *extra); extra
+    arrays (chi2 p-values) go to the comparison grid.
     Assumes grid has columns 'ix' and 'iy'.
     """
     g = grid.copy()
-    g["orig_max"] = arr_orig[g["iy"], g["ix"]]
-    g["dl_max"]   = arr_dl[g["iy"], g["ix"]]
-    g["delta"]    = arr_cmp[g["iy"], g["ix"]]
+    cols_orig, cols_dl, cols_cmp = [], [], []
+    for method, arrs in results.items():
+        cols = _output_columns(method, single=len(results) == 1)
+        for col, arr in zip(cols, arrs):
+            g[col] = arr[g["iy"], g["ix"]]
+        cols_orig.append(cols[0])
+        cols_dl.append(cols[1])
+        cols_cmp.extend(cols[2:])
 
-    orig_grid = g[["Grid_ID", "orig_max", "geometry"]].copy()
-    dl_grid   = g[["Grid_ID", "dl_max", "geometry"]].copy()
-    comp_grid = g[["Grid_ID", "delta", "geometry"]].copy()
+    # Count columns are shared by chi2 / ks; keep each column once
+    orig_grid = g[["Grid_ID", *dict.fromkeys(cols_orig), "geometry"]].copy()
+    dl_grid   = g[["Grid_ID", *dict.fromkeys(cols_dl), "geometry"]].copy()
+    comp_grid = g[["Grid_ID", *dict.fromkeys(cols_cmp), "geometry"]].copy()
     return orig_grid, dl_grid, comp_grid
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Run comparison pipeline.")
-    parser.add_argument("--orig", required=True, help="Original dataset (GeoParquet)")
-    parser.add_argument("--dl",   required=True, help="DL dataset (GeoParquet)")
-    parser.add_argument("--out",  required=True, help="Output folder (local or s3://)")
-    parser.add_argument("--cell-km", type=int, default=100, help="Grid cell size in km")
-    parser.add_argument("--method", choices=["max"], default="max", help="Comparison method (v1: max)")
-    args = parser.parse_args()
+def _grid_cells(results: dict, orig_idx, dl_idx, spec, occupied_only: bool = False) -> pd.DataFrame:
+    """
+    One row per cell: Grid_ID, n_orig, n_dl and every method's columns.
+    With `occupied_only`, only cells holding at least one sample, plus their
+    ix / iy. No geometry; cells are recovered from the GridSpec stored
+    alongside.
+    """
+    ncell = spec.nx * spec.ny
+    n_orig = np.bincount(orig_idx["Grid_ID"].values, minlength=ncell)
+    n_dl   = np.bincount(dl_idx["Grid_ID"].values, minlength=ncell)
+    gid = np.flatnonzero((n_orig + n_dl) > 0) if occupied_only else np.arange(ncell)
+
+    cells = {"Grid_ID": gid}
+    if occupied_only:
+        cells["iy"], cells["ix"] = np.divmod(gid, spec.nx)
+    cells.update(n_orig=n_orig[gid], n_dl=n_dl[gid])
+    for method, arrs in results.items():
+        for col, arr in zip(_output_columns(method, single=len(results) == 1), arrs):
+            if col not in cells:  # chi2 / ks repeat the count columns
+                cells[col] = arr.ravel()[gid]
+    return pd.DataFrame(cells)
 
-    # 1) Read inputs
-    orig = read_points(args.orig)
-    dl   = read_points(args.dl)
-    req_cols = {"Te_ppm", orig.geometry.name}
-    for name, gdf in [("orig", orig), ("dl", dl)]:
-        if "Te_ppm" not in gdf.columns:
-            raise ValueError(f"{name} is missing 'Te_ppm' column")
-        if gdf.geometry is None:
-            raise ValueError(f"{name} is missing 'geometry' column")
-
-    # 2) Project to meter CRS
-    orig = ensure_projected(orig, DEFAULT_PROJECTED_CRS)
-    dl   = ensure_projected(dl,   DEFAULT_PROJECTED_CRS)
-
-    # 3) Grid spec + grid polygons
-    cell_m = int(args.cell_km) * 1000
-    spec = make_grid_spec(orig, dl, cell_m, str(orig.crs))
-    grid = make_regular_grid(spec)
 
-    # 4) Assign indices to points (vectorised)
+def _cell_polygons_wkb(spec, gid: np.ndarray) -> np.ndarray:
+    """WKB polygons of the cells `gid` (row-major Grid_IDs)."""
+    iy, ix = np.divmod(gid, spec.nx)
+    x0 = spec.minx + ix * spec.cell
+    y0 = spec.miny + iy * spec.cell
+    return shapely.to_wkb(shapely.box(x0, y0, x0 + spec.cell, y0 + spec.cell))
+
+
+def _load_inputs(orig_path: str, dl_path: str, stage) -> tuple[PointArrays, PointArrays]:
+    """Read x / y / Te_ppm of both inputs and project them to the meter CRS."""
+    stage("reading")
+    points = {}
+    for name, path in [("orig", orig_path), ("dl", dl_path)]:
+        try:
+            points[name] = read_point_arrays(path, columns=["Te_ppm"])
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}") from e
+
+    stage("projecting")
+    orig = project_points(points["orig"], DEFAULT_PROJECTED_CRS)
+    dl   = project_points(points["dl"],   DEFAULT_PROJECTED_CRS)
+    return orig, dl
+
+
+def _compare_at(orig: PointArrays, dl: PointArrays, cell_km: int, methods, stage):
+    """Grid both datasets at `cell_km` and run the methods -> (spec, orig_idx, dl_idx, results)."""
+    stage("gridding")
+    cell_m = int(cell_km) * 1000
+    spec = make_grid_spec(orig, dl, cell_m, orig.crs)
     orig_idx = assign_grid_index(orig, spec)
     dl_idx   = assign_grid_index(dl,   spec)
 
-    # 5) Compare (Anthony’s algorithm wrapped via our API)
-    arr_orig, arr_dl, arr_cmp = compare(orig_idx, dl_idx, nx=spec.nx, ny=spec.ny, method=args.method)
+    # Anthony’s algorithm wrapped via our API
+    stage("comparing")
+    results = compare_many(orig_idx, dl_idx, nx=spec.nx, ny=spec.ny, methods=methods)
+    return spec, orig_idx, dl_idx, results
+
+
+def _write_outputs(outdir: str, spec, orig_idx, dl_idx, results: dict, sparse: bool,
+                   suffix: str = "", layout: str = "table", geometry: bool = False,
+                   compression: str = "zstd", row_group_size: int | None = None) -> tuple[dict, str]:
+    """
+    Write one comparison's grids as `<name><suffix>.parquet`
+    -> (output paths, short description for the job message).
+
+    layout="table": one GRID_SCHEMA table (grid.parquet, or
+    grid_sparse.parquet with `sparse`: occupied cells only, with ix / iy)
+    holding every stat and count column;
+    layout="split": the legacy orig/dl/comp GeoParquets with polygons.
+    """
+    if layout == "table":
+        # Occupied cells only with `sparse`; size then scales with data, not extent
+        cells = _grid_cells(results, orig_idx, dl_idx, spec, occupied_only=sparse)
+        name = "sparse_grid" if sparse else "grid"
+        path = f"{outdir}/{'grid_sparse' if sparse else 'grid'}{suffix}.parquet"
+        wkb = _cell_polygons_wkb(spec, cells["Grid_ID"].to_numpy()) if geometry else None
+        write_grid_table(path, cells, asdict(spec), geometry=wkb,
+                         compression=compression, row_group_size=row_group_size)
+        written = f"{len(cells)} occupied cells" if sparse else f"1 grid table ({len(cells)} cells)"
+        return {f"{name}{suffix}": path}, written
+    if layout != "split":
+        raise ValueError(f"Unknown output layout '{layout}'")
+    if sparse:
+        raise ValueError("sparse output needs layout 'table'; the split layout always writes every cell")
 
-    # 6) Join arrays back to polygons
-    orig_grid, dl_grid, comp_grid = _join_arrays_to_grid(grid, arr_orig, arr_dl, arr_cmp, spec.nx, spec.ny)
+    # Join arrays back to grid polygons
+    grid = make_regular_grid(spec)
+    grids = dict(zip(("orig_grid", "dl_grid", "comp_grid"),
+                     _join_arrays_to_grid(grid, results, spec.nx, spec.ny)))
+    outputs = {f"{name}{suffix}": f"{outdir}/{name}{suffix}.parquet" for name in grids}
+    write_grids(dict(zip(outputs.values(), grids.values())))
+    return outputs, "3 grids"
 
-    # 7) Write outputs
-    outdir = args.out.rstrip("/")
+
+def _delta_summary(cell_km: int, results: dict, orig_idx, dl_idx, spec) -> list[dict]:
+    """
+    One row per method: statistics of the comparison column over the cells
+    where both datasets have samples.
+    """
+    ncell = spec.nx * spec.ny
+    n_orig = np.bincount(orig_idx["Grid_ID"].values, minlength=ncell)
+    n_dl   = np.bincount(dl_idx["Grid_ID"].values, minlength=ncell)
+    both = (n_orig > 0) & (n_dl > 0)
+    rows = []
+    for method, arrs in results.items():
+        delta = arrs[2].ravel()[both]
+        delta = delta[np.isfinite(delta)]
+        row = {
+            "cell_km": int(cell_km), "method": method,
+            "nx": spec.nx, "ny": spec.ny,
+            "n_orig_cells": int((n_orig > 0).sum()), "n_dl_cells": int((n_dl > 0).sum()),
+            "n_cells": len(delta),
+        }
+        for name, fn in (("mean", np.mean), ("median", np.median), ("std", np.std),
+                         ("abs_mean", lambda d: np.abs(d).mean()), ("min", np.min), ("max", np.max)):
+            row[f"delta_{name}"] = float(fn(delta)) if len(delta) else np.nan
+        rows.append(row)
+    return rows
+
+
+def run_sweep(orig_path: str, dl_path: str, out: str, cell_kms=(5, 10, 25, 50, 100),
+              methods=("max",), sparse: bool = False, on_stage=None, **write_opts) -> dict:
+    """
+    Run the comparison at several cell sizes from one read and projection.
+    Points are sorted by Te_ppm once, so every size's (cell, value) sort
+    skips its value argsort. Writes each size's grids suffixed `_<km>km`
+    plus sweep_summary.parquet (delta statistics per cell size and method).
+    """
+    stage = on_stage or (lambda name: None)
+    cell_kms = sorted(dict.fromkeys(int(k) for k in cell_kms))
+    if not cell_kms or min(cell_kms) <= 0:
+        raise ValueError("Sweep cell sizes must be positive")
+    methods = list(dict.fromkeys(methods))
+
+    orig, dl = _load_inputs(orig_path, dl_path, stage)
+    orig = orig.take(np.argsort(orig.columns["Te_ppm"], kind="stable"))
+    dl   = dl.take(np.argsort(dl.columns["Te_ppm"], kind="stable"))
+
+    outdir = out.rstrip("/")
     if not _is_s3(outdir):
         os.makedirs(outdir, exist_ok=True)
 
-    write_grid(f"{outdir}/orig_grid.parquet", orig_grid)
-    write_grid(f"{outdir}/dl_grid.parquet",   dl_grid)
-    write_grid(f"{outdir}/comp_grid.parquet", comp_grid)
-    write_text(f"{outdir}/done.flag", "done")
+    outputs, summary = {}, []
+    for cell_km in cell_kms:
+        spec, orig_idx, dl_idx, results = _compare_at(orig, dl, cell_km, methods, stage)
+        stage("writing")
+        written, _ = _write_outputs(outdir, spec, orig_idx, dl_idx, results, sparse,
+                                    suffix=f"_{cell_km}km", **write_opts)
+        outputs.update(written)
+        summary.extend(_delta_summary(cell_km, results, orig_idx, dl_idx, spec))
+
+    outputs["sweep_summary"] = f"{outdir}/sweep_summary.parquet"
+    write_table(outputs["sweep_summary"], pd.DataFrame(summary))
+    outputs["flag"] = f"{outdir}/done.flag"
+    write_text(outputs["flag"], "done")
+    sizes = ", ".join(str(k) for k in cell_kms)
+    return {
+        "message": f"Finished: swept {len(cell_kms)} cell sizes ({sizes} km) + summary to {outdir}",
+        "outputs": outputs,
+    }
 
-    print(f"✅ Finished: wrote 3 grids + done.flag to {outdir}")
+
+def run_pipeline(orig_path: str, dl_path: str, out: str, cell_km: int = 100,
+                 methods=("max",), sparse: bool = False, sweep_km=None, on_stage=None,
+                 **write_opts) -> dict:
+    """
+    Run the full pipeline in-process and return {"message", "outputs"}.
+    Used by the CLI below and by the Flask worker pool (backend/workers.py).
+    With `sweep_km` (a list of cell sizes) runs run_sweep instead.
+    ``on_stage(name)`` is called as each stage starts. ``write_opts``
+    (layout, geometry, compression, row_group_size) go to _write_outputs.
+    """
+    if sweep_km:
+        return run_sweep(orig_path, dl_path, out, sweep_km, methods=methods, sparse=sparse,
+                         on_stage=on_stage, **write_opts)
+    stage = on_stage or (lambda name: None)
+
+    # 1-2) Read inputs and project to meter CRS
+    orig, dl = _load_inputs(orig_path, dl_path, stage)
+
+    # 3-5) Grid spec, point indices (vectorised) and comparison
+    methods = list(dict.fromkeys(methods))
+    spec, orig_idx, dl_idx, results = _compare_at(orig, dl, cell_km, methods, stage)
+
+    stage("writing")
+    outdir = out.rstrip("/")
+    if not _is_s3(outdir):
+        os.makedirs(outdir, exist_ok=True)
+
+    # 6-7) Join arrays back to grid polygons (or sparse cells) and write outputs
+    outputs, written = _write_outputs(outdir, spec, orig_idx, dl_idx, results, sparse, **write_opts)
+    outputs["flag"] = f"{outdir}/done.flag"
+    write_text(outputs["flag"], "done")
+    return {"message": f"Finished: wrote {written} + done.flag to {outdir}", "outputs": outputs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run comparison pipeline.")
+    parser.add_argument("--orig", required=True, help="Original dataset (GeoParquet)")
+    parser.add_argument("--dl",   required=True, help="DL dataset (GeoParquet)")
+    parser.add_argument("--out",  required=True, help="Output folder (local or s3://)")
+    parser.add_argument("--cell-km", type=int, default=100, help="Grid cell size in km")
+    parser.add_argument("--method", nargs="+", choices=sorted(COMPARISON_METHODS), default=["max"],
+                        help="Comparison method(s); several are computed from one pass over the points")
+    parser.add_argument("--sparse", action="store_true",
+                        help="Write only occupied cells to grid_sparse.parquet")
+    parser.add_argument("--layout", choices=["table", "split"], default="table",
+                        help="table: one grid.parquet with every stat and count column (default); "
+                             "split: legacy orig/dl/comp GeoParquets")
+    parser.add_argument("--geometry", action="store_true",
+                        help="Add WKB cell polygons to the grid table (GeoParquet)")
+    parser.add_argument("--compression", default="zstd", help="Parquet codec of the grid table")
+    parser.add_argument("--row-group-size", type=int, default=None, help="Rows per Parquet row group")
+    parser.add_argument("--sweep-km", type=int, nargs="+", metavar="KM",
+                        help="Run at each of these cell sizes (km) from one read; overrides --cell-km "
+                             "and adds sweep_summary.parquet")
+    args = parser.parse_args()
+    if args.sparse and args.layout == "split":
+        parser.error("--sparse needs --layout table; the split layout always writes every cell")
+
+    result = run_pipeline(args.orig, args.dl, args.out, cell_km=args.cell_km,
+                          methods=args.method, sparse=args.sparse, sweep_km=args.sweep_km,
+                          layout=args.layout, geometry=args.geometry,
+                          compression=args.compression, row_group_size=args.row_group_size)
+    print(f"✅ {result['message']}")
 
 
 if __name__ == "__main__":
     main()
-
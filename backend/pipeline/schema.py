@@ -2,6 +2,8 @@
 Defines standard schemas for points and grids.
 """
 
+import pyarrow as pa
+
 POINT_SCHEMA = {
     "columns": ["Te_ppm", "geometry", "Grid_ID"],
     "crs": "EPSG:XXXX"  # TODO: replace with chosen projected CRS
@@ -9,5 +11,41 @@ POINT_SCHEMA = {
 
 GRID_SCHEMA = {
     "columns": ["Grid_ID", "orig_max", "dl_max", "delta", "n_orig", "n_dl", "geometry"],
-    "crs": "EPSG:XXXX"
+    "crs": "EPSG:3577"
+}
+
+# Output column names of methods not named orig_<method> / dl_<method> /
+# delta[_<method>]: (orig, dl, comparison, *extra arrays)
+OUTPUT_COLUMNS = {
+    "chi2": ("n_orig", "n_dl", "chi2", "chi2_pval"),
+    "ks": ("n_orig", "n_dl", "ks"),
 }
+
+# Arrow types of the fixed grid columns. Every other column is a float64
+# statistic (orig_<method>, dl_<method>, delta[_<method>], chi2, chi2_pval, ks).
+GRID_ID_COLUMN = "Grid_ID"
+GRID_COUNT_COLUMNS = ("n_orig", "n_dl")
+# Cell indices, only in sparse tables (Grid_ID = iy * nx + ix)
+GRID_INDEX_COLUMNS = ("ix", "iy")
+GRID_GEOMETRY_COLUMN = "geometry"
+
+
+def grid_id_type(ncell: int) -> pa.DataType:
+    """Arrow type of Grid_ID: int32, or int64 for grids of 2**31 cells or more (as grid_index_xy)."""
+    return pa.int32() if ncell < 2**31 else pa.int64()
+
+
+def grid_arrow_schema(stat_columns, ncell: int, geometry: bool = False) -> pa.Schema:
+    """
+    Schema of one result grid table of `ncell` (nx * ny) cells, in
+    GRID_SCHEMA order: Grid_ID, ix / iy (when among `stat_columns`), the
+    stat columns, n_orig, n_dl and (optionally) WKB cell polygons.
+    """
+    fixed = (GRID_ID_COLUMN, *GRID_INDEX_COLUMNS, *GRID_COUNT_COLUMNS, GRID_GEOMETRY_COLUMN)
+    fields = [pa.field(GRID_ID_COLUMN, grid_id_type(ncell), nullable=False)]
+    fields += [pa.field(c, pa.int32(), nullable=False) for c in GRID_INDEX_COLUMNS if c in stat_columns]
+    fields += [pa.field(c, pa.float64()) for c in stat_columns if c not in fixed]
+    fields += [pa.field(c, pa.int32(), nullable=False) for c in GRID_COUNT_COLUMNS]
+    if geometry:
+        fields.append(pa.field(GRID_GEOMETRY_COLUMN, pa.binary()))
+    return pa.schema(fields)
@@ -0,0 +1,134 @@
+# backend/result_cache.py
+"""
+Content-addressed cache of comparison results.
+
+A result is keyed by a fingerprint of both input files' bytes plus the
+pipeline parameters, so re-running the same orig/DL pair with the same
+cell size and methods returns the stored grids instead of recomputing.
+Entries are folders `<root>/<key>/` holding the output files; the cache is
+size-bounded and evicts least-recently-used entries (by folder mtime).
+
+Configuration (environment):
+- RESULT_CACHE_MAX_MB: total size of cached results (default: 2048)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from backend.pipeline.config import env_int
+
+DEFAULT_MAX_MB = 2048
+_CHUNK = 1024 * 1024
+
+
+def fingerprint(paths, params: dict) -> str:
+    """blake2b of every input file's bytes (in order) plus the sorted params."""
+    h = hashlib.blake2b(digest_size=20)
+    for p in paths:
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b""):
+                h.update(chunk)
+        h.update(b"\0")
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ResultCache:
+    def __init__(self, root: Path, max_bytes: int | None = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes if max_bytes is not None else env_int("RESULT_CACHE_MAX_MB", DEFAULT_MAX_MB) * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Path | None:
+        """Entry folder for `key` (marking it recently used), or None."""
+        entry = self.root / key
+        with self._lock:
+            if (entry / "outputs.json").exists():
+                self.hits += 1
+                os.utime(entry)
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, key: str, outputs: dict) -> dict:
+        """
+        Store finished output files under `key`; returns the outputs re-pointed
+        at the cache entry. Files are hard-linked when possible.
+        """
+        entry = self.root / key
+        tmp = self.root / f".{key}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        files = {}
+        for name, path in outputs.items():
+            src = Path(path)
+            _link_or_copy(src, tmp / src.name)
+            files[name] = src.name
+        (tmp / "outputs.json").write_text(json.dumps(files))
+        with self._lock:
+            if entry.exists():
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                tmp.rename(entry)
+            self._evict()
+        return self.outputs(key)
+
+    def outputs(self, key: str) -> dict:
+        """Output paths of a cached entry, keyed like the pipeline's outputs."""
+        entry = self.root / key
+        files = json.loads((entry / "outputs.json").read_text())
+        return {name: (entry / fname).as_posix() for name, fname in files.items()}
+
+    def restore(self, key: str, dest: Path) -> dict:
+        """Link a cached entry's files into `dest` (e.g. a job folder); returns their paths."""
+        dest = Path(dest)
+        dest.mkdir(parents=True, exist_ok=True)
+        restored = {}
+        for name, path in self.outputs(key).items():
+            src = Path(path)
+            if not (dest / src.name).exists():
+                _link_or_copy(src, dest / src.name)
+            restored[name] = (dest / src.name).as_posix()
+        return restored
+
+    def _evict(self) -> None:
+        entries = [p for p in self.root.iterdir() if p.is_dir() and not p.name.startswith(".")]
+        sizes = {p: _dir_size(p) for p in entries}
+        total = sum(sizes.values())
+        for p in sorted(entries, key=lambda p: p.stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(p, ignore_errors=True)
+            total -= sizes[p]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = [p for p in self.root.iterdir() if p.is_dir() and not p.name.startswith(".")]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(_dir_size(p) for p in entries),
+                "max_bytes": self.max_bytes,
+            }
@@ -18,3 +18,113 @@ def test_compare_max_per_cell_basic():
     arr_o, arr_d, arr_c = compare(orig_idx, dl_idx, nx=spec.nx, ny=spec.ny, method="max")
     # The cell containing the points should have dl max (30) - orig max (15) = 15
     assert (arr_c.max() - 15) < 1e-9
+
+
+def test_chi2_matches_per_cell_histograms():
+    # Vectorised chi2 must agree with a plain per-cell np.histogram loop
+    import numpy as np
+    import pandas as pd
+    from backend.comparisons.chi2 import chi2_per_cell
+
+    rng = np.random.default_rng(0)
+    nx, ny, bins = 4, 3, 10
+
+    def frame(n):
+        return pd.DataFrame({
+            "grid_ix": rng.integers(0, nx, n),
+            "grid_iy": rng.integers(0, ny - 1, n),  # top row stays empty
+            "Te_ppm": rng.lognormal(0, 1, n),
+        })
+
+    orig, dl = frame(300), frame(200)
+    n_o, n_d, stat, pval = chi2_per_cell(dl, orig, nx, ny, bins=bins)
+
+    for iy in range(ny):
+        for ix in range(nx):
+            o = orig[(orig.grid_ix == ix) & (orig.grid_iy == iy)]["Te_ppm"].values
+            d = dl[(dl.grid_ix == ix) & (dl.grid_iy == iy)]["Te_ppm"].values
+            assert n_o[iy, ix] == len(o) and n_d[iy, ix] == len(d)
+            if len(o) and len(d):
+                top = max(o.max(), d.max())
+                ho, _ = np.histogram(o, bins=bins, range=(0, top))
+                hd, _ = np.histogram(d, bins=bins, range=(0, top))
+                expected = (((hd + 1e-6) - (ho + 1e-6)) ** 2 / (ho + 1e-6)).sum()
+                assert abs(stat[iy, ix] - expected) <= 1e-6 * max(expected, 1)
+                assert 0 <= pval[iy, ix] <= 1
+            else:
+                assert stat[iy, ix] == 0 and np.isnan(pval[iy, ix])
+
+
+def test_aggregate_pair_matches_pandas_groupby():
+    import numpy as np
+    import pandas as pd
+    from backend.comparisons.aggregate import STATS, aggregate_pair
+
+    rng = np.random.default_rng(1)
+    nx, ny = 5, 4
+    df = pd.DataFrame({
+        "grid_ix": rng.integers(0, nx, 500),
+        "grid_iy": rng.integers(0, ny, 500),
+        "Te_ppm": rng.lognormal(0, 1, 500),
+    })
+    stats = aggregate_pair(df.iloc[:0], df, nx, ny)
+
+    gid = df["grid_iy"] * nx + df["grid_ix"]
+    expected = df.groupby(gid)["Te_ppm"].agg(["count", "min", "max", "sum", "mean", "std", "median"])
+    for name in STATS:
+        got = stats["orig"][name].ravel()[expected.index]
+        assert np.allclose(got, expected[name].values, equal_nan=True), name
+        assert np.isnan(stats["dl"][name]).all() or name == "count"
+
+
+def test_order_stats_quantiles_and_ks():
+    import numpy as np
+    from scipy.stats import ks_2samp
+    from backend.comparisons.order_stats import segment_ks, segment_quantiles, segment_sort
+
+    rng = np.random.default_rng(2)
+    ncell = 6
+    cid_a, cid_b = rng.integers(0, ncell - 1, 400), rng.integers(0, ncell - 1, 300)
+    # Rounded values so the KS statistic has to cope with ties
+    v_a, v_b = np.round(rng.lognormal(0, 1, 400), 1), np.round(rng.lognormal(0.2, 1, 300), 1)
+    seg_a, seg_b = segment_sort(cid_a, v_a, ncell), segment_sort(cid_b, v_b, ncell)
+
+    qs = [0.1, 0.25, 0.5, 0.9]
+    q = segment_quantiles(seg_a, qs)
+    d = segment_ks(seg_a, seg_b)
+    for c in range(ncell - 1):
+        assert np.allclose(q[:, c], np.quantile(v_a[cid_a == c], qs))
+        assert np.isclose(d[c], ks_2samp(v_a[cid_a == c], v_b[cid_b == c]).statistic)
+    assert np.isnan(q[:, ncell - 1]).all() and np.isnan(d[ncell - 1])
+
+
+def test_chi2_pvalues_are_written(tmp_path):
+    import numpy as np
+    import pandas as pd
+    import pyarrow.parquet as pq
+    from backend.comparisons import compare_many
+    from backend.comparisons.chi2 import chi2_per_cell
+    from backend.pipeline.grid import DEFAULT_PROJECTED_CRS, GridSpec
+    from backend.pipeline.run_comparison import _write_outputs
+
+    rng = np.random.default_rng(1)
+    spec = GridSpec(minx=0.0, miny=0.0, cell=1.0, nx=3, ny=2, crs=DEFAULT_PROJECTED_CRS)
+
+    def frame(n):
+        ix, iy = rng.integers(0, 3, n), rng.integers(0, 2, n)
+        return pd.DataFrame({"grid_ix": ix, "grid_iy": iy, "Grid_ID": iy * 3 + ix,
+                             "Te_ppm": rng.lognormal(0, 1, n)})
+
+    orig, dl = frame(200), frame(150)
+    results = compare_many(orig, dl, nx=3, ny=2, methods=["chi2", "max"])
+    pval = chi2_per_cell(dl, orig, 3, 2)[3]
+
+    outputs, _ = _write_outputs(tmp_path.as_posix(), spec, orig, dl, results, sparse=False)
+    grid = pd.read_parquet(outputs["grid"])
+    assert np.allclose(grid["chi2_pval"], pval.ravel(), equal_nan=True)
+    assert str(pq.read_schema(outputs["grid"]).field("chi2_pval").type) == "double"
+
+    outputs, _ = _write_outputs(tmp_path.as_posix(), spec, orig, dl, results, sparse=False, layout="split")
+    comp = pd.read_parquet(outputs["comp_grid"])
+    assert {"chi2", "chi2_pval", "delta_max"} <= set(comp.columns)
+    assert np.allclose(comp["chi2_pval"], pval.ravel(), equal_nan=True)
@@ -1,4 +1,5 @@
 import geopandas as gpd
+import pandas as pd
 from shapely.geometry import Point
 from backend.pipeline.grid import (
     DEFAULT_PROJECTED_CRS, ensure_projected,
@@ -24,3 +25,259 @@ def test_grid_and_index():
     assert 0 <= o_idx["grid_iy"] < spec.ny
     assert 0 <= d_idx["grid_ix"] < spec.nx
     assert 0 <= d_idx["grid_iy"] < spec.ny
+
+
+def test_regular_grid_vectorised_and_cached():
+    from backend.pipeline.grid import GridSpec
+
+    spec = GridSpec(minx=0.0, miny=10.0, cell=5.0, nx=3, ny=2, crs=DEFAULT_PROJECTED_CRS)
+    grid = make_regular_grid(spec)
+
+    assert len(grid) == 6
+    row = grid[grid["Grid_ID"] == 4].iloc[0]          # iy=1, ix=1
+    assert (row["ix"], row["iy"]) == (1, 1)
+    assert row.geometry.bounds == (5.0, 15.0, 10.0, 20.0)
+
+    # Same spec -> cached grid, but each caller gets its own copy
+    grid["extra"] = 1
+    again = make_regular_grid(spec)
+    assert "extra" not in again.columns
+    assert again.geometry.equals(grid.geometry)
+
+
+def test_sparse_cells_only_occupied(tmp_path):
+    import numpy as np
+    import pandas as pd
+    from backend.pipeline.grid import GridSpec
+    import pyarrow.parquet as pq
+    from backend.pipeline.io_s3 import read_grid_spec, write_grid_table
+    from backend.pipeline.run_comparison import _grid_cells
+    from dataclasses import asdict
+
+    spec = GridSpec(minx=0.0, miny=0.0, cell=1.0, nx=4, ny=3, crs=DEFAULT_PROJECTED_CRS)
+    orig_idx = pd.DataFrame({"Grid_ID": [0, 0, 5]})
+    dl_idx = pd.DataFrame({"Grid_ID": [5, 11]})
+    arr = np.arange(12, dtype=float).reshape(3, 4)
+    cells = _grid_cells({"max": (arr, arr, arr)}, orig_idx, dl_idx, spec, occupied_only=True)
+
+    assert cells["Grid_ID"].tolist() == [0, 5, 11]
+    assert cells["ix"].tolist() == [0, 1, 3] and cells["iy"].tolist() == [0, 1, 2]
+    assert cells["n_orig"].tolist() == [2, 1, 0] and cells["n_dl"].tolist() == [0, 1, 1]
+    assert cells["orig_max"].tolist() == [0.0, 5.0, 11.0]
+
+    path = (tmp_path / "grid_sparse.parquet").as_posix()
+    write_grid_table(path, cells, asdict(spec))
+    assert read_grid_spec(path)["nx"] == 4
+    schema = pq.read_schema(path)
+    assert schema.names[:3] == ["Grid_ID", "ix", "iy"] and str(schema.field("ix").type) == "int32"
+
+
+def test_sweep_matches_single_runs(tmp_path):
+    import numpy as np
+    import pandas as pd
+    from backend.pipeline.run_comparison import run_pipeline, run_sweep
+
+    rng = np.random.default_rng(2)
+
+    def points(n):
+        return gpd.GeoDataFrame(
+            {"Te_ppm": rng.lognormal(0, 1, n)},
+            geometry=gpd.points_from_xy(rng.uniform(115, 118, n), rng.uniform(-32, -30, n)),
+            crs=4326,
+        )
+
+    orig, dl = tmp_path / "orig.parquet", tmp_path / "dl.parquet"
+    points(400).to_parquet(orig)
+    points(300).to_parquet(dl)
+
+    swept = run_sweep(orig.as_posix(), dl.as_posix(), (tmp_path / "sweep").as_posix(),
+                      cell_kms=[100, 50], methods=["max", "p90"])
+    summary = pd.read_parquet(swept["outputs"]["sweep_summary"])
+    assert summary["cell_km"].tolist() == [50, 50, 100, 100]
+    assert set(summary["method"]) == {"max", "p90"}
+
+    single = run_pipeline(orig.as_posix(), dl.as_posix(), (tmp_path / "single").as_posix(),
+                          cell_km=50, methods=["max", "p90"])
+    a = pd.read_parquet(single["outputs"]["grid"])
+    b = pd.read_parquet(swept["outputs"]["grid_50km"])
+    assert np.allclose(a["delta_max"], b["delta_max"]) and np.allclose(a["delta_p90"], b["delta_p90"])
+
+
+def test_projection_matches_to_crs_and_is_memoized(tmp_path, monkeypatch):
+    import numpy as np
+    from backend.pipeline import projection
+
+    monkeypatch.setenv("PROJECTION_CACHE_DIR", (tmp_path / "proj").as_posix())
+    monkeypatch.setattr(projection, "PROJECTION_CHUNK", 64)   # force the chunked, threaded path
+    rng = np.random.default_rng(3)
+    pts = gpd.GeoDataFrame(
+        {"Te_ppm": np.ones(500)},
+        geometry=gpd.points_from_xy(rng.uniform(115, 118, 500), rng.uniform(-32, -30, 500)),
+        crs=4326,
+    )
+
+    expected = pts.to_crs(DEFAULT_PROJECTED_CRS)
+    got = ensure_projected(pts)
+    assert str(got.crs) == DEFAULT_PROJECTED_CRS
+    assert np.allclose(got.geometry.x, expected.geometry.x) and np.allclose(got.geometry.y, expected.geometry.y)
+    assert len(list((tmp_path / "proj").glob("*.npy"))) == 1
+
+    assert projection.get_transformer("EPSG:4326", DEFAULT_PROJECTED_CRS) is \
+        projection.get_transformer("EPSG:4326", DEFAULT_PROJECTED_CRS)
+    # Second call is answered from the memo
+    monkeypatch.setattr(projection, "transform_xy", None)
+    again = ensure_projected(pts)
+    assert np.array_equal(again.geometry.x, got.geometry.x)
+
+
+def test_grid_index_is_compact_and_copy_free():
+    import numpy as np
+    from backend.pipeline.grid import GridSpec, compact_values, grid_index_xy
+
+    spec = GridSpec(minx=0.0, miny=0.0, cell=10.0, nx=4, ny=3, crs=DEFAULT_PROJECTED_CRS)
+    gx, gy, gid = grid_index_xy(np.array([-5.0, 0.0, 15.0, 40.0]), np.array([0.0, 29.9, 12.0, 99.0]), spec)
+    assert gx.dtype == gy.dtype == gid.dtype == np.int32
+    assert gx.tolist() == [0, 0, 1, 3] and gy.tolist() == [0, 2, 1, 2]
+    assert gid.tolist() == [0, 8, 5, 11]
+
+    pts = gpd.GeoDataFrame({"Te_ppm": [1.5, 2.25], "other": ["a", "b"]},
+                           geometry=gpd.points_from_xy([1.0, 35.0], [1.0, 25.0]), crs=DEFAULT_PROJECTED_CRS)
+    idx = assign_grid_index(pts, spec)
+    assert list(idx.columns) == ["grid_ix", "grid_iy", "Grid_ID", "Te_ppm"]
+    assert idx["Te_ppm"].dtype == np.float32 and idx["Grid_ID"].tolist() == [0, 11]
+    assert compact_values(np.array([1e-300])).dtype == np.float64   # below float32 range
+
+
+def test_read_point_arrays_matches_geopandas(tmp_path):
+    import numpy as np
+    from backend.pipeline.io_s3 import read_point_arrays
+
+    rng = np.random.default_rng(4)
+    x = np.sort(rng.uniform(115, 118, 1000))
+    pts = gpd.GeoDataFrame(
+        {"Te_ppm": rng.lognormal(0, 1, 1000), "unused": np.arange(1000)},
+        geometry=gpd.points_from_xy(x, rng.uniform(-32, -30, 1000)),
+        crs=4326,
+    )
+    path = tmp_path / "pts.parquet"
+    pts.to_parquet(path, row_group_size=100, write_covering_bbox=True)
+
+    arrays = read_point_arrays(path.as_posix())
+    assert arrays.crs == "EPSG:4326" and list(arrays.columns) == ["Te_ppm"]
+    assert np.array_equal(arrays.x, pts.geometry.x) and np.array_equal(arrays.y, pts.geometry.y)
+    assert np.array_equal(arrays.columns["Te_ppm"], pts["Te_ppm"])
+
+    bbox = (116.0, -32.0, 116.5, -30.0)
+    inside = pts.cx[116.0:116.5, -32.0:-30.0]
+    clipped = read_point_arrays(path.as_posix(), bbox=bbox)
+    assert np.array_equal(clipped.x, inside.geometry.x)
+
+
+def test_grid_table_enforces_schema_and_stores_spec(tmp_path):
+    import numpy as np
+    import pyarrow.parquet as pq
+    import pytest
+    from backend.pipeline.grid import GridSpec
+    from backend.pipeline.io_s3 import read_grid_table
+    from backend.pipeline.run_comparison import _write_outputs
+    from backend.pipeline.schema import GRID_SCHEMA, grid_arrow_schema
+
+    spec = GridSpec(minx=0.0, miny=0.0, cell=10.0, nx=3, ny=2, crs=DEFAULT_PROJECTED_CRS)
+    orig_idx = pd.DataFrame({"Grid_ID": [0, 0, 4]})
+    dl_idx = pd.DataFrame({"Grid_ID": [4, 5]})
+    arr = np.arange(6, dtype=float).reshape(2, 3)
+    outputs, _ = _write_outputs(tmp_path.as_posix(), spec, orig_idx, dl_idx, {"max": (arr, arr, arr)},
+                                sparse=False, geometry=True, row_group_size=4)
+
+    path = outputs["grid"]
+    schema = pq.read_schema(path)
+    assert schema.names == GRID_SCHEMA["columns"]
+    assert str(schema.field("Grid_ID").type) == "int32" and str(schema.field("n_dl").type) == "int32"
+    assert pq.ParquetFile(path).metadata.num_row_groups == 2
+
+    counts, stored = read_grid_table(path, columns=["Grid_ID", "n_orig"])
+    assert list(counts.columns) == ["Grid_ID", "n_orig"] and counts["n_orig"].tolist() == [2, 0, 0, 0, 1, 0]
+    assert stored["nx"] == 3
+    cells = gpd.read_parquet(path)
+    assert cells.geometry.iloc[5].bounds == (20.0, 10.0, 30.0, 20.0)
+
+    # Grid_ID widens like grid_index_xy's ids on grids of 2**31 cells or more
+    assert str(grid_arrow_schema(["delta"], 2**31 - 1).field("Grid_ID").type) == "int32"
+    assert str(grid_arrow_schema(["delta"], 2**31).field("Grid_ID").type) == "int64"
+    with pytest.raises(ValueError, match="layout 'table'"):
+        _write_outputs(tmp_path.as_posix(), spec, orig_idx, dl_idx, {"max": (arr, arr, arr)},
+                       sparse=True, layout="split")
+
+
+def test_grid_export_streams_arithmetic_centroids(tmp_path):
+    import io
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    from backend.export import find_grid_file, iter_grid_export
+    from backend.pipeline.grid import GridSpec
+    from backend.pipeline.run_comparison import _write_outputs
+
+    spec = GridSpec(minx=100.0, miny=50.0, cell=10.0, nx=3, ny=2, crs=DEFAULT_PROJECTED_CRS)
+    idx = pd.DataFrame({"Grid_ID": [0, 4, 5]})
+    arr = np.arange(6, dtype=float).reshape(2, 3)
+    results = {"max": (arr, arr, arr)}
+    _write_outputs(tmp_path.as_posix(), spec, idx, idx, results, sparse=False)
+    (tmp_path / "legacy").mkdir()
+    _write_outputs((tmp_path / "legacy").as_posix(), spec, idx, idx, results, sparse=False, layout="split")
+
+    path = find_grid_file(tmp_path)
+    assert path.name == "grid.parquet"
+    csv = pacsv.read_csv(io.BytesIO(b"".join(iter_grid_export(path, "csv", batch_rows=4))))
+    assert csv["centroid_x"].to_pylist() == [105.0, 115.0, 125.0] * 2
+    assert csv["centroid_y"].to_pylist() == [55.0] * 3 + [65.0] * 3
+    assert csv["cell_id"].to_pylist() == list(range(6))
+
+    arrow = pa.ipc.open_stream(b"".join(iter_grid_export(path, "arrow", batch_rows=4))).read_all()
+    assert arrow.num_rows == 6 and "geometry" not in arrow.column_names
+
+    # Legacy comp_grid.parquet: centres from the WKB cell boxes
+    legacy = find_grid_file(tmp_path / "legacy")
+    assert legacy.name == "comp_grid.parquet"
+    old = pa.ipc.open_stream(b"".join(iter_grid_export(legacy, "arrow"))).read_all()
+    assert old["centroid_x"].to_pylist() == csv["centroid_x"].to_pylist()
+    assert old["centroid_y"].to_pylist() == csv["centroid_y"].to_pylist()
+
+
+def test_pipeline_output_exports_end_to_end(tmp_path):
+    import io
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from backend.export import find_grid_file, iter_grid_export
+    from backend.pipeline.io_s3 import read_grid_table
+    from backend.pipeline.run_comparison import run_pipeline
+
+    rng = np.random.default_rng(5)
+    paths = []
+    for name, n in (("orig", 400), ("dl", 300)):
+        path = tmp_path / f"{name}.parquet"
+        gpd.GeoDataFrame(
+            {"Te_ppm": rng.lognormal(0, 1, n)},
+            geometry=gpd.points_from_xy(rng.uniform(115, 118, n), rng.uniform(-32, -30, n)),
+            crs=4326,
+        ).to_parquet(path)
+        paths.append(path.as_posix())
+
+    for sparse in (False, True):
+        out = tmp_path / f"out_{sparse}"
+        result = run_pipeline(*paths, out.as_posix(), cell_km=50, methods=["max", "chi2"], sparse=sparse)
+        path = find_grid_file(out)
+        assert path.as_posix() == result["outputs"]["sparse_grid" if sparse else "grid"]
+
+        cells, spec = read_grid_table(path.as_posix())
+        iy, ix = np.divmod(cells["Grid_ID"].to_numpy(), spec["nx"])
+        exported = pq.read_table(io.BytesIO(b"".join(iter_grid_export(path, "parquet", batch_rows=7))))
+        assert exported.num_rows == len(cells)
+        assert np.allclose(exported["centroid_x"].to_numpy(), spec["minx"] + (ix + 0.5) * spec["cell"])
+        assert np.allclose(exported["centroid_y"].to_numpy(), spec["miny"] + (iy + 0.5) * spec["cell"])
+        assert np.allclose(exported["delta_max"].to_numpy(), cells["delta_max"], equal_nan=True)
+        assert "chi2_pval" in exported.column_names
+
+        arrow = pa.ipc.open_stream(b"".join(iter_grid_export(path, "arrow"))).read_all()
+        assert arrow["Grid_ID"].to_pylist() == cells["Grid_ID"].tolist()
@@ -0,0 +1,115 @@
+from backend.result_cache import ResultCache, fingerprint
+
+
+def test_fingerprint_and_lru_eviction(tmp_path):
+    a = tmp_path / "a.parquet"
+    b = tmp_path / "b.parquet"
+    a.write_bytes(b"x" * 100)
+    b.write_bytes(b"y" * 100)
+    assert fingerprint([a, b], {"cell_km": 10}) == fingerprint([a, b], {"cell_km": 10})
+    assert fingerprint([a, b], {"cell_km": 10}) != fingerprint([b, a], {"cell_km": 10})
+    assert fingerprint([a, b], {"cell_km": 10}) != fingerprint([a, b], {"cell_km": 20})
+
+    cache = ResultCache(tmp_path / "cache", max_bytes=300)
+    assert cache.get("k1") is None
+    cache.put("k1", {"orig_grid": a.as_posix()})
+    cache.put("k2", {"orig_grid": b.as_posix()})
+    assert cache.get("k1") is not None           # k1 becomes most recently used
+    cache.put("k3", {"orig_grid": a.as_posix()})  # over budget -> evict LRU (k2)
+
+    assert cache.get("k2") is None
+    assert cache.get("k3") is not None
+    restored = cache.restore("k3", tmp_path / "job")
+    assert (tmp_path / "job" / "a.parquet").read_bytes() == a.read_bytes()
+    assert restored["orig_grid"].endswith("job/a.parquet")
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["hits"] == 2 and stats["misses"] == 2
+
+
+def test_scheduler_drops_finished_jobs_and_staged_inputs(tmp_path):
+    import shutil
+    import numpy as np
+    import geopandas as gpd
+    from backend.jobs import JobScheduler, new_job_id
+    from backend.workers import WorkerPool
+
+    rng = np.random.default_rng(4)
+    source = tmp_path / "source"
+    source.mkdir()
+    for name, n in (("orig", 200), ("dl", 150)):
+        gpd.GeoDataFrame(
+            {"Te_ppm": rng.lognormal(0, 1, n)},
+            geometry=gpd.points_from_xy(rng.uniform(115, 118, n), rng.uniform(-32, -30, n)),
+            crs=4326,
+        ).to_parquet(source / f"{name}.parquet")
+
+    def stage(job_id):
+        staged = tmp_path / "uploads" / f"job_{job_id}"
+        shutil.copytree(source, staged)
+        paths = [staged / "orig.parquet", staged / "dl.parquet"]
+        return staged, {"orig_path": paths[0].as_posix(), "dl_path": paths[1].as_posix(), "cell_km": 100}, \
+            fingerprint(paths, {"cell_km": 100})
+
+    pool = WorkerPool(size=1)
+    try:
+        scheduler = JobScheduler(pool, tmp_path / "results", cache=ResultCache(tmp_path / "cache"))
+        first_id, second_id, third_id = new_job_id(), new_job_id(), new_job_id()
+        staged1, job, key = stage(first_id)
+        first = scheduler.submit(first_id, job, cache_key=key, staged=staged1)
+
+        # Identical job while the first is in flight: shared, its upload removed at once
+        staged2, job, key = stage(second_id)
+        assert scheduler.submit(second_id, job, cache_key=key, staged=staged2) is first
+        assert not staged2.exists()
+
+        assert scheduler.wait(first_id).state == "done"
+        assert not staged1.exists() and not scheduler._jobs
+        assert scheduler.get(first_id).outputs["grid"].endswith("grid.parquet")   # from job.json
+
+        # Answered from the cache: nothing kept in memory or on disk for the inputs
+        staged3, job, key = stage(third_id)
+        assert scheduler.submit(third_id, job, cache_key=key, staged=staged3).cached
+        assert not staged3.exists() and not scheduler._jobs
+    finally:
+        pool.shutdown()
+
+
+def test_scheduler_rollback_and_wait_timeout(tmp_path):
+    from concurrent.futures import Future
+    import pytest
+    from backend.jobs import JobScheduler, new_job_id
+
+    class StubPool:
+        size = 1
+        fail = False
+
+        def __init__(self):
+            self.futures = []
+
+        def submit(self, job, stage_path=None):
+            if self.fail:
+                raise RuntimeError("pool is shut down")
+            self.futures.append(Future())
+            return self.futures[-1]
+
+    pool = StubPool()
+    scheduler = JobScheduler(pool, tmp_path / "results", cache=ResultCache(tmp_path / "cache"))
+    staged = tmp_path / "staged"
+    staged.mkdir()
+
+    # A submit the pool rejects leaves nothing registered behind
+    pool.fail = True
+    job_id = new_job_id()
+    with pytest.raises(RuntimeError):
+        scheduler.submit(job_id, {"cell_km": 10}, cache_key="k", staged=staged)
+    assert not (scheduler._jobs or scheduler._inflight or scheduler._staged or scheduler._done)
+    assert not staged.exists() and scheduler.get(job_id) is None
+
+    pool.fail = False
+    first = scheduler.submit(new_job_id(), {"cell_km": 10}, cache_key="k")
+    assert scheduler.submit(new_job_id(), {"cell_km": 10}, cache_key="k") is first
+    assert scheduler.wait(first.job_id, timeout=0.05).state == "queued"
+
+    pool.futures[0].set_exception(ValueError("boom"))
+    assert scheduler.wait(first.job_id).state == "error"
+    assert not (scheduler._jobs or scheduler._inflight or scheduler._done)
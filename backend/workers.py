@@ -0,0 +1,127 @@
+# backend/workers.py
+"""
+Warm worker pool for the comparison pipeline.
+
+Long-lived worker processes import the pipeline (geopandas, pyproj, shapely)
+once at start-up and then take jobs from the pool's queue, so a request no
+longer pays for a fresh `python -m backend.pipeline.run_comparison`.
+
+Configuration (environment):
+- PIPELINE_WORKERS:        number of worker processes (default: min(4, CPUs))
+- PIPELINE_JOB_MEMORY_MB:  per-job address-space limit in MB (default: 0 = none)
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from backend.pipeline.config import env_int
+
+try:
+    import resource  # POSIX only
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+
+DEFAULT_WORKERS   = max(1, min(4, os.cpu_count() or 1))
+DEFAULT_MEMORY_MB = 0
+
+
+def _warm_up() -> None:
+    """Worker initializer: pay the heavy imports once per process."""
+    import backend.pipeline.run_comparison  # noqa: F401
+
+
+def _noop() -> None:
+    pass
+
+
+def _set_memory_limit(limit_mb: int):
+    """Lower the soft RLIMIT_AS for one job; returns the previous limits."""
+    if resource is None or not limit_mb:
+        return None
+    previous = resource.getrlimit(resource.RLIMIT_AS)
+    soft = limit_mb * 1024 * 1024
+    hard = previous[1]
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+    return previous
+
+
+def _stage_writer(stage_path: str | None):
+    """on_stage callback that records the current stage in a small text file."""
+    if not stage_path:
+        return None
+
+    def on_stage(name: str) -> None:
+        with open(stage_path, "w") as f:
+            f.write(name)
+
+    return on_stage
+
+
+def _run_job(job: dict, memory_mb: int, stage_path: str | None = None) -> dict:
+    """Executed inside a worker: run one pipeline job under its memory limit."""
+    from backend.pipeline.run_comparison import run_pipeline
+
+    previous = _set_memory_limit(memory_mb)
+    try:
+        return run_pipeline(**job, on_stage=_stage_writer(stage_path))
+    except MemoryError:
+        raise MemoryError(f"Comparison exceeded the per-job memory limit ({memory_mb} MB)")
+    finally:
+        if previous is not None:
+            resource.setrlimit(resource.RLIMIT_AS, previous)
+
+
+class WorkerPool:
+    """Fixed-size pool of warm pipeline processes."""
+
+    def __init__(self, size: int | None = None, memory_mb: int | None = None):
+        self.size = size or env_int("PIPELINE_WORKERS", DEFAULT_WORKERS)
+        self.memory_mb = memory_mb if memory_mb is not None else env_int("PIPELINE_JOB_MEMORY_MB", DEFAULT_MEMORY_MB)
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn, not fork: forking the threaded Flask server can copy locks held by
+        # other threads into the child and deadlock it; _warm_up pays the imports
+        executor = ProcessPoolExecutor(max_workers=self.size, initializer=_warm_up,
+                                       mp_context=multiprocessing.get_context("spawn"))
+        # Processes start on demand; start them all now so the first jobs are warm
+        for _ in range(self.size):
+            executor.submit(_noop)
+        return executor
+
+    def submit(self, job: dict, stage_path: str | None = None) -> Future:
+        """
+        Queue a `run_pipeline(**job)` call; returns a Future with its result dict.
+        If `stage_path` is given the worker writes the current stage name there.
+        """
+        with self._lock:
+            try:
+                return self._executor.submit(_run_job, job, self.memory_mb, stage_path)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed by the OS); start a fresh pool
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+                return self._executor.submit(_run_job, job, self.memory_mb, stage_path)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_pool: WorkerPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> WorkerPool:
+    """Process-wide pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool